@@ -7,7 +7,9 @@ catkin_python_setup()
 install(DIRECTORY config/
     DESTINATION "${CATKIN_PACKAGE_SHARE_DESTINATION}/config"
 )
-install(PROGRAMS scripts/console.py
+install(PROGRAMS scripts/benchmark.py
+                 scripts/build_inverse_reachability.py
+                 scripts/console.py
                  scripts/generate_primitives_herb.py
                  scripts/plot_primitives.py
     DESTINATION "${CATKIN_PACKAGE_BIN_DESTINATION}"
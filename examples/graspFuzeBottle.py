@@ -63,6 +63,7 @@ robot_in_table = numpy.array([[0., 1., 0.,  0.],
 base_pose = numpy.dot(table.GetTransform(), robot_in_table)
 base_pose[2,3] = 0
 robot.base.PlanToBasePose(base_pose)
+#robot.base.PlanToReachableBasePose(robot.tsrlibrary(fuze, 'grasp')) # Choose the base pose from the grasp TSR
 #robot.SetTransform(base_pose) # way faster for testing
 
 # Grasp the bottle
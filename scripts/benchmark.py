@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Benchmarks HerbPy's planning stack on a corpus of simulated scenes and writes
+the results as JSON.
+"""
+
+import os
+if os.environ.get('ROS_DISTRO', 'hydro')[0] <= 'f':
+    import roslib
+    roslib.load_manifest('herbpy')
+
+import argparse, herbpy.benchmark, logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='benchmark HerbPy planning in simulation')
+    parser.add_argument('-o', '--output', type=str, default='benchmark.json',
+                        help='output JSON file')
+    parser.add_argument('-n', '--trials', type=int, default=1,
+                        help='number of trials of each task')
+    parser.add_argument('-p', '--planner', action='append', dest='planners',
+                        help='planner in robot.planner_registry to benchmark;'
+                             ' may be repeated; defaults to the planning pipeline')
+    parser.add_argument('--scenes', type=str,
+                        help='scene description; defaults to config/benchmark_scenes.yaml')
+    parser.add_argument('--scene', action='append', dest='scene_names',
+                        help='only run this scene; may be repeated')
+    parser.add_argument('--task', action='append', dest='task_names',
+                        help='only run this task; may be repeated')
+    parser.add_argument('--portfolio', action='store_true',
+                        help='race the planners in the pipeline')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adapt the order of the planners in the pipeline')
+    parser.add_argument('--warm-starts', type=int, default=0, metavar='N',
+                        help='compare N optimizer queries with and without'
+                             ' seeds from an experience library')
+    parser.add_argument('--contact-search', type=int, default=0, metavar='N',
+                        help='compare the push grasp contact search with a'
+                             ' linear search on N poses of each object')
+    parser.add_argument('--ik-cache', type=int, default=0, metavar='N',
+                        help='measure the hit rate of the IK cache on N rounds'
+                             ' of grasp TSR samples')
+    args = parser.parse_args()
+
+    results = herbpy.benchmark.run(output_path=args.output,
+                                   trials=args.trials,
+                                   planners=args.planners,
+                                   scenes_path=args.scenes,
+                                   scene_names=args.scene_names,
+                                   task_names=args.task_names,
+                                   warm_start_queries=args.warm_starts,
+                                   contact_search_trials=args.contact_search,
+                                   ik_cache_rounds=args.ik_cache,
+                                   planner_portfolio=args.portfolio,
+                                   adaptive_planning=args.adaptive)
+
+    for planner_name, planner_results in sorted(results['results'].items()):
+        print planner_name
+        for key, result in sorted(planner_results.items()):
+            print '  {:s}: {:d}/{:d}'.format(key, result['successes'], result['trials'])
+
+    if 'warm_starts' in results:
+        warm_starts = results['warm_starts']
+        for name in [ 'cold', 'warm' ]:
+            result = warm_starts[name]
+            latency = result['latency']
+            print '{:s}: {:d}/{:d}, mean latency {:.3f} s'.format(
+                name, result['successes'], result['queries'],
+                latency['mean'] if latency is not None else float('nan'))
+        if warm_starts['mean_latency_savings'] is not None:
+            print 'mean latency savings: {:.1%}'.format(
+                warm_starts['mean_latency_savings'])
+
+    if 'contact_search' in results:
+        contact_search = results['contact_search']
+        for name in [ 'linear', 'bisection' ]:
+            result = contact_search[name]
+            print '{:s}: mean {:.1f} collision checks, mean lock time {:.2f} ms'.format(
+                name, result['collision_checks']['mean'],
+                1000. * result['lock_time']['mean'])
+        print 'collision check reduction: {:.1%}'.format(
+            contact_search['check_reduction'])
+
+    if 'ik_cache' in results:
+        for name, result in sorted(results['ik_cache'].items()):
+            statistics = result['statistics']
+            print '{:s}: hit rate {:.1%} ({:d} refined), mean latency {:.2f} ms'.format(
+                name, statistics['hit_rate'], statistics['refined_hits'],
+                1000. * result['latency']['mean'])
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""
+Builds the inverse reachability database of each of HERB's arms and saves it
+in the herbpy cache directory, where HerbBase.FindBasePoses loads it from.
+"""
+
+import os
+if os.environ.get('ROS_DISTRO', 'hydro')[0] <= 'f':
+    import roslib
+    roslib.load_manifest('herbpy')
+
+import argparse, herbpy, logging
+from herbpy.inversereachability import InverseReachabilityDatabase, get_database_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='build inverse reachability databases for HERB')
+    parser.add_argument('-n', '--configurations', type=int, default=200000,
+                        help='number of arm configurations to sample')
+    parser.add_argument('--arm', action='append', dest='arms',
+                        choices=['left', 'right'],
+                        help='only build the database of this arm; may be repeated')
+    args = parser.parse_args()
+
+    env, robot = herbpy.initialize(sim=True)
+    arms = args.arms or ['left', 'right']
+
+    for arm in arms:
+        manip = robot.GetManipulator(arm)
+        path = get_database_path(manip)
+        database = InverseReachabilityDatabase.build(
+            manip, num_configurations=args.configurations)
+        database.save(path)
+        print 'Saved {:d} samples for the {:s} arm to {:s}.'.format(
+            len(database), arm, path)
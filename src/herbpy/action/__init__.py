@@ -1 +1 @@
-from grasping import PushGrasp, Grasp
+from grasping import BatchGrasp, PushGrasp, Grasp
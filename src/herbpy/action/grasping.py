@@ -1,13 +1,286 @@
-import logging, openravepy, prpy
+import logging, numpy, openravepy, prpy, sys, threading
 from prpy.action import ActionMethod
 from prpy.planning.base import PlanningError
 from contextlib import contextmanager
+from herbpy.planning.trajectories import (
+    copy_trajectory,
+    get_dof_indices,
+    get_waypoints,
+    is_trajectory_collision_free,
+)
 
 logger = logging.getLogger('herbpy')
 
+def _prune_unreachable(robot, tsrlist):
+    """
+    Remove the TSR chains the robot can not reach before planning
+    @param robot The robot that will plan to the TSR chains
+    @param tsrlist A list of TSRChain objects
+    @return The chains kept by the robot's reachability filter, or
+       tsrlist if the robot does not have one
+    """
+    reachability_filter = getattr(robot, 'reachability_filter', None)
+    if reachability_filter is None:
+        return tsrlist
+    return reachability_filter.filter(robot, tsrlist)
+
+def _render_tsr_list(robot, tsrlist, render):
+    """
+    Draw samples of a TSR list according to the robot's render policy
+    @param robot The robot performing the action
+    @param tsrlist A list of TSRChain objects
+    @param render False to draw nothing
+    @return A context manager that removes the drawings on exit
+    """
+    render_policy = getattr(robot, 'render_policy', None)
+    if render_policy is None:
+        return prpy.viz.RenderTSRList(tsrlist, robot.GetEnv(), render=render)
+    return render_policy.render_tsr_list(tsrlist, robot.GetEnv(), render=render)
+
+def _render_vector(robot, start, direction, length, render):
+    """
+    Draw an arrow according to the robot's render policy
+    @param robot The robot performing the action
+    @param start The start of the arrow
+    @param direction The direction of the arrow
+    @param length The length of the arrow
+    @param render False to draw nothing
+    @return A context manager that removes the drawing on exit
+    """
+    render_policy = getattr(robot, 'render_policy', None)
+    if render_policy is None:
+        return prpy.viz.RenderVector(start, direction, length, robot.GetEnv(),
+                                     render=render)
+    return render_policy.render_vector(start, direction, length,
+                                       robot.GetEnv(), render=render)
+
+def find_contact(env, robot, obj, direction, max_distance, step=0.01,
+                 tolerance=0.001):
+    """
+    Move an object against a direction until it is just out of contact with
+    the robot. The object is first moved back in coarse steps until it
+    touches the robot, then the contact is located by bisection. If the
+    object starts in collision, it is moved forward instead, doubling the
+    step until it is free. The caller must hold the environment lock.
+    @param env The environment containing the robot and the object
+    @param robot The robot the object should touch
+    @param obj The object to move
+    @param direction The direction the object is pushed in
+    @param max_distance The maximum distance to move the object
+    @param step The step used to find a pose in contact; must be smaller
+       than the thinnest part of the robot the object can touch
+    @param tolerance The maximum distance between the returned pose and the
+       contact
+    @return A tuple of the distance the object moved against direction and
+       the number of collision checks
+    @throws ValueError if step or tolerance is not positive
+    """
+    # Neither search terminates unless both are positive.
+    if step <= 0. or tolerance <= 0.:
+        raise ValueError('The step and tolerance must be positive; got step'
+                         ' {:f} and tolerance {:f}.'.format(step, tolerance))
+
+    direction = numpy.array(direction, dtype=float)
+    direction /= numpy.linalg.norm(direction)
+    obj_in_world = obj.GetTransform()
+    num_checks = [ 0 ]
+
+    def move(distance):
+        pose = obj_in_world.copy()
+        pose[:3,3] -= distance*direction
+        obj.SetTransform(pose)
+
+    def in_collision(distance):
+        move(distance)
+        num_checks[0] += 1
+        return env.CheckCollision(robot, obj)
+
+    # Bracket the contact between a free and a colliding distance.
+    if in_collision(0.):
+        free, colliding = None, 0.
+        distance = min(step, max_distance)
+        while True:
+            if not in_collision(-distance):
+                free = -distance
+                break
+            colliding = -distance
+            if distance >= max_distance:
+                break
+            distance = min(2*distance, max_distance)
+
+        if free is None:
+            logger.warn('Object is still in collision after moving it %.3f m'
+                        ' forward.', max_distance)
+            return colliding, num_checks[0]
+    else:
+        free, colliding = 0., None
+        while free < max_distance:
+            distance = min(free + step, max_distance)
+            if in_collision(distance):
+                colliding = distance
+                break
+            free = distance
+
+        if colliding is None:
+            return free, num_checks[0]
+
+    while abs(colliding - free) > tolerance:
+        distance = 0.5*(free + colliding)
+        if in_collision(distance):
+            colliding = distance
+        else:
+            free = distance
+
+    move(free)
+    return free, num_checks[0]
+
+def _move_hand_async(hand, preshape):
+    """
+    Start moving the hand to a preshape on a background thread
+    @param hand The hand to move
+    @param preshape The preshape for the hand
+    @return A function that waits for the hand to stop and raises any
+       exception raised while moving it
+    """
+    errors = []
+
+    def move():
+        try:
+            hand.MoveHand(*preshape)
+        except Exception, e:
+            errors.append(e)
+
+    thread = threading.Thread(target=move, name='MoveHand')
+    thread.daemon = True
+    thread.start()
+
+    def wait():
+        thread.join()
+        if errors:
+            raise errors[0]
+    return wait
+
+def _get_preshape_values(start_values, preshape):
+    """
+    Get the hand's DOF values in a preshape
+    @param start_values The current DOF values of the hand
+    @param preshape The grasp preshape for the hand; None leaves a DOF as is
+    @return An array of DOF values
+    """
+    return numpy.array([ start if value is None else value
+                         for start, value in zip(start_values, preshape) ])
+
+def _is_approach_safe(robot, hand_indices, traj, start_values, preshape_values,
+                      finger_step=0.5):
+    """
+    Check that a trajectory is collision-free while the fingers move to their
+    preshape. The hand and the arm are not synchronized, so the trajectory is
+    checked with the fingers at both ends of their motion and at steps of at
+    most finger_step in between. The check runs in a clone of the
+    environment, so the hand keeps moving in the live environment meanwhile
+    @param robot The robot that executes the trajectory
+    @param hand_indices The DOF indices of the hand
+    @param traj The post-processed trajectory that will be executed
+    @param start_values The DOF values of the hand before it moves
+    @param preshape_values The DOF values of the hand in its preshape
+    @param finger_step The maximum change of any finger DOF between two
+       checked hand configurations, in radians
+    @return True if the trajectory is collision-free with the fingers at
+       each checked point between their start and preshape values
+    """
+    from prpy.clone import Clone, Cloned
+
+    start_values = numpy.array(start_values, dtype=float)
+    num_steps = max(1, int(numpy.ceil(numpy.max(
+        numpy.abs(preshape_values - start_values)) / finger_step)))
+    dof_indices = get_dof_indices(traj)
+
+    with Clone(robot.GetEnv()) as cloned_env:
+        cloned_robot = Cloned(robot, into=cloned_env)
+        cloned_traj = copy_trajectory(traj, cloned_env)
+        for fraction in numpy.linspace(0., 1., num_steps + 1):
+            hand_values = start_values + fraction*(preshape_values - start_values)
+            cloned_robot.SetDOFValues(hand_values, hand_indices)
+            if not is_trajectory_collision_free(cloned_robot, cloned_traj,
+                                                dof_indices):
+                return False
+    return True
+
+def _execute_with_preshape(robot, manip, path, preshape, start_values,
+                           wait_for_hand=None):
+    """
+    Execute a path planned with the hand in its preshape, while the hand
+    moves there if that is safe
+    @param robot The robot performing the grasp
+    @param manip The manipulator that executes the path
+    @param path The path, planned with the hand in its preshape
+    @param preshape The grasp preshape for the hand; None leaves a DOF as is
+    @param start_values The DOF values of the hand before it started moving
+    @param wait_for_hand A function that waits for the hand if it is already
+       moving to its preshape (if None, the hand has not started moving)
+    """
+    hand_indices = manip.hand.GetIndices()
+    preshape_values = _get_preshape_values(start_values, preshape)
+
+    # Post-processing changes the path, so check the trajectory that will
+    # actually be executed.
+    traj = robot.PostProcessPath(path)
+    if _is_approach_safe(robot, hand_indices, traj, start_values,
+                         preshape_values):
+        if wait_for_hand is None:
+            wait_for_hand = _move_hand_async(manip.hand, preshape)
+        robot.ExecuteTrajectory(traj)
+        wait_for_hand()
+        return
+
+    logger.info('Grasp approach collides before the hand reaches its'
+                ' preshape. Waiting for the hand.')
+    if wait_for_hand is None:
+        manip.hand.MoveHand(*preshape)
+    else:
+        wait_for_hand()
+    robot.ExecutePath(path)
+
+def _plan_with_preshape(clone, robot, manip, preshape, tsrlist, planner=None):
+    """
+    Plan to a TSR list in a cloned environment with the hand in its preshape
+    @param clone A prpy Clone of the robot's environment, taken with
+       lock=False before the hand started moving; the planner is called
+       without holding its lock, so a Portfolio can clone it
+    @param robot The robot performing the grasp
+    @param manip The manipulator to plan for
+    @param preshape The grasp preshape for the hand; None leaves a DOF as is
+    @param tsrlist A list of TSRChain objects
+    @param planner The planner to use (if None, the manipulator's default
+       planner is used)
+    @return The path, in the robot's environment
+    """
+    from prpy.clone import Cloned
+
+    with clone as cloned_env:
+        with cloned_env:
+            cloned_robot = Cloned(robot, into=cloned_env)
+            cloned_manip = Cloned(manip, into=cloned_env)
+            hand_indices = cloned_manip.hand.GetIndices()
+
+            start_values = cloned_robot.GetDOFValues(hand_indices)
+            cloned_robot.SetDOFValues(_get_preshape_values(start_values, preshape),
+                                      hand_indices)
+
+            if planner is not None:
+                cloned_robot.SetActiveManipulator(cloned_manip)
+                cloned_robot.SetActiveDOFs(cloned_manip.GetArmIndices())
+
+        if planner is None:
+            path = cloned_manip.PlanToTSR(tsrlist, execute=False)
+        else:
+            path = planner.PlanToTSR(cloned_robot, tsrlist)
+
+        return copy_trajectory(path, robot.GetEnv())
+
 @ActionMethod
 def Grasp(robot, obj, manip=None, preshape=[0., 0., 0., 0.], 
-          tsrlist=None, render=True, **kw_args):
+          tsrlist=None, render=True, concurrent_preshape=False, **kw_args):
     """
     @param robot The robot performing the push grasp
     @param obj The object to push grasp
@@ -17,14 +290,18 @@ def Grasp(robot, obj, manip=None, preshape=[0., 0., 0., 0.],
     @param tsrlist A list of TSRChain objects to use for planning to grasp pose
        (if None, the 'grasp' tsr from tsrlibrary is used)
     @param render Render tsr samples and push direction vectors during planning
+    @param concurrent_preshape Move the hand to the preshape while planning
+       and executing the approach, if that is collision-free
     """
     HerbGrasp(robot, obj,  manip=manip, preshape=preshape, 
-              tsrlist=tsrlist, render=render)
+              tsrlist=tsrlist, render=render,
+              concurrent_preshape=concurrent_preshape)
 
 @ActionMethod
 def PushGrasp(robot, obj, push_distance=0.1, manip=None, 
               preshape=[0., 0., 0., 0.], push_required=True, 
-              tsrlist=None, render=True, **kw_args):
+              tsrlist=None, render=True, contact_tolerance=0.001,
+              concurrent_preshape=False, **kw_args):
     """
     @param robot The robot performing the push grasp
     @param obj The object to push grasp
@@ -38,19 +315,141 @@ def PushGrasp(robot, obj, push_distance=0.1, manip=None,
     @param tsrlist A list of TSRChain objects to use for planning to grasp pose
        (if None, the 'grasp' tsr from tsrlibrary is used)
     @param render Render tsr samples and push direction vectors during planning
+    @param contact_tolerance The accuracy, in meters, of the search for the
+       pose where the object touches the hand
+    @param concurrent_preshape Move the hand to the preshape while planning
+       and executing the approach, if that is collision-free
     """
     if tsrlist is None:
         tsrlist = robot.tsrlibrary(obj, 'push_grasp', push_distance=push_distance)
 
     HerbGrasp(robot, obj, manip=manip, preshape=preshape, 
               push_distance=push_distance,
-              tsrlist=tsrlist, render=render)
+              tsrlist=tsrlist, render=render,
+              contact_tolerance=contact_tolerance,
+              concurrent_preshape=concurrent_preshape)
+
+def _get_grasp_candidates(robot, objs, manips, push_distance):
+    """
+    List every combination of object, manipulator and grasp TSR chain
+    @return A list of (obj, manip, tsrlist) tuples; each tsrlist contains
+       one goal chain and the chains that constrain the motion
+    """
+    candidates = []
+    for obj in objs:
+        for manip in manips:
+            if push_distance is None:
+                tsrlist = robot.tsrlibrary(obj, 'grasp', manip=manip)
+            else:
+                tsrlist = robot.tsrlibrary(obj, 'push_grasp', manip=manip,
+                                           push_distance=push_distance)
+
+            goal_chains = [ chain for chain in tsrlist if chain.sample_goal ]
+            other_chains = [ chain for chain in tsrlist if not chain.sample_goal ]
+            for chain in goal_chains:
+                candidates.append((obj, manip, [ chain ] + other_chains))
+    return candidates
+
+@ActionMethod
+def BatchGrasp(robot, objs, manips=None, push_distance=None,
+               preshape=[0., 0., 0., 0.], num_threads=4, render=True,
+               concurrent_preshape=False, **kw_args):
+    """
+    Grasp whichever of several objects is easiest to reach. Every
+    combination of object, manipulator and grasp TSR chain is planned at the
+    same time, each in its own cloned environment, and the shortest path
+    that was found is executed.
+    @param robot The robot performing the grasp
+    @param objs The objects that may be grasped
+    @param manips The manipulators that may grasp them
+       (if None, both arms are used)
+    @param push_distance The distance to push before grasping
+       (if None, no pushing)
+    @param preshape The grasp preshape for the hand
+    @param num_threads The number of plans to compute at the same time;
+       each thread borrows a pipeline from robot.planner_pool
+    @param render Render tsr samples and push direction vectors during planning
+    @param concurrent_preshape Move the hand to the preshape while planning
+       and executing the approach, if that is collision-free
+    @return A tuple of the grasped object and the manipulator that grasped it
+    """
+    from prpy.clone import Clone
+
+    if manips is None:
+        manips = [ robot.left_arm, robot.right_arm ]
+
+    candidates = _get_grasp_candidates(robot, objs, manips, push_distance)
+    if not candidates:
+        raise PlanningError('None of the objects can be reached.')
+
+    results = [ None ] * len(candidates)
+    errors = []
+    next_index = [ 0 ]
+    lock = threading.Lock()
+
+    def plan_candidates(planner):
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+            if index >= len(candidates):
+                return
+
+            obj, manip, tsrlist = candidates[index]
+            try:
+                clone = Clone(robot.GetEnv(), lock=False)
+                path = _plan_with_preshape(clone, robot, manip, preshape,
+                                           tsrlist, planner=planner)
+                with robot.GetEnv():
+                    waypoints = get_waypoints(path, robot, get_dof_indices(path))
+                cost = numpy.sum(numpy.linalg.norm(
+                    numpy.diff(waypoints, axis=0), axis=1))
+                results[index] = (cost, path)
+            except PlanningError, e:
+                logger.debug('Failed planning to grasp %s with %s: %s',
+                             obj.GetName(), manip.GetName(), e)
+
+    def run():
+        # Each thread has its own pipeline so the threads do not serialize
+        try:
+            with robot.planner_pool.get() as planner:
+                plan_candidates(planner)
+        except Exception, e:
+            errors.append(e)
+
+    all_chains = [ chain for _, _, tsrlist in candidates for chain in tsrlist ]
+    with _render_tsr_list(robot, all_chains, render):
+        threads = [ threading.Thread(target=run, name='BatchGrasp')
+                    for _ in xrange(min(num_threads, len(candidates))) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    ranked = sorted((result[0], index) for index, result in enumerate(results)
+                    if result is not None)
+    logger.info('Planned %d of %d grasps.', len(ranked), len(candidates))
+    if not ranked:
+        raise PlanningError('Failed planning to grasp any of the objects.')
+
+    _, best_index = ranked[0]
+    obj, manip, _ = candidates[best_index]
+    HerbGrasp(robot, obj, push_distance=push_distance, manip=manip,
+              preshape=preshape, render=render, traj=results[best_index][1],
+              concurrent_preshape=concurrent_preshape, **kw_args)
+    return obj, manip
 
 def HerbGrasp(robot, obj, push_distance=None, manip=None, 
               preshape=[0., 0., 0., 0.], 
               push_required=False, 
               tsrlist=None,
               render=True,
+              contact_tolerance=0.001,
+              concurrent_preshape=False,
+              traj=None,
               **kw_args):
     """
     @param robot The robot performing the push grasp
@@ -63,21 +462,66 @@ def HerbGrasp(robot, obj, push_distance=None, manip=None,
        movement cannot be found. If false, continue with grasp even if push 
        cannot be executed. (only used if distance is not None)
     @param render Render tsr samples and push direction vectors during planning
+    @param contact_tolerance The accuracy, in meters, of the search for the
+       pose where the object touches the hand (only used if distance is not
+       None)
+    @param concurrent_preshape Move the hand to the preshape while planning
+       and executing the approach, if the post-processed approach is
+       collision-free with the hand at its current configuration, the
+       preshape and steps in between
+    @param traj A path to the grasp that was planned with the hand in the
+       preshape (if None, the path is planned to tsrlist)
     """
     if manip is None:
         with robot.GetEnv():
             manip = robot.GetActiveManipulator()
 
-    # Move the hand to the grasp preshape
-    manip.hand.MoveHand(*preshape)
-
     # Get the grasp tsr
-    if tsrlist is None:
-        tsrlist = robot.tsrlibrary(obj, 'grasp')
-    
-    # Plan to the grasp
-    with prpy.viz.RenderTSRList(tsrlist, robot.GetEnv(), render=render):
-        manip.PlanToTSR(tsrlist)
+    if traj is None:
+        if tsrlist is None:
+            tsrlist = robot.tsrlibrary(obj, 'grasp')
+        tsrlist = _prune_unreachable(robot, tsrlist)
+
+    if concurrent_preshape:
+        hand_indices = manip.hand.GetIndices()
+        with robot.GetEnv():
+            start_values = robot.GetDOFValues(hand_indices)
+
+    if traj is not None and concurrent_preshape:
+        _execute_with_preshape(robot, manip, traj, preshape, start_values)
+    elif traj is not None:
+        manip.hand.MoveHand(*preshape)
+        robot.ExecutePath(traj)
+    elif concurrent_preshape:
+        from prpy.clone import Clone
+
+        # Move the hand to the grasp preshape while planning to the grasp.
+        # The clone is taken first so the plan starts from the current hand.
+        clone = Clone(robot.GetEnv(), lock=False)
+        wait_for_hand = _move_hand_async(manip.hand, preshape)
+        try:
+            with _render_tsr_list(robot, tsrlist, render):
+                path = _plan_with_preshape(clone, robot, manip, preshape,
+                                           tsrlist)
+        except:
+            # Stop the hand before re-raising the planning error, without
+            # hiding it behind an error from the hand
+            exc_info = sys.exc_info()
+            try:
+                wait_for_hand()
+            except Exception, e:
+                logger.error('Failed moving the hand to its preshape: %s', e)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        _execute_with_preshape(robot, manip, path, preshape, start_values,
+                               wait_for_hand=wait_for_hand)
+    else:
+        # Move the hand to the grasp preshape
+        manip.hand.MoveHand(*preshape)
+
+        # Plan to the grasp
+        with _render_tsr_list(robot, tsrlist, render):
+            manip.PlanToTSR(tsrlist)
 
     if push_distance is not None:
         ee_in_world = manip.GetEndEffectorTransform()
@@ -86,21 +530,9 @@ def HerbGrasp(robot, obj, push_distance=None, manip=None,
         # Move the object into the hand
         env = robot.GetEnv()
         with env:
-            obj_in_world = obj.GetTransform()
-
-            # First move back until collision
-            stepsize = 0.01
-            total_distance = 0.0
-            while not env.CheckCollision(robot, obj) and total_distance <= push_distance:
-                obj_in_world[:3,3] -= stepsize*push_direction
-                total_distance += stepsize
-                obj.SetTransform(obj_in_world)
-            
-            # Then move forward until just out of collision
-            stepsize = 0.001
-            while env.CheckCollision(robot, obj):
-                obj_in_world[:3,3] += stepsize*push_direction
-                obj.SetTransform(obj_in_world)
+            # Move back until the object is just out of contact
+            find_contact(env, robot, obj, push_direction, push_distance,
+                         tolerance=contact_tolerance)
 
         # Manipulator must be active for grab to work properly
         p = openravepy.KinBody.SaveParameters
@@ -110,8 +542,8 @@ def HerbGrasp(robot, obj, push_distance=None, manip=None,
 
                 
         # Now execute the straight line movement
-        with prpy.viz.RenderVector(ee_in_world[:3,3], push_direction,
-                                   push_distance, robot.GetEnv(), render=render):
+        with _render_vector(robot, ee_in_world[:3,3], push_direction,
+                            push_distance, render):
             try:
                 with prpy.rave.Disabled(obj):
                     manip.PlanToEndEffectorOffset(direction = push_direction,
@@ -134,6 +566,141 @@ def HerbGrasp(robot, obj, push_distance=None, manip=None,
         robot.SetActiveManipulator(manip)
         robot.Grab(obj)
 
+def _get_colliding_links(check, robot):
+    """
+    Run a collision query and collect every pair of colliding links
+    @param check A function that performs the query given a CollisionReport
+    @param robot The robot whose environment's collision checker is used
+    @return A list of (link1, link2) pairs, or None if the collision checker
+       cannot report all colliding links in one query
+    """
+    all_links = getattr(openravepy.CollisionOptions, 'AllLinkCollisions', None)
+    if all_links is None:
+        return None
+
+    checker = robot.GetEnv().GetCollisionChecker()
+    options = checker.GetCollisionOptions()
+    with openravepy.CollisionOptionsStateSaver(checker, options | all_links, False):
+        if not checker.GetCollisionOptions() & all_links:
+            return None
+
+        report = openravepy.CollisionReport()
+        if not check(report):
+            return []
+        return list(report.vLinkColliding)
+
+def _get_colliding_bodies(robot):
+    """
+    Find every body in collision with the robot
+    If the collision checker does not support AllLinkCollisions, e.g. ODE,
+    this takes one collision query per colliding body instead of one in total
+    @param robot The robot to check
+    @return A list of KinBody objects
+    """
+    env = robot.GetEnv()
+    link_pairs = _get_colliding_links(
+        lambda report: env.CheckCollision(robot, report), robot)
+
+    if link_pairs is not None:
+        # Only disable the other side of each contact, never the robot or
+        # the objects it is holding
+        attached = [ robot ] + list(robot.GetGrabbed())
+        bodies = []
+        for link1, link2 in link_pairs:
+            for link in [ link1, link2 ]:
+                body = link.GetParent()
+                if body not in attached and body not in bodies:
+                    bodies.append(body)
+        return bodies
+
+    # The collision checker only reports one contact per query, so disable
+    # each colliding body in turn to find the next one.
+    report = openravepy.CollisionReport()
+    bodies = []
+    try:
+        while env.CheckCollision(robot, report):
+            body = report.plink2.GetParent()
+            bodies.append(body)
+            body.Enable(False)
+    finally:
+        for body in bodies:
+            body.Enable(True)
+    return bodies
+
+def _get_grab_record(robot, grabbed):
+    """
+    Record the state that decides which links of the robot the grabbed
+    objects are allowed to touch
+    @param robot The robot holding the objects
+    @param grabbed The objects the robot is holding
+    @return A tuple of the robot's DOF values and a dictionary from the name
+       of each grabbed object to its pose relative to the robot
+    """
+    world_in_robot = numpy.linalg.inv(robot.GetTransform())
+    poses = dict((body.GetName(), numpy.dot(world_in_robot, body.GetTransform()))
+                 for body in grabbed)
+    return robot.GetDOFValues(), poses
+
+def _is_same_grab_record(record1, record2, tolerance=1e-6):
+    """
+    Check whether two grab records describe the same state
+    @param record1 A record returned by _get_grab_record, or None
+    @param record2 A record returned by _get_grab_record
+    @param tolerance The maximum difference between DOF values and between
+       elements of the poses
+    @return True if the robot and the objects it holds have not moved
+    """
+    if record1 is None:
+        return False
+    dof_values1, poses1 = record1
+    dof_values2, poses2 = record2
+    if set(poses1.keys()) != set(poses2.keys()):
+        return False
+    if not numpy.allclose(dof_values1, dof_values2, rtol=0., atol=tolerance):
+        return False
+    return all(numpy.allclose(poses1[name], poses2[name], rtol=0., atol=tolerance)
+               for name in poses1)
+
+def _regrab_colliding(robot):
+    """
+    Release and grab again any grabbed object that is in collision with the
+    robot, so the robot ignores its current contacts with the hand
+    The state the grabbed objects were last checked in is recorded on the
+    robot. If neither the robot nor the objects have moved since, e.g. when
+    lifting again after a failed lift, no collision query is made.
+    @param robot The robot to check
+    """
+    grabbed = robot.GetGrabbed()
+    if not grabbed:
+        return
+
+    record = _get_grab_record(robot, grabbed)
+    if _is_same_grab_record(getattr(robot, 'grab_record', None), record):
+        return
+
+    link_pairs = _get_colliding_links(robot.CheckSelfCollision, robot)
+    if link_pairs is None:
+        report = openravepy.CollisionReport()
+        if robot.CheckSelfCollision(report):
+            link_pairs = [ (report.plink1, report.plink2) ]
+        else:
+            link_pairs = []
+
+    colliding = set(link.GetParent().GetName() for pair in link_pairs
+                    for link in pair if link is not None)
+    involved = [ body for body in grabbed if body.GetName() in colliding ]
+    if link_pairs and not involved:
+        involved = grabbed
+
+    for body in involved:
+        robot.Release(body)
+    for body in involved:
+        robot.Grab(body)
+
+    # Grabbing does not move anything, so the record is still current.
+    if hasattr(robot, 'grab_record'):
+        robot.grab_record = record
+
 @ActionMethod
 def Lift(robot, obj, distance=0.05, manip=None, render=True, **kw_args):
     """
@@ -148,34 +715,20 @@ def Lift(robot, obj, distance=0.05, manip=None, render=True, **kw_args):
         with robot.GetEnv():
             manip = robot.GetActiveManipulator()
 
-    # Check for collision and disable anything in collision
-    creport = openravepy.CollisionReport()    
-    disabled_objects = []
-
-    # Resolve inconsistencies in grabbed objects
-    if robot.CheckSelfCollision():
-        grabbed_objs = robot.GetGrabbed()
-        for obj in grabbed_objs:
-            robot.Release(obj)
-        for obj in grabbed_objs:
-            robot.Grab(obj)
+    with robot.GetEnv():
+        # Resolve inconsistencies in grabbed objects
+        _regrab_colliding(robot)
 
-    # Create list of any current collisions so those can be disabled
-    while robot.GetEnv().CheckCollision(robot, creport):
-        collision_obj = creport.plink2.GetParent()
-        disabled_objects.append(collision_obj)
-        collision_obj.Enable(False)
-        
-    for obj in disabled_objects:
-        obj.Enable(True)
+        # Find every object in collision so those can be disabled
+        disabled_objects = _get_colliding_bodies(robot)
 
     # Perform the lift
     with prpy.rave.AllDisabled(robot.GetEnv(), disabled_objects):
         lift_direction = [0., 0., 1.]
         lift_distance = distance
         ee_in_world = manip.GetEndEffectorTransform()
-        with prpy.viz.RenderVector(ee_in_world[:3,3], lift_direction,
-                                   distance, robot.GetEnv(), render=render):
+        with _render_vector(robot, ee_in_world[:3,3], lift_direction,
+                            distance, render):
             manip.PlanToEndEffectorOffset(direction=lift_direction,
                                           distance=lift_distance,
                                           **kw_args)
@@ -205,9 +758,10 @@ def Place(robot, obj, on_obj, manip=None, render=True, **kw_args):
 
     #  Now use this to get a tsr for sampling ee_poses
     place_tsr = robot.tsrlibrary(obj, 'place', pose_tsr_chain = tray_top_tsr[0])
+    place_tsr = _prune_unreachable(robot, place_tsr)
 
     # Plan to the grasp
-    with prpy.viz.RenderTSRList(place_tsr, robot.GetEnv(), render=render):
+    with _render_tsr_list(robot, place_tsr, render):
         manip.PlanToTSR(place_tsr)
 
     # Open the hand
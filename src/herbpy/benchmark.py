@@ -0,0 +1,660 @@
+"""Reproducible benchmark of HERB's planning stack in simulation.
+
+Scenes are described in config/benchmark_scenes.yaml. Each scene contains
+the table, one object at one pose and, for place tasks, the tray. Every task
+is run from the same start state: the scene is reset and the random number
+generators are seeded from the scene, task and trial before each trial.
+"""
+import contextlib, json, logging, os, platform, random, time, zlib
+import numpy, openravepy, yaml
+
+logger = logging.getLogger('herbpy')
+
+
+def load_scenes(path=None):
+    """Load the benchmark scene description.
+    @param path YAML file; defaults to config/benchmark_scenes.yaml
+    @return dictionary parsed from the file
+    """
+    if path is None:
+        from prpy.util import FindCatkinResource
+        path = FindCatkinResource('herbpy', 'config/benchmark_scenes.yaml')
+
+    with open(path, 'rb') as scenes_file:
+        return yaml.safe_load(scenes_file)
+
+
+def get_scenes(config):
+    """Generate the list of scenes.
+    @param config dictionary returned by load_scenes
+    @return list of scenes; each is a dictionary with the keys "name",
+            "objects" (list of object name, kinbody and position), and
+            "tasks" (list of task names)
+    """
+    scenes = [{
+        'name': 'table',
+        'objects': [],
+        'tasks': [ 'named:' + name for name in config.get('named_configurations', []) ],
+    }]
+
+    place_on = config['place_on']
+    for name, spec in sorted(config['objects'].items()):
+        for index, position in enumerate(spec['positions']):
+            objects = [ (name, spec['kinbody'], position) ]
+            if 'place' in spec['tasks']:
+                tray_positions = place_on['positions']
+                objects.append((place_on['name'], place_on['kinbody'],
+                                tray_positions[index % len(tray_positions)]))
+
+            scenes.append({
+                'name': '{:s}_{:d}'.format(name, index),
+                'objects': objects,
+                'tasks': list(spec['tasks']),
+            })
+
+    return scenes
+
+
+def get_seed(*names):
+    """Get a deterministic random seed from a list of names."""
+    return zlib.crc32('/'.join(map(str, names))) & 0xffffffff
+
+
+def summarize(values):
+    """Summarize a list of numbers.
+    @return dictionary with the count, mean, median, min and max; None if
+            the list is empty
+    """
+    if not values:
+        return None
+
+    values = numpy.array(values, dtype=float)
+    return {
+        'count': len(values),
+        'mean': float(numpy.mean(values)),
+        'median': float(numpy.median(values)),
+        'min': float(numpy.min(values)),
+        'max': float(numpy.max(values)),
+    }
+
+
+class Benchmark(object):
+    """Runs HERB's actions and named configurations in a corpus of scenes."""
+
+    def __init__(self, env, robot, config):
+        """
+        @param env OpenRAVE environment containing HERB
+        @param robot HERBRobot
+        @param config dictionary returned by load_scenes
+        """
+        from prpy.util import FindCatkinResource
+
+        self.env = env
+        self.robot = robot
+        self.config = config
+        self.manip = getattr(robot, config.get('manipulator', 'right_arm'))
+        self.objects_path = FindCatkinResource('pr_ordata', 'data/objects')
+        self.bodies = dict()
+
+        with env:
+            self.table = self._load_body('table', config['table']['kinbody'])
+            self.table.SetTransform(numpy.array(config['table']['pose']))
+            env.Add(self.table)
+
+            self.robot_pose = numpy.dot(self.table.GetTransform(),
+                                        numpy.array(config['table']['robot_pose']))
+            self.robot_pose[2, 3] = 0.
+
+        self.start_indices, self.start_values = \
+            robot.configurations.get_configuration(
+                config.get('start_configuration', 'relaxed_home'))
+
+    def _load_body(self, name, kinbody):
+        body = self.env.ReadKinBodyXMLFile(os.path.join(self.objects_path, kinbody))
+        if body is None:
+            raise ValueError('Failed loading "{:s}" from "{:s}".'.format(
+                             kinbody, self.objects_path))
+        body.SetName(name)
+        return body
+
+    def _get_body(self, name, kinbody):
+        if name not in self.bodies:
+            self.bodies[name] = self._load_body(name, kinbody)
+        return self.bodies[name]
+
+    def reset(self, scene):
+        """Reset the environment to the initial state of a scene.
+        @param scene scene returned by get_scenes
+        @return dictionary of object name to KinBody
+        """
+        robot = self.robot
+
+        with self.env:
+            for body in robot.GetGrabbed():
+                robot.Release(body)
+            for body in self.bodies.itervalues():
+                if self.env.GetKinBody(body.GetName()) is not None:
+                    self.env.Remove(body)
+
+            robot.SetTransform(self.robot_pose)
+            robot.SetDOFValues(self.start_values, self.start_indices)
+            robot.SetDOFValues([ 0., 0., 0., 0. ], self.manip.hand.GetIndices())
+
+            table_aabb = self.table.ComputeAABB()
+            bodies = dict()
+            for name, kinbody, position in scene['objects']:
+                body = self._get_body(name, kinbody)
+                yaw = position[2] if len(position) > 2 else 0.
+
+                pose = openravepy.matrixFromAxisAngle([ 0., 0., yaw ])
+                body.SetTransform(pose)
+                body_aabb = body.ComputeAABB()
+
+                # Rest the object on top of the table.
+                pose[0, 3] = table_aabb.pos()[0] + table_aabb.extents()[0] * position[0]
+                pose[1, 3] = table_aabb.pos()[1] + table_aabb.extents()[1] * position[1]
+                pose[2, 3] = (table_aabb.pos()[2] + table_aabb.extents()[2]
+                              - (body_aabb.pos()[2] - body_aabb.extents()[2]) + 0.01)
+                body.SetTransform(pose)
+                self.env.Add(body)
+                bodies[name] = body
+
+        return bodies
+
+    @contextlib.contextmanager
+    def _record_trajectories(self, durations, execution_times):
+        """Record the duration of every trajectory executed by the robot."""
+        robot = self.robot
+        execute_trajectory = robot.ExecuteTrajectory
+
+        def recording_execute_trajectory(traj, *args, **kw_args):
+            start_time = time.time()
+            try:
+                return execute_trajectory(traj, *args, **kw_args)
+            finally:
+                execution_times.append(time.time() - start_time)
+                durations.append(traj.GetDuration())
+
+        robot.ExecuteTrajectory = recording_execute_trajectory
+        try:
+            yield
+        finally:
+            del robot.ExecuteTrajectory
+
+    def _get_task(self, scene, task, bodies):
+        """Get the functions that perform a task.
+        @return tuple of the list of untimed setup functions and the function
+                to time
+        """
+        robot = self.robot
+        manip = self.manip
+
+        if task.startswith('named:'):
+            name = task[len('named:'):]
+            return [], lambda: robot.PlanToNamedConfiguration(name, execute=True)
+
+        obj_name = scene['objects'][0][0]
+        obj = bodies[obj_name]
+
+        def grasp():
+            robot.Grasp(obj, manip=manip, render=False)
+
+        def lift():
+            robot.Lift(obj, manip=manip, render=False)
+
+        if task == 'grasp':
+            return [], grasp
+        elif task == 'push_grasp':
+            return [], lambda: robot.PushGrasp(obj, manip=manip, render=False)
+        elif task == 'lift':
+            return [ grasp ], lift
+        elif task == 'place':
+            on_obj = bodies[self.config['place_on']['name']]
+            return [ grasp, lift ], \
+                lambda: robot.Place(obj, on_obj, manip=manip, render=False)
+        else:
+            raise ValueError('Unknown task "{:s}".'.format(task))
+
+    def run_trial(self, scene, task, trial):
+        """Run one trial of a task.
+        @param scene scene returned by get_scenes
+        @param task name of the task
+        @param trial index of the trial
+        @return dictionary describing the outcome of the trial
+        """
+        from prpy.planning.base import PlanningError
+
+        seed = get_seed(scene['name'], task, trial)
+        random.seed(seed)
+        numpy.random.seed(seed)
+
+        bodies = self.reset(scene)
+        setup, fn = self._get_task(scene, task, bodies)
+
+        result = {
+            'success': False,
+            'setup_failed': False,
+            'error': None,
+            'wall_time': None,
+            'planning_time': None,
+            'trajectory_duration': None,
+        }
+
+        try:
+            for setup_fn in setup:
+                setup_fn()
+        except (PlanningError, openravepy.openrave_exception) as e:
+            result['setup_failed'] = True
+            result['error'] = type(e).__name__
+            return result
+
+        durations, execution_times = [], []
+        start_time = time.time()
+        try:
+            with self._record_trajectories(durations, execution_times):
+                fn()
+            result['success'] = True
+        except (PlanningError, openravepy.openrave_exception) as e:
+            result['error'] = type(e).__name__
+        finally:
+            result['wall_time'] = time.time() - start_time
+            result['planning_time'] = result['wall_time'] - sum(execution_times)
+
+        if result['success']:
+            result['trajectory_duration'] = sum(durations)
+        return result
+
+    def run(self, trials=1, planners=None, scene_names=None, task_names=None):
+        """Run the benchmark.
+        @param trials number of trials of each task
+        @param planners names of planners in robot.planner_registry to use as
+               robot.planner; defaults to the default planning pipeline
+        @param scene_names names of scenes to run; defaults to all scenes
+        @param task_names names of tasks to run; defaults to all tasks
+        @return dictionary of results that can be serialized as JSON
+        """
+        robot = self.robot
+        registry = robot.planner_registry
+        default_planner = robot.planner
+
+        if planners is None:
+            planners = [ 'planner' ]
+
+        results = dict()
+        try:
+            for planner_name in planners:
+                robot.planner = registry.get(planner_name)
+                results[planner_name] = self._run_planner(
+                    trials, scene_names, task_names)
+        finally:
+            robot.planner = default_planner
+
+        return {
+            'metadata': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'host': platform.node(),
+                'trials': trials,
+            },
+            'results': results,
+        }
+
+    def _run_planner(self, trials, scene_names, task_names):
+        telemetry = self.robot.planner_telemetry
+        results = dict()
+
+        for scene in get_scenes(self.config):
+            if scene_names is not None and scene['name'] not in scene_names:
+                continue
+
+            for task in scene['tasks']:
+                if task_names is not None and task not in task_names:
+                    continue
+
+                key = '{:s}/{:s}'.format(scene['name'], task)
+                logger.info('Running %s.', key)
+
+                # Planner statistics include the setup of each trial.
+                telemetry.clear()
+                outcomes = [ self.run_trial(scene, task, trial)
+                             for trial in xrange(trials) ]
+                successes = [ o for o in outcomes if o['success'] ]
+                errors = dict()
+                for outcome in outcomes:
+                    if outcome['error'] is not None:
+                        errors[outcome['error']] = errors.get(outcome['error'], 0) + 1
+
+                results[key] = {
+                    'trials': trials,
+                    'successes': len(successes),
+                    'setup_failures': sum(o['setup_failed'] for o in outcomes),
+                    'success_rate': float(len(successes)) / trials,
+                    'errors': errors,
+                    'planning_time': summarize([ o['planning_time'] for o in outcomes
+                                                 if not o['setup_failed'] ]),
+                    'trajectory_duration': summarize([ o['trajectory_duration']
+                                                       for o in successes ]),
+                    'planners': telemetry.as_dict(),
+                }
+
+        return results
+
+
+def _sample_configuration(robot, dof_indices, values, noise, rng):
+    """Perturb a configuration until it is collision-free."""
+    env = robot.GetEnv()
+    lower, upper = robot.GetDOFLimits(dof_indices)
+
+    for _ in xrange(100):
+        q = numpy.clip(values + rng.uniform(-noise, noise, len(values)),
+                       lower, upper)
+        with env:
+            robot.SetDOFValues(q, dof_indices)
+            if not env.CheckCollision(robot) and not robot.CheckSelfCollision():
+                return q
+    return numpy.array(values, dtype=float)
+
+
+def run_warm_starts(robot, num_queries=20, noise=0.1, k=1, names=None):
+    """Compare the optimizer in the planning pipeline with and without seeds
+    from an ExperienceLibrary.
+
+    Queries connect random pairs of perturbed named configurations. The
+    library is first trained on one set of queries. A second set of queries,
+    drawn from the same pairs with different perturbations, is then solved
+    from the optimizer's default seed and from the nearest stored paths.
+    TrajOpt and CHOMP do not report their iteration counts, so the latency
+    of each query is used to measure the optimization effort.
+
+    @param robot robot in simulation
+    @param num_queries number of training and test queries
+    @param noise maximum perturbation of each joint, in radians
+    @param k number of stored paths to try as seeds
+    @param names named configurations to connect; defaults to those in
+           config/benchmark_scenes.yaml
+    @return dictionary of results that can be serialized as JSON
+    """
+    from prpy.planning.base import PlanningError
+    from planning import ExperienceLibrary, ExperiencePlanner
+
+    optimizer = robot.trajopt_planner
+    if optimizer is None:
+        optimizer = robot.chomp_planner
+    if optimizer is None:
+        raise ValueError('Either TrajOpt or CHOMP is required.')
+
+    if names is None:
+        names = load_scenes().get('named_configurations', [])
+    names = [ name for name in names
+              if robot.configurations.get_configuration(name)[0] ]
+    rng = numpy.random.RandomState(get_seed('warm_starts'))
+    pairs = [ tuple(rng.choice(len(names), 2, replace=False))
+              for _ in xrange(num_queries) ]
+
+    def sample_queries():
+        queries = []
+        for start_index, goal_index in pairs:
+            indices, start = robot.configurations.get_configuration(names[start_index])
+            _, goal = robot.configurations.get_configuration(names[goal_index])
+            queries.append((indices,
+                            _sample_configuration(robot, indices, start, noise, rng),
+                            _sample_configuration(robot, indices, goal, noise, rng)))
+        return queries
+
+    def solve(planner, queries):
+        latencies, successes = [], 0
+        for indices, start, goal in queries:
+            with robot.GetEnv():
+                robot.SetActiveDOFs(indices)
+                robot.SetDOFValues(start, indices)
+
+            start_time = time.time()
+            try:
+                planner.PlanToConfiguration(robot, goal)
+                successes += 1
+            except PlanningError as e:
+                logger.debug('Query failed: %s', e)
+            latencies.append(time.time() - start_time)
+
+        return {
+            'queries': len(queries),
+            'successes': successes,
+            'latency': summarize(latencies),
+        }
+
+    p = openravepy.KinBody.SaveParameters
+    with robot.CreateRobotStateSaver(p.ActiveDOF | p.LinkTransformation):
+        training_queries = sample_queries()
+        test_queries = sample_queries()
+
+        experience_planner = ExperiencePlanner(optimizer, ExperienceLibrary(), k=k)
+        training = solve(experience_planner, training_queries)
+        training_statistics = experience_planner.get_statistics()
+
+        cold = solve(optimizer, test_queries)
+        warm = solve(experience_planner, test_queries)
+
+    warm_statistics = experience_planner.get_statistics()
+    for key in [ 'warm_starts', 'cold_starts', 'seed_failures' ]:
+        warm_statistics[key] -= training_statistics[key]
+    warm.update(warm_statistics)
+
+    savings = None
+    if cold['latency'] is not None and warm['latency'] is not None:
+        savings = 1. - warm['latency']['mean'] / cold['latency']['mean']
+
+    return {
+        'optimizer': str(optimizer),
+        'training': training,
+        'cold': cold,
+        'warm': warm,
+        'mean_latency_savings': savings,
+    }
+
+
+def _linear_contact_search(env, robot, obj, direction, max_distance):
+    """Contact search HerbGrasp used before find_contact: step back in 1 cm
+    steps until collision, then forward in 1 mm steps until free.
+    @return number of collision checks
+    """
+    num_checks = 0
+    obj_in_world = obj.GetTransform()
+
+    total_distance = 0.
+    while True:
+        num_checks += 1
+        if env.CheckCollision(robot, obj) or total_distance > max_distance:
+            break
+        obj_in_world[:3, 3] -= 0.01 * direction
+        total_distance += 0.01
+        obj.SetTransform(obj_in_world)
+
+    while True:
+        num_checks += 1
+        if not env.CheckCollision(robot, obj):
+            break
+        obj_in_world[:3, 3] += 0.001 * direction
+        obj.SetTransform(obj_in_world)
+
+    return num_checks
+
+
+def run_contact_search(benchmark, num_trials=20, push_distance=0.1,
+                       tolerance=0.001):
+    """Compare the collision checks and lock hold time of HerbGrasp's contact
+    search with the linear search it replaced.
+
+    Each trial places an object of the benchmark at a random distance, up to
+    \p push_distance, in front of the hand in the start configuration and
+    moves it back until it touches the hand with both searches.
+
+    @param benchmark Benchmark
+    @param num_trials number of trials of each object
+    @param push_distance maximum distance between the object and the hand
+    @param tolerance tolerance of find_contact
+    @return dictionary of results that can be serialized as JSON
+    """
+    from action.grasping import find_contact
+
+    env, robot, manip = benchmark.env, benchmark.robot, benchmark.manip
+    rng = numpy.random.RandomState(get_seed('contact_search'))
+    searches = [ 'linear', 'bisection' ]
+    checks = dict((name, []) for name in searches)
+    lock_times = dict((name, []) for name in searches)
+    errors = []
+
+    benchmark.reset({ 'objects': [] })
+    with env:
+        ee_in_world = manip.GetEndEffectorTransform()
+    direction = ee_in_world[:3, 2]
+
+    for name, description in sorted(benchmark.config['objects'].items()):
+        obj = benchmark._get_body(name, description['kinbody'])
+        with env:
+            env.Add(obj)
+        try:
+            for _ in xrange(num_trials):
+                start_pose = ee_in_world.copy()
+                start_pose[:3, 3] += rng.uniform(0., push_distance) * direction
+                final_positions = dict()
+
+                for search in searches:
+                    start_time = time.time()
+                    with env:
+                        obj.SetTransform(start_pose)
+                        if search == 'linear':
+                            num_checks = _linear_contact_search(
+                                env, robot, obj, direction, push_distance)
+                        else:
+                            _, num_checks = find_contact(
+                                env, robot, obj, direction, push_distance,
+                                tolerance=tolerance)
+                        final_positions[search] = obj.GetTransform()[:3, 3]
+                    lock_times[search].append(time.time() - start_time)
+                    checks[search].append(num_checks)
+
+                errors.append(float(numpy.linalg.norm(
+                    final_positions['linear'] - final_positions['bisection'])))
+        finally:
+            with env:
+                env.Remove(obj)
+
+    results = dict((search, {
+        'collision_checks': summarize(checks[search]),
+        'lock_time': summarize(lock_times[search]),
+    }) for search in searches)
+    results['position_difference'] = summarize(errors)
+    results['check_reduction'] = 1. - (float(sum(checks['bisection']))
+                                       / max(sum(checks['linear']), 1))
+    return results
+
+
+def run_ik_cache(benchmark, num_poses=20, num_rounds=5):
+    """Measure the hit rate of an IKCache on repeated TSR sampling.
+
+    Each object that has a grasp task is placed at its first position. Every
+    round draws \p num_poses new end-effector poses from its grasp TSRs, as
+    a planner does on each query, and solves them through a cache that is
+    empty before the first round. The same poses are solved through a cache
+    that only returns exact hits and through one that refines the solutions
+    of nearby poses.
+
+    @param benchmark Benchmark
+    @param num_poses number of poses sampled from each object in each round
+    @param num_rounds number of rounds
+    @return dictionary of results that can be serialized as JSON
+    """
+    from ikcache import IKCache
+    from tsr.sampling import sample_tsr
+
+    robot, manip = benchmark.robot, benchmark.manip
+    rng = numpy.random.RandomState(get_seed('ik_cache'))
+    filter_options = openravepy.IkFilterOptions.CheckEnvCollisions
+    caches = {
+        'exact': IKCache(manip, path=False, refine=False),
+        'refined': IKCache(manip, path=False, refine=True),
+    }
+    latencies = dict((name, []) for name in caches)
+    hit_rates = dict((name, []) for name in caches)
+
+    for name, description in sorted(benchmark.config['objects'].items()):
+        if 'grasp' not in description['tasks']:
+            continue
+
+        position = description['positions'][0]
+        bodies = benchmark.reset({
+            'objects': [ (name, description['kinbody'], position) ],
+        })
+        tsrs = [ chain.TSRs[0]
+                 for chain in robot.tsrlibrary(bodies[name], 'grasp',
+                                               manip=manip)
+                 if chain.sample_goal and len(chain.TSRs) == 1 ]
+        if not tsrs:
+            continue
+
+        for _ in xrange(num_rounds):
+            poses = [ sample_tsr(tsrs[rng.randint(len(tsrs))], 1, rng)[0]
+                      for _ in xrange(num_poses) ]
+
+            for cache_name, cache in caches.iteritems():
+                hits = cache.hits
+                for pose in poses:
+                    start_time = time.time()
+                    cache.find_solutions(manip, pose, filter_options,
+                                         manip._solve_ik)
+                    latencies[cache_name].append(time.time() - start_time)
+                hit_rates[cache_name].append(
+                    float(cache.hits - hits) / len(poses))
+
+    results = dict((cache_name, {
+        'statistics': cache.get_statistics(),
+        'latency': summarize(latencies[cache_name]),
+        'hit_rate_per_round': hit_rates[cache_name],
+    }) for cache_name, cache in caches.iteritems())
+    return results
+
+
+def run(output_path=None, trials=1, planners=None, scenes_path=None,
+        scene_names=None, task_names=None, warm_start_queries=0,
+        contact_search_trials=0, ik_cache_rounds=0, **initialize_args):
+    """Initialize HERB in simulation and run the benchmark.
+    @param output_path optional path of the JSON output
+    @param trials number of trials of each task
+    @param planners names of the planners to benchmark
+    @param scenes_path scene description; defaults to config/benchmark_scenes.yaml
+    @param scene_names names of scenes to run; defaults to all scenes
+    @param task_names names of tasks to run; defaults to all tasks
+    @param warm_start_queries number of queries used to compare the
+           optimizer with and without an ExperienceLibrary; see
+           run_warm_starts
+    @param contact_search_trials number of trials of each object used to
+           compare HerbGrasp's contact search with a linear search; see
+           run_contact_search
+    @param ik_cache_rounds number of rounds of TSR samples used to measure
+           the hit rate of the IK cache; see run_ik_cache
+    @param **initialize_args arguments passed to herbpy.initialize
+    @return dictionary of results
+    """
+    from herb import initialize
+
+    initialize_args.setdefault('sim', True)
+    initialize_args.setdefault('attach_viewer', False)
+    env, robot = initialize(**initialize_args)
+
+    benchmark = Benchmark(env, robot, load_scenes(scenes_path))
+    results = benchmark.run(trials=trials, planners=planners,
+                            scene_names=scene_names, task_names=task_names)
+    if warm_start_queries > 0:
+        results['warm_starts'] = run_warm_starts(
+            robot, warm_start_queries,
+            names=benchmark.config.get('named_configurations'))
+    if contact_search_trials > 0:
+        results['contact_search'] = run_contact_search(
+            benchmark, contact_search_trials)
+    if ik_cache_rounds > 0:
+        results['ik_cache'] = run_ik_cache(benchmark, num_rounds=ik_cache_rounds)
+
+    if output_path is not None:
+        with open(output_path, 'wb') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+    return results
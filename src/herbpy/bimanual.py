@@ -0,0 +1,237 @@
+"""
+Plan and execute motions of both arms at the same time.
+
+Each arm's motion is planned in its own clone of the environment, with its
+own planning pipeline, on a separate thread. The two paths are then merged
+into one path over both arms' DOFs, so they start together and finish
+together when the path is executed. The merged path is collision checked,
+including collisions between the arms. If it is in collision, the motions
+are run one after the other instead, replanning the second motion from the
+end of the first if necessary.
+
+    traj = robot.ExecuteBimanual(
+        left=('PlanToNamedConfiguration', ('home',)),
+        right=('PlanToConfiguration', (goal,)))
+
+Only the moving arm's DOFs are kept from each plan. Most named
+configurations in configurations.yaml, e.g. 'home', cover both arms, so
+PlanToNamedConfiguration plans both arms to it in the clone and the other
+arm's half of the path is discarded. Give the other arm its own motion, or
+None to hold it still.
+"""
+import logging, sys, threading, time
+import numpy
+from planahead import clone_value
+from planning.trajectories import (
+    create_path,
+    get_waypoints,
+    is_path_collision_free,
+)
+
+logger = logging.getLogger('herbpy')
+
+
+def _parse_motion(motion):
+    """Split a motion into its method, positional and keyword arguments."""
+    if isinstance(motion, basestring):
+        motion = (motion,)
+    method = motion[0]
+    args = tuple(motion[1]) if len(motion) > 1 else ()
+    kw_args = dict(motion[2]) if len(motion) > 2 else dict()
+    return method, args, kw_args
+
+
+def get_path_parameters(waypoints):
+    """Get the normalized arc length of each waypoint of a path.
+    @param waypoints array with one row per waypoint
+    @return array that increases from zero to one
+    """
+    lengths = numpy.linalg.norm(numpy.diff(waypoints, axis=0), axis=1)
+    total_length = numpy.sum(lengths)
+    if total_length > 0.:
+        return numpy.concatenate(([ 0. ], numpy.cumsum(lengths))) / total_length
+    return numpy.linspace(0., 1., len(waypoints))
+
+
+def merge_paths(paths):
+    """Merge paths of disjoint DOFs into one path that moves them together.
+    Each path is parameterized by its normalized arc length and the merged
+    path has a waypoint wherever any of the paths does, so every DOF follows
+    exactly the same piecewise linear path as before.
+    @param paths list of (dof_indices, waypoints) pairs
+    @return tuple of the merged DOF indices and waypoints
+    """
+    parameters = [ get_path_parameters(waypoints) for _, waypoints in paths ]
+    merged_parameters = numpy.unique(numpy.concatenate(parameters))
+
+    dof_indices = []
+    columns = []
+    for (indices, waypoints), s in zip(paths, parameters):
+        dof_indices.extend(indices)
+        for column in numpy.asarray(waypoints).T:
+            columns.append(numpy.interp(merged_parameters, s, column))
+
+    return dof_indices, numpy.column_stack(columns)
+
+
+def concatenate_paths(paths, start_values):
+    """Run paths of disjoint DOFs one after the other.
+    DOFs that are not moving hold their start or final value.
+    @param paths list of (dof_indices, waypoints) pairs, in order
+    @param start_values dictionary from DOF index to its initial value
+    @return tuple of the merged DOF indices and waypoints
+    """
+    dof_indices = [ index for indices, _ in paths for index in indices ]
+    current = numpy.array([ start_values[index] for index in dof_indices ])
+
+    rows = []
+    offset = 0
+    for indices, waypoints in paths:
+        # Each path starts where the previous one left its DOFs.
+        if rows:
+            waypoints = waypoints[1:]
+        for waypoint in waypoints:
+            row = current.copy()
+            row[offset:offset + len(indices)] = waypoint
+            rows.append(row)
+        current = rows[-1].copy()
+        offset += len(indices)
+
+    return dof_indices, numpy.array(rows)
+
+
+class BimanualPlanner(object):
+    """Plans motions of both of HERB's arms concurrently."""
+    def __init__(self, robot):
+        """
+        @param robot HERBRobot
+        """
+        self.robot = robot
+        self.parallel_plans = 0
+        self.sequential_plans = 0
+
+    def _plan_arm(self, manip, motion, start_values=None):
+        """Plan a motion of one arm in a clone of the environment.
+        @param manip manipulator that moves
+        @param motion (method, args, kw_args) tuple
+        @param start_values optional dictionary from DOF index to the value
+               it has when the motion starts
+        @return tuple of the arm's DOF indices and the waypoints of the path
+        """
+        from prpy.clone import Clone, Cloned
+
+        method, args, kw_args = _parse_motion(motion)
+        arm_indices = list(manip.GetArmIndices())
+
+        # Each arm borrows its own pipeline so the arms can plan at the same
+        # time. The planner is called without holding the clone's lock, so
+        # that a Portfolio can clone it.
+        with self.robot.planner_pool.get() as planner, \
+                Clone(self.robot.GetEnv(), lock=False) as cloned_env:
+            with cloned_env:
+                cloned_robot = Cloned(self.robot, into=cloned_env)
+                cloned_manip = Cloned(manip, into=cloned_env)
+                if start_values:
+                    cloned_robot.SetDOFValues(start_values.values(),
+                                              start_values.keys())
+                cloned_robot.SetActiveManipulator(cloned_manip)
+                cloned_robot.SetActiveDOFs(arm_indices)
+
+            traj = getattr(planner, method)(cloned_robot,
+                                            *clone_value(args, cloned_env),
+                                            **clone_value(kw_args, cloned_env))
+            with cloned_env:
+                waypoints = get_waypoints(traj, cloned_robot, arm_indices)
+
+        return arm_indices, waypoints
+
+    def plan(self, left=None, right=None):
+        """Plan motions of the left and right arms as one path.
+        @param left motion of the left arm, as a (method, args, kw_args)
+               tuple of a planning method, e.g. ('PlanToConfiguration',
+               (goal,)), or None to hold the arm still
+        @param right motion of the right arm, or None
+        @return untimed path over the DOFs of the arms that move
+        @throws PlanningError if either motion cannot be planned
+        """
+        from prpy.planning.base import PlanningError
+
+        robot = self.robot
+        motions = [ (manip, motion) for manip, motion in
+                    [ (robot.left_arm, left), (robot.right_arm, right) ]
+                    if motion is not None ]
+        if not motions:
+            raise ValueError('At least one arm must move.')
+
+        # Plan the arms concurrently. Each one treats the other as static.
+        # Any exception raised on a worker thread is re-raised here, so a
+        # failure is not mistaken for an arm that did not need to move.
+        results = [ None ] * len(motions)
+        errors = [ None ] * len(motions)
+
+        def plan_arm(i):
+            try:
+                results[i] = self._plan_arm(*motions[i])
+            except Exception:
+                errors[i] = sys.exc_info()
+
+        start_time = time.time()
+        threads = [ threading.Thread(target=plan_arm, args=(i,))
+                    for i in xrange(1, len(motions)) ]
+        for thread in threads:
+            thread.start()
+        plan_arm(0)
+        for thread in threads:
+            thread.join()
+
+        for error in errors:
+            if error is not None:
+                raise error[0], error[1], error[2]
+        logger.debug('Planned %d arm motions in %.3f seconds.',
+                     len(motions), time.time() - start_time)
+
+        if len(results) == 1:
+            dof_indices, waypoints = results[0]
+            return create_path(robot, waypoints, dof_indices)
+
+        # Move both arms at once if they do not collide with each other.
+        dof_indices, waypoints = merge_paths(results)
+        path = create_path(robot, waypoints, dof_indices)
+        if is_path_collision_free(robot, path, dof_indices):
+            self.parallel_plans += 1
+            return path
+
+        logger.info('The arms collide when moving at the same time. Moving'
+                    ' them one after the other.')
+        self.sequential_plans += 1
+
+        with robot.GetEnv():
+            start_values = dict(zip(dof_indices, robot.GetDOFValues(dof_indices)))
+        dof_indices, waypoints = concatenate_paths(results, start_values)
+        path = create_path(robot, waypoints, dof_indices)
+        if is_path_collision_free(robot, path, dof_indices):
+            return path
+
+        # Replan the second motion with the first arm at its goal.
+        first_indices, first_waypoints = results[0]
+        end_values = dict(start_values)
+        end_values.update(zip(first_indices, first_waypoints[-1]))
+        results[1] = self._plan_arm(motions[1][0], motions[1][1],
+                                    start_values=end_values)
+
+        dof_indices, waypoints = concatenate_paths(results, start_values)
+        path = create_path(robot, waypoints, dof_indices)
+        if not is_path_collision_free(robot, path, dof_indices):
+            raise PlanningError('Failed finding collision-free motions for'
+                                ' both arms.')
+        return path
+
+    def get_statistics(self):
+        """Get the number of two-arm plans that move the arms at the same
+        time and one after the other.
+        @return dictionary of statistics
+        """
+        return {
+            'parallel': self.parallel_plans,
+            'sequential': self.sequential_plans,
+        }
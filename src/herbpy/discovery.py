@@ -0,0 +1,231 @@
+"""
+On-disk cache of the filesystem searches performed by herbpy.initialize.
+
+Exporting OpenRAVE plugins and locating HERB's URDF and SRDF both crawl every
+Catkin workspace. The results only change when the workspaces change, so they
+are cached in herbpy's cache directory and keyed on the workspace search paths
+and the modification times of the directories and files that were found.
+"""
+import hashlib, json, logging, os, sys
+import openravepy, prpy.dependency_manager
+from util import atomic_write, get_cache_path, hash_file
+
+logger = logging.getLogger('herbpy')
+
+WORKSPACE_VARIABLES = [ 'CMAKE_PREFIX_PATH', 'ROS_PACKAGE_PATH' ]
+
+
+def _get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def get_workspace_key():
+    """Get a key that identifies the current set of workspaces.
+    @return hexadecimal digest of the workspace search paths
+    """
+    workspaces = [ os.environ.get(name, '') for name in WORKSPACE_VARIABLES ]
+    return hashlib.sha1(json.dumps(workspaces)).hexdigest()
+
+
+def get_workspace_mtimes():
+    """Get the modification time of each workspace's share directory.
+    These change whenever a package is added to or removed from a workspace.
+    @return dictionary of directory path to modification time
+    """
+    prefixes = os.environ.get('CMAKE_PREFIX_PATH', '').split(os.pathsep)
+    share_directories = [ os.path.join(prefix, 'share')
+                          for prefix in prefixes if prefix ]
+    return dict((path, _get_mtime(path)) for path in share_directories)
+
+
+class DiscoveryCache(object):
+    """Persistent record of resolved paths for each set of workspaces."""
+    def __init__(self, path=None):
+        self.path = path or get_cache_path('discovery.json')
+
+        try:
+            with open(self.path, 'rb') as cache_file:
+                self._entries = json.load(cache_file)
+        except (IOError, ValueError):
+            self._entries = dict()
+
+    def get(self, name):
+        """Get a cached value for the current workspaces.
+        The value is only returned if none of the workspaces have changed.
+        @param name name of the value
+        @return cached value or None
+        """
+        entry = self._entries.get(get_workspace_key(), {})
+        if entry.get('workspace_mtimes') != get_workspace_mtimes():
+            return None
+        return entry.get(name)
+
+    def set(self, name, value):
+        """Store a value for the current workspaces and save the cache.
+        @param name name of the value
+        @param value JSON-serializable value
+        """
+        key = get_workspace_key()
+        entry = self._entries.get(key)
+        workspace_mtimes = get_workspace_mtimes()
+
+        if entry is None or entry.get('workspace_mtimes') != workspace_mtimes:
+            entry = { 'workspace_mtimes': workspace_mtimes }
+            self._entries[key] = entry
+        entry[name] = value
+
+        try:
+            with atomic_write(self.path) as cache_file:
+                json.dump(self._entries, cache_file)
+        except (IOError, OSError) as e:
+            logger.warning('Failed writing discovery cache "%s": %s',
+                           self.path, e)
+
+
+def export_dependencies(package_name=None, cache=None):
+    """Export OpenRAVE plugin and data paths, using a cache if provided.
+    This is equivalent to prpy.dependency_manager.export(). The environment
+    variables and Python path entries it adds are recorded in the cache and
+    replayed on subsequent calls instead of crawling the workspaces again.
+    @param package_name package to export; only used with rosbuild
+    @param cache DiscoveryCache or None to disable caching
+    """
+    def export():
+        if package_name is None:
+            prpy.dependency_manager.export()
+        else:
+            prpy.dependency_manager.export(package_name)
+
+    if cache is None:
+        export()
+        return
+
+    name = 'export:{:s}'.format(package_name or '')
+    record = cache.get(name)
+    if record is not None \
+            and all(os.environ.get(variable) == value
+                    for variable, value in record['environ_before'].items()) \
+            and all(os.path.exists(path) for path in record['sys_path']):
+        os.environ.update(record['environ_after'])
+        sys.path.extend(path for path in record['sys_path']
+                        if path not in sys.path)
+        logger.debug('Exported dependencies from the discovery cache.')
+        return
+
+    environ_before = dict(os.environ)
+    sys_path_before = set(sys.path)
+    export()
+
+    changed_variables = [ variable for variable, value in os.environ.items()
+                          if environ_before.get(variable) != value ]
+    cache.set(name, {
+        'environ_before': dict((variable, environ_before.get(variable))
+                               for variable in changed_variables),
+        'environ_after': dict((variable, os.environ[variable])
+                              for variable in changed_variables),
+        'sys_path': [ path for path in sys.path if path not in sys_path_before ],
+    })
+
+
+def find_herb_model(cache=None):
+    """Find HERB's URDF and SRDF files in the Catkin workspaces.
+    @param cache DiscoveryCache or None to disable caching
+    @return tuple of URDF path and SRDF path
+    """
+    if cache is not None:
+        record = cache.get('herb_model')
+        if record is not None \
+                and _get_mtime(record['urdf_path']) == record['urdf_mtime'] \
+                and _get_mtime(record['srdf_path']) == record['srdf_mtime']:
+            return record['urdf_path'], record['srdf_path']
+
+    from catkin.find_in_workspaces import find_in_workspaces
+    share_directories = find_in_workspaces(search_dirs=['share'],
+                                           project='herb_description')
+    if not share_directories:
+        logger.error('Unable to find the HERB model. Do you have the'
+                     ' package herb_description installed?')
+        raise ValueError('Unable to find HERB model.')
+
+    found_models = False
+    for share_directory in share_directories:
+        urdf_path = os.path.join(share_directory, 'robots', 'herb.urdf')
+        srdf_path = os.path.join(share_directory, 'robots', 'herb.srdf')
+        if os.path.exists(urdf_path) and os.path.exists(srdf_path):
+            found_models = True
+            break
+
+    if not found_models:
+        logger.error('Missing URDF file and/or SRDF file for HERB.'
+                     ' Is the herb_description package properly installed?')
+        raise ValueError('Unable to find HERB URDF and SRDF files.')
+
+    if cache is not None:
+        cache.set('herb_model', {
+            'urdf_path': urdf_path,
+            'urdf_mtime': _get_mtime(urdf_path),
+            'srdf_path': srdf_path,
+            'srdf_mtime': _get_mtime(srdf_path),
+        })
+
+    return urdf_path, srdf_path
+
+
+def load_herb_model(env, urdf_path, srdf_path, cache_model=False):
+    """Load HERB into an environment from its URDF and SRDF.
+    If \p cache_model is True, the robot loaded by or_urdf is also saved as a
+    COLLADA file in the cache directory, keyed by the contents of the URDF and
+    SRDF, and that file is loaded on subsequent calls instead of parsing the
+    URDF again.
+    @param env OpenRAVE environment
+    @param urdf_path path to herb.urdf
+    @param srdf_path path to herb.srdf
+    @param cache_model load and save a cached copy of the model
+    @return robot
+    """
+    if cache_model:
+        model_key = hashlib.sha1(hash_file(urdf_path) + hash_file(srdf_path)).hexdigest()
+        model_path = get_cache_path('models', 'herb-{:s}.dae'.format(model_key))
+
+        if os.path.exists(model_path):
+            robot = env.ReadRobotURI(model_path)
+            if robot is not None:
+                env.Add(robot)
+                return robot
+
+            logger.warning('Failed loading cached HERB model "%s". Falling'
+                           ' back on or_urdf.', model_path)
+
+    # Load the URDF file into OpenRAVE.
+    urdf_module = openravepy.RaveCreateModule(env, 'urdf')
+    if urdf_module is None:
+        logger.error('Unable to load or_urdf module. Do you have or_urdf'
+                     ' built and installed in one of your Catkin workspaces?')
+        raise ValueError('Unable to load or_urdf plugin.')
+
+    args = 'Load {:s} {:s}'.format(urdf_path, srdf_path)
+    herb_name = urdf_module.SendCommand(args)
+    if herb_name is None:
+        raise ValueError('Failed loading HERB model using or_urdf.')
+
+    robot = env.GetRobot(herb_name)
+    if robot is None:
+        raise ValueError('Unable to find robot with name "{:s}".'.format(
+                         herb_name))
+
+    if cache_model:
+        # Save to a temporary file first so concurrent readers never load a
+        # partially written model.
+        temp_path = '{:s}.{:d}.dae'.format(model_path, os.getpid())
+        try:
+            env.Save(temp_path, openravepy.Environment.SelectionOptions.Body,
+                     { 'target': robot.GetName() })
+            os.rename(temp_path, model_path)
+        except (openravepy.openrave_exception, OSError) as e:
+            logger.warning('Failed saving HERB model to cache "%s": %s',
+                           model_path, e)
+
+    return robot
@@ -5,75 +5,66 @@ from herbbase import HerbBase
 logger = logging.getLogger('herbpy')
 
 def initialize(robot_xml=None, env_path=None, attach_viewer=False,
-               sim=True, **kw_args):
+               sim=True, use_cache=True, cache_model=False, **kw_args):
+    """Create an OpenRAVE environment containing HERB.
+    @param robot_xml robot XML file; only used with rosbuild
+    @param env_path optional environment XML file to load
+    @param attach_viewer viewer to attach, True for RViz, or False
+    @param sim simulate all of HERB's hardware
+    @param use_cache reuse plugin and model paths found by previous calls
+    @param cache_model load HERB from a cached copy of the model instead of
+           parsing the URDF and SRDF; only used with Catkin
+    @return tuple of environment and robot
+    """
     import prpy, os
+    from discovery import (DiscoveryCache, export_dependencies,
+                           find_herb_model, load_herb_model)
+    from profiler import StartupProfiler
+
+    # Record the time and memory used by each phase of startup. The report is
+    # available as robot.startup_profiler.
+    profiler = StartupProfiler()
 
     prpy.logger.initialize_logging()
 
     # Hide TrajOpt logging.
     os.environ.setdefault('TRAJOPT_LOG_THRESH', 'WARN')
 
+    discovery_cache = DiscoveryCache() if use_cache else None
+
     # Load plugins.
-    if prpy.dependency_manager.is_catkin():
-        prpy.dependency_manager.export()
-    else:
-        prpy.dependency_manager.export(PACKAGE)
-    openravepy.RaveInitialize(True)
+    with profiler.phase('export_dependencies'):
+        if prpy.dependency_manager.is_catkin():
+            export_dependencies(cache=discovery_cache)
+        else:
+            export_dependencies(PACKAGE, cache=discovery_cache)
+    with profiler.phase('RaveInitialize'):
+        openravepy.RaveInitialize(True)
 
     # Create the environment.
-    env = openravepy.Environment()
-    if env_path is not None:
-        if not env.Load(env_path):
-            raise Exception('Unable to load environment frompath %s' % env_path)
+    with profiler.phase('create_environment'):
+        env = openravepy.Environment()
+        if env_path is not None:
+            if not env.Load(env_path):
+                raise Exception('Unable to load environment frompath %s' % env_path)
 
     if prpy.dependency_manager.is_catkin():
         # Find the HERB URDF and SRDF files.
-        from catkin.find_in_workspaces import find_in_workspaces
-        share_directories = find_in_workspaces(search_dirs=['share'],
-                                               project='herb_description')
-        if not share_directories:
-            logger.error('Unable to find the HERB model. Do you have the'
-                         ' package herb_description installed?')
-            raise ValueError('Unable to find HERB model.')
-
-        found_models = False
-        for share_directory in share_directories:
-            urdf_path = os.path.join(share_directories[0], 'robots', 'herb.urdf')
-            srdf_path = os.path.join(share_directories[0], 'robots', 'herb.srdf')
-            if os.path.exists(urdf_path) and os.path.exists(srdf_path):
-                found_models = True
-                break
-
-        if not found_models:
-            logger.error('Missing URDF file and/or SRDF file for HERB.'
-                         ' Is the herb_description package properly installed?')
-            raise ValueError('Unable to find HERB URDF and SRDF files.')
-
-        # Load the URDF file into OpenRAVE.
-        urdf_module = openravepy.RaveCreateModule(env, 'urdf')
-        if urdf_module is None:
-            logger.error('Unable to load or_urdf module. Do you have or_urdf'
-                         ' built and installed in one of your Catkin workspaces?')
-            raise ValueError('Unable to load or_urdf plugin.')
-
-        args = 'Load {:s} {:s}'.format(urdf_path, srdf_path)
-        herb_name = urdf_module.SendCommand(args)
-        if herb_name is None:
-            raise ValueError('Failed loading HERB model using or_urdf.')
-
-        robot = env.GetRobot(herb_name)
-        if robot is None:
-            raise ValueError('Unable to find robot with name "{:s}".'.format(
-                             herb_name))
+        with profiler.phase('find_model'):
+            urdf_path, srdf_path = find_herb_model(cache=discovery_cache)
+        with profiler.phase('load_model'):
+            robot = load_herb_model(env, urdf_path, srdf_path,
+                                    cache_model=cache_model)
     else:
-        if robot_xml is None:
-            import os, rospkg
-            rospack = rospkg.RosPack()
-            base_path = rospack.get_path('herb_description')
-            robot_xml = os.path.join(base_path, 'ordata', 'robots', 'herb.robot.xml')
+        with profiler.phase('load_model'):
+            if robot_xml is None:
+                import os, rospkg
+                rospack = rospkg.RosPack()
+                base_path = rospack.get_path('herb_description')
+                robot_xml = os.path.join(base_path, 'ordata', 'robots', 'herb.robot.xml')
 
-        robot = env.ReadRobotXMLFile(robot_xml)
-        env.Add(robot)
+            robot = env.ReadRobotXMLFile(robot_xml)
+            env.Add(robot)
 
     # Default arguments.
     keys = [ 'left_arm_sim', 'left_hand_sim', 'left_ft_sim',
@@ -84,33 +75,39 @@ def initialize(robot_xml=None, env_path=None, attach_viewer=False,
             kw_args[key] = sim
 
     from herbrobot import HERBRobot
-    prpy.bind_subclass(robot, HERBRobot, **kw_args)
+    with profiler.phase('HERBRobot'):
+        prpy.bind_subclass(robot, HERBRobot, startup_profiler=profiler,
+                           **kw_args)
 
     if sim:
         dof_indices, dof_values \
             = robot.configurations.get_configuration('relaxed_home')
         robot.SetDOFValues(dof_values, dof_indices)
 
-    # Start by attempting to load or_rviz.
-    if attach_viewer == True:
-        attach_viewer = 'rviz'
-        env.SetViewer(attach_viewer)
-
-        # Fall back on qtcoin if loading or_rviz failed
-        if env.GetViewer() is None:
-            logger.warning(
-                'Loading the RViz viewer failed. Do you have or_interactive'
-                ' marker installed? Falling back on qtcoin.')
-            attach_viewer = 'qtcoin'
-
-    if attach_viewer and env.GetViewer() is None:
-        env.SetViewer(attach_viewer)
-        if env.GetViewer() is None:
-            raise Exception('Failed creating viewer of type "{0:s}".'.format(
-                            attach_viewer))
+    with profiler.phase('attach_viewer'):
+        # Start by attempting to load or_rviz.
+        if attach_viewer == True:
+            attach_viewer = 'rviz'
+            env.SetViewer(attach_viewer)
+
+            # Fall back on qtcoin if loading or_rviz failed
+            if env.GetViewer() is None:
+                logger.warning(
+                    'Loading the RViz viewer failed. Do you have or_interactive'
+                    ' marker installed? Falling back on qtcoin.')
+                attach_viewer = 'qtcoin'
+
+        if attach_viewer and env.GetViewer() is None:
+            env.SetViewer(attach_viewer)
+            if env.GetViewer() is None:
+                raise Exception('Failed creating viewer of type "{0:s}".'.format(
+                                attach_viewer))
 
     # Remove the ROS logging handler again. It might have been added when we
     # loaded or_rviz.
     prpy.logger.remove_ros_logger()
 
+    # Planners constructed on first use are recorded after this.
+    profiler.finish()
+
     return env, robot
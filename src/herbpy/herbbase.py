@@ -30,7 +30,8 @@
 
 from prpy.base import MobileBase
 import prpy
-import numpy, logging, openravepy
+import numpy, logging, openravepy, threading
+from inversereachability import InverseReachabilityDatabase, get_database_path
 logger = logging.getLogger('herbpy')
 
 class HerbBase(MobileBase):
@@ -42,9 +43,113 @@ class HerbBase(MobileBase):
                                                  dof_indices=[],
                                                  affine_dofs=openravepy.DOFAffine.Transform,
                                                  simulated=sim)
+        self.inverse_reachability = dict()
+        self._inverse_reachability_lock = threading.Lock()
 
     def CloneBindings(self, parent):
         MobileBase.CloneBindings(self, parent)
+        self.inverse_reachability = parent.inverse_reachability
+        self._inverse_reachability_lock = parent._inverse_reachability_lock
+
+    def GetInverseReachability(self, manip):
+        """Get the inverse reachability database of an arm.
+        The database is loaded from the herbpy cache directory the first time
+        it is requested. Building one takes several minutes, so it is never
+        built here; use scripts/build_inverse_reachability.py to build the
+        databases offline.
+        @param manip manipulator
+        @return InverseReachabilityDatabase
+        @throws ValueError if the database is missing or out of date
+        """
+        with self._inverse_reachability_lock:
+            database = self.inverse_reachability.get(manip.GetName())
+            if database is None:
+                path = get_database_path(manip)
+                database = InverseReachabilityDatabase.load(path, manip)
+                if database is None:
+                    raise ValueError(
+                        'The inverse reachability database of {:s} is missing'
+                        ' or out of date. Build it offline with "rosrun herbpy'
+                        ' build_inverse_reachability.py"; it is saved to'
+                        ' "{:s}".'.format(manip.GetName(), path))
+                self.inverse_reachability[manip.GetName()] = database
+            return database
+
+    def FindBasePoses(self, tsrlist, manip=None, num_samples=100, max_poses=10,
+                      check_collision=True, **query_args):
+        """Find base poses from which an arm can reach a set of TSRs.
+        Poses are sampled from the goal chains in \p tsrlist and looked up in
+        the arm's inverse reachability database.
+        @param tsrlist list of TSR chains, e.g. robot.tsrlibrary(obj, 'grasp')
+        @param manip arm to reach with; defaults to the arm of the first TSR
+        @param num_samples number of end-effector poses to sample
+        @param max_poses maximum number of base poses to return
+        @param check_collision discard base poses where the robot, in its
+               current configuration, is in collision
+        @param **query_args arguments passed to InverseReachabilityDatabase.query
+        @return list of base poses, best first, that can be passed to
+                PlanToBasePose
+        """
+        from tsr.sampling import sample_tsr_chains
+
+        robot = self.robot
+        env = robot.GetEnv()
+        if manip is None:
+            manip = robot.GetManipulators()[tsrlist[0].TSRs[0].manipindex]
+
+        database = self.GetInverseReachability(manip)
+        poses, _ = sample_tsr_chains(tsrlist, num_samples)
+        with env:
+            robot_pose = robot.GetTransform()
+        candidates, scores = database.query(poses, robot_height=robot_pose[2, 3],
+                                            **query_args)
+
+        base_poses = []
+        with env:
+            with robot.CreateRobotStateSaver(
+                    openravepy.KinBody.SaveParameters.LinkTransformation):
+                for (x, y, yaw), score in zip(candidates, scores):
+                    base_pose = openravepy.matrixFromAxisAngle([ 0., 0., yaw ])
+                    base_pose[0:3, 3] = [ x, y, robot_pose[2, 3] ]
+
+                    if check_collision:
+                        robot.SetTransform(base_pose)
+                        if env.CheckCollision(robot) or robot.CheckSelfCollision():
+                            continue
+
+                    base_poses.append(base_pose)
+                    if len(base_poses) >= max_poses:
+                        break
+
+        logger.debug('Found %d base poses out of %d candidates.',
+                     len(base_poses), len(candidates))
+        return base_poses
+
+    def PlanToReachableBasePose(self, tsrlist, manip=None, max_poses=10,
+                                **kw_args):
+        """Drive to a base pose from which an arm can reach a set of TSRs.
+        Base poses returned by FindBasePoses are tried in order until the
+        base planner succeeds.
+        @param tsrlist list of TSR chains, e.g. robot.tsrlibrary(obj, 'grasp')
+        @param manip arm to reach with; defaults to the arm of the first TSR
+        @param max_poses maximum number of base poses to try
+        @param **kw_args arguments passed to PlanToBasePose
+        @return base trajectory
+        """
+        from prpy.planning.base import PlanningError
+
+        base_poses = self.FindBasePoses(tsrlist, manip=manip, max_poses=max_poses)
+        if not base_poses:
+            raise PlanningError('There is no reachable base pose.')
+
+        for base_pose in base_poses:
+            try:
+                return self.PlanToBasePose(base_pose, **kw_args)
+            except PlanningError as e:
+                logger.debug('Failed planning to base pose: %s', e)
+
+        raise PlanningError('Failed planning to any of {:d} reachable base'
+                            ' poses.'.format(len(base_poses)))
 
     def Forward(self, meters, execute=True, timeout=None, **kwargs):
         """Drive forward for the desired distance.
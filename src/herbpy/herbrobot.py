@@ -10,6 +10,25 @@ from prpy.exceptions import PrPyException
 from prpy.planning.base import UnsupportedPlanningError
 from herbbase import HerbBase
 from herbpantilt import HERBPantilt
+from herbwam import HERBWAM
+from bimanual import BimanualPlanner
+from planahead import PlanAheadStatistics, PlanningFuture
+from planning import (
+    AdaptiveSequence,
+    CachedPlanner,
+    ExperiencePlanner,
+    InstrumentedPlanner,
+    LazyPlanner,
+    NamedConfigurationRoadmap,
+    PipelinePool,
+    PlannerRegistry,
+    PlannerTelemetry,
+    Portfolio,
+    RoadmapPlanner,
+)
+from profiler import StartupProfiler
+from reachability import ReachabilityFilter
+from render import RenderPolicy
 
 logger = logging.getLogger('herbpy')
 
@@ -23,12 +42,87 @@ def try_and_warn(fn, exception_type, message, default_value=None):
 
 
 class HERBRobot(Robot):
+    # Planners are built by the planner registry on first access.
+    named_planner = LazyPlanner('named_planner')
+    ik_planner = LazyPlanner('ik_planner')
+    snap_planner = LazyPlanner('snap_planner')
+    vectorfield_planner = LazyPlanner('vectorfield_planner')
+    greedyik_planner = LazyPlanner('greedyik_planner')
+    cbirrt_planner = LazyPlanner('cbirrt_planner')
+    trajopt_planner = LazyPlanner('trajopt_planner')
+    chomp_planner = LazyPlanner('chomp_planner')
+    sbpl_planner = LazyPlanner('sbpl_planner')
+    planner = LazyPlanner('planner')
+    base_planner = LazyPlanner('base_planner')
+
     def __init__(self, left_arm_sim, right_arm_sim, right_ft_sim,
                        left_hand_sim, right_hand_sim, left_ft_sim,
-                       head_sim, talker_sim, segway_sim):
+                       head_sim, talker_sim, segway_sim, lazy_planners=True,
+                       planner_portfolio=False, planning_cache=None,
+                       adaptive_planning=False, ik_cache=False,
+                       reachability_filter=False, named_roadmap=False,
+                       experience_library=None, render_policy=None,
+                       startup_profiler=None):
+        """Bind HERB-specific functionality to an OpenRAVE robot.
+        @param lazy_planners construct each planner the first time it is
+               used; if False, all planners are constructed immediately
+        @param planner_portfolio race the Snap, VectorField, GreedyIK and
+               trajectory optimizer planners concurrently instead of trying
+               them in sequence
+        @param planning_cache PlanningCache used to reuse the results of
+               repeated queries to the default planner; disabled if None
+        @param adaptive_planning reorder the default planning pipeline using
+               the success rate and latency recorded for each planner
+        @param ik_cache cache the IK solutions of the arms on disk; see
+               herbpy.ikcache.IKCache
+        @param reachability_filter ReachabilityFilter used to remove TSR
+               chains the arms can not reach before the grasping actions
+               plan, True to create one, or False to disable it
+        @param named_roadmap NamedConfigurationRoadmap used to reuse paths
+               between named configurations, True to use the one stored in
+               the herbpy cache directory, or False to always plan
+        @param experience_library ExperienceLibrary used to seed the
+               trajectory optimizer with similar past paths; disabled if None
+        @param render_policy RenderPolicy that decides how the actions draw
+               TSRs and directions; by default, they are drawn on a
+               background thread only when a viewer is attached
+        @param startup_profiler StartupProfiler used to record the time spent
+               in each phase of initialization; one is created if None
+        """
         from prpy.util import FindCatkinResource
 
-        Robot.__init__(self, robot_name='herb')
+        if startup_profiler is None:
+            startup_profiler = StartupProfiler()
+        profiler = startup_profiler
+
+        # This must exist before Robot.__init__ assigns any planners.
+        self.startup_profiler = startup_profiler
+        self.planner_registry = PlannerRegistry(profiler=profiler)
+        self.planner_portfolio = planner_portfolio
+        self.planning_cache = planning_cache
+        self.adaptive_planning = adaptive_planning
+        self.planner_telemetry = PlannerTelemetry()
+        self.experience_library = experience_library
+        self.plan_ahead_statistics = PlanAheadStatistics()
+        self.bimanual = BimanualPlanner(self)
+        self.planner_pool = PipelinePool(self.CreatePlanner)
+
+        if reachability_filter is True:
+            reachability_filter = ReachabilityFilter()
+        elif reachability_filter is False:
+            reachability_filter = None
+        self.reachability_filter = reachability_filter
+
+        if render_policy is None:
+            render_policy = RenderPolicy()
+        self.render_policy = render_policy
+
+        # State the grabbed objects were last checked for collision in; see
+        # herbpy.action.grasping.Lift.
+        self.grab_record = None
+
+        with profiler.phase('Robot'):
+            Robot.__init__(self, robot_name='herb')
 
         # Convenience attributes for accessing self components.
         self.left_arm = self.GetManipulator('left')
@@ -40,15 +134,24 @@ class HERBRobot(Robot):
         self.right_hand = self.right_arm.hand
         self.manipulators = [ self.left_arm, self.right_arm, self.head ]
 
-        # Dynamically switch to self-specific subclasses.
-        prpy.bind_subclass(self.left_arm, WAM, sim=left_arm_sim, owd_namespace='/left/owd')
-        prpy.bind_subclass(self.right_arm, WAM, sim=right_arm_sim, owd_namespace='/right/owd')
-        prpy.bind_subclass(self.head, HERBPantilt, sim=head_sim, owd_namespace='/head/owd')
-        prpy.bind_subclass(self.left_arm.hand, BarrettHand, sim=left_hand_sim, manipulator=self.left_arm,
-                           owd_namespace='/left/owd', bhd_namespace='/left/bhd', ft_sim=right_ft_sim)
-        prpy.bind_subclass(self.right_arm.hand, BarrettHand, sim=right_hand_sim, manipulator=self.right_arm,
-                           owd_namespace='/right/owd', bhd_namespace='/right/bhd', ft_sim=right_ft_sim)
-        self.base = HerbBase(sim=segway_sim, robot=self)
+        # Dynamically switch to self-specific subclasses. Binding a WAM also
+        # loads or generates its IK database.
+        with profiler.phase('bind_left_arm'):
+            prpy.bind_subclass(self.left_arm, HERBWAM, sim=left_arm_sim, owd_namespace='/left/owd',
+                               ik_cache=ik_cache)
+        with profiler.phase('bind_right_arm'):
+            prpy.bind_subclass(self.right_arm, HERBWAM, sim=right_arm_sim, owd_namespace='/right/owd',
+                               ik_cache=ik_cache)
+        with profiler.phase('bind_head'):
+            prpy.bind_subclass(self.head, HERBPantilt, sim=head_sim, owd_namespace='/head/owd')
+        with profiler.phase('bind_left_hand'):
+            prpy.bind_subclass(self.left_arm.hand, BarrettHand, sim=left_hand_sim, manipulator=self.left_arm,
+                               owd_namespace='/left/owd', bhd_namespace='/left/bhd', ft_sim=right_ft_sim)
+        with profiler.phase('bind_right_hand'):
+            prpy.bind_subclass(self.right_arm.hand, BarrettHand, sim=right_hand_sim, manipulator=self.right_arm,
+                               owd_namespace='/right/owd', bhd_namespace='/right/bhd', ft_sim=right_ft_sim)
+        with profiler.phase('bind_base'):
+            self.base = HerbBase(sim=segway_sim, robot=self)
 
         # Set HERB's acceleration limits. These are not specified in URDF.
         accel_limits = self.GetDOFAccelerationLimits()
@@ -68,128 +171,229 @@ class HERBRobot(Robot):
         configurations_path = FindCatkinResource('herbpy', 'config/configurations.yaml')
         
         try:
-            self.configurations.load_yaml(configurations_path)
+            with profiler.phase('load_configurations'):
+                self.configurations.load_yaml(configurations_path)
         except IOError as e:
             raise ValueError('Failed laoding named configurations from "{:s}".'.format(
                 configurations_path))
 
-        # Initialize a default planning pipeline.
-        from prpy.planning import (
-            FirstSupported,
-            MethodMask,
-            Ranked,
-            Sequence,
-        )
+        if named_roadmap is True:
+            named_roadmap = NamedConfigurationRoadmap(configurations_path)
+        elif named_roadmap is False:
+            named_roadmap = None
+        self.named_roadmap = named_roadmap
+
+        # Planners are constructed the first time they are used.
+        self._register_planners()
+        if not lazy_planners:
+            with profiler.phase('load_planners'):
+                self.planner_registry.load_all()
+
+        from prpy.planning.retimer import HauserParabolicSmoother
+        self.smoother = HauserParabolicSmoother()
+        # TODO: This should not be HauserParabolicSmoother because it changes the path. This is a temporary
+        # hack because the ParabolicTrajectoryRetimer doesn't work on HERB.
+        self.retimer = HauserParabolicSmoother()
+        self.simplifier = None
+
+        # Create action library
+        from prpy.action import ActionLibrary
+        self.actions = ActionLibrary()
+
+        # Register default actions and TSRs. TSR factories are loaded the
+        # first time they are used.
+        with profiler.phase('register_actions'):
+            import herbpy.action
+        with profiler.phase('register_tsrs'):
+            from herbpy.tsr import HERBTSRLibrary
+            self.tsrlibrary = HERBTSRLibrary(self, robot_name='herb')
+
+        # Setting necessary sim flags
+        self.talker_simulated = talker_sim
+        self.segway_sim = segway_sim
+
+    def CloneBindings(self, parent):
+        from prpy import Cloned
+        # Planners assigned on the clone must not replace the parent's.
+        self.planner_registry = parent.planner_registry.create_child()
+        self.startup_profiler = parent.startup_profiler
+        self.planning_cache = parent.planning_cache
+        self.adaptive_planning = parent.adaptive_planning
+        self.planner_telemetry = parent.planner_telemetry
+        self.reachability_filter = parent.reachability_filter
+        self.render_policy = parent.render_policy
+        self.grab_record = None
+        self.named_roadmap = parent.named_roadmap
+        self.experience_library = parent.experience_library
+        self.plan_ahead_statistics = parent.plan_ahead_statistics
+        self.bimanual = BimanualPlanner(self)
+        self.planner_pool = parent.planner_pool
+        super(HERBRobot, self).CloneBindings(parent)
+        self.left_arm = Cloned(parent.left_arm)
+        self.right_arm = Cloned(parent.right_arm)
+        self.head = Cloned(parent.head)
+        self.left_arm.hand = Cloned(parent.left_arm.GetEndEffector())
+        self.right_arm.hand = Cloned(parent.right_arm.GetEndEffector())
+        self.left_hand = self.left_arm.hand
+        self.right_hand = self.right_arm.hand
+        self.manipulators = [ self.left_arm, self.right_arm, self.head ]
+
+        from herbpy.tsr import HERBTSRLibrary
+        self.tsrlibrary = HERBTSRLibrary(self, robot_name='herb')
+
+    def _register_planners(self):
         from prpy.planning import (
             CBiRRTPlanner,
-            CHOMPPlanner,
             GreedyIKPlanner,
             IKPlanner,
             NamedPlanner,
-            SBPLPlanner,
             SnapPlanner,
-            TSRPlanner,
             VectorFieldPlanner
         )
+        registry = self.planner_registry
 
         # TODO: These should be meta-planners.
-        self.named_planner = NamedPlanner()
-        self.ik_planner = IKPlanner()
+        registry.register('named_planner', NamedPlanner)
+        registry.register('ik_planner', IKPlanner)
 
         # Special-purpose planners.
-        self.snap_planner = SnapPlanner()
-        self.vectorfield_planner = VectorFieldPlanner()
-        self.greedyik_planner = GreedyIKPlanner()
+        registry.register('snap_planner', SnapPlanner)
+        registry.register('vectorfield_planner', VectorFieldPlanner)
+        registry.register('greedyik_planner', GreedyIKPlanner)
 
         # General-purpose planners.
-        self.cbirrt_planner = CBiRRTPlanner()
+        registry.register('cbirrt_planner', CBiRRTPlanner)
+
+        # Trajectory optimizers.
+        registry.register('trajopt_planner', self._create_trajopt_planner)
+        registry.register('chomp_planner', self._create_chomp_planner)
 
-        # Trajectory optimizer.
+        # Default planning pipeline.
+        registry.register('planner', self._create_planner)
+
+        # Base planning.
+        registry.register('sbpl_planner', self._create_sbpl_planner)
+        registry.register('base_planner', lambda: self.sbpl_planner)
+
+    def _create_trajopt_planner(self):
         try:
             from or_trajopt import TrajoptPlanner
-
-            self.trajopt_planner = TrajoptPlanner()
+            return TrajoptPlanner()
         except ImportError:
-            self.trajopt_planner = None
             logger.warning('Failed creating TrajoptPlanner. Is the or_trajopt'
                            ' package in your workspace and built?')
+            return None
+
+    def _create_chomp_planner(self):
+        from prpy.planning import CHOMPPlanner
 
         try:
-            self.chomp_planner = CHOMPPlanner()
+            return CHOMPPlanner()
         except UnsupportedPlanningError:
-            self.chomp_planner = None
             logger.warning('Failed loading the CHOMP module. Is the or_cdchomp'
                            ' package in your workspace and built?')
+            return None
+
+    def _create_planner(self, independent=False):
+        from prpy.planning import (
+            FirstSupported,
+            NamedPlanner,
+            Sequence,
+            TSRPlanner,
+        )
 
-        if not (self.trajopt_planner or self.chomp_planner):
+        # An independent pipeline constructs its own instance of each planner
+        # so it can plan concurrently with the default one. A portfolio also
+        # needs its own instances, since its losing planners keep running
+        # after it returns.
+        registry = self.planner_registry
+        if independent or self.planner_portfolio:
+            get_planner = registry.create
+        else:
+            get_planner = registry.get
+
+        if self.trajopt_planner is not None:
+            optimizer_name, optimizer_key = 'trajopt', 'trajopt_planner'
+        elif self.chomp_planner is not None:
+            optimizer_name, optimizer_key = 'chomp', 'chomp_planner'
+        else:
             raise PrPyException('Unable to load both CHOMP and TrajOpt. At'
                                 ' least one of these packages is required.')
-        
-        actual_planner = Sequence(
-            # First, try the straight-line trajectory.
-            self.snap_planner,
-            # Then, try a few simple (and fast!) heuristics.
-            self.vectorfield_planner,
-            self.greedyik_planner,
-            # Next, try a trajectory optimizer.
-            self.trajopt_planner or self.chomp_planner
-        )
-        self.planner = FirstSupported(
-            Sequence(actual_planner, 
-                     TSRPlanner(delegate_planner=actual_planner),
-                     self.cbirrt_planner),
+
+        # Record the success rate and latency of every planner.
+        def instrument(planner, name):
+            return InstrumentedPlanner(planner, self.planner_telemetry, name)
+
+        if self.adaptive_planning:
+            def sequence(*planners):
+                return AdaptiveSequence(*planners,
+                                        telemetry=self.planner_telemetry)
+        else:
+            sequence = Sequence
+
+        def create_planners(get_planner):
+            optimizer = get_planner(optimizer_key)
+            if self.experience_library is not None:
+                # Seed the optimizer with the nearest stored paths.
+                optimizer = ExperiencePlanner(optimizer,
+                                              self.experience_library)
+
+            return [
+                # First, try the straight-line trajectory.
+                instrument(get_planner('snap_planner'), 'snap'),
+                # Then, try a few simple (and fast!) heuristics.
+                instrument(get_planner('vectorfield_planner'), 'vectorfield'),
+                instrument(get_planner('greedyik_planner'), 'greedyik'),
+                # Next, try a trajectory optimizer.
+                instrument(optimizer, optimizer_name),
+            ]
+
+        planners = create_planners(get_planner)
+
+        if self.planner_portfolio:
+            # Race all of the planners and use whichever succeeds first. The
+            # meta-planners call their delegate while holding the lock of
+            # their cloned environment, which the portfolio's threads would
+            # need to clone it, so they get a sequence of separate instances.
+            actual_planner = Portfolio(*planners)
+            delegate_planner = sequence(*create_planners(registry.create))
+        else:
+            actual_planner = sequence(*planners)
+            delegate_planner = actual_planner
+
+        named_planner = NamedPlanner(delegate_planner=delegate_planner)
+        if self.named_roadmap is not None:
+            # Reuse the paths between named configurations.
+            named_planner = RoadmapPlanner(named_planner, self.named_roadmap)
+
+        planner = FirstSupported(
+            sequence(instrument(actual_planner, 'pipeline'),
+                     instrument(TSRPlanner(delegate_planner=delegate_planner), 'tsr'),
+                     instrument(get_planner('cbirrt_planner'), 'cbirrt')),
             # Special purpose meta-planner.
-            NamedPlanner(delegate_planner=actual_planner),
+            instrument(named_planner, 'named'),
         )
-        
-        from prpy.planning.retimer import HauserParabolicSmoother
-        self.smoother = HauserParabolicSmoother()
-        # TODO: This should not be HauserParabolicSmoother because it changes the path. This is a temporary
-        # hack because the ParabolicTrajectoryRetimer doesn't work on HERB.
-        self.retimer = HauserParabolicSmoother()
-        self.simplifier = None
 
-        # Base planning
+        if self.planning_cache is not None:
+            planner = CachedPlanner(planner, cache=self.planning_cache)
+        return planner
+
+    def _create_sbpl_planner(self):
+        from prpy.planning import SBPLPlanner
         from prpy.util import FindCatkinResource
+        from planning.sbplparams import load_planner_parameters
         planner_parameters_path = FindCatkinResource('herbpy', 'config/base_planner_parameters.yaml')
 
-        self.sbpl_planner = SBPLPlanner()
+        sbpl_planner = SBPLPlanner()
         try:
-            with open(planner_parameters_path, 'rb') as config_file:
-                import yaml
-                params_yaml = yaml.load(config_file)
-            self.sbpl_planner.SetPlannerParameters(params_yaml)
+            with self.startup_profiler.phase('load_parameters'):
+                params_yaml = load_planner_parameters(planner_parameters_path)
+            sbpl_planner.SetPlannerParameters(params_yaml)
         except IOError as e:
             raise ValueError('Failed loading base planner parameters from "{:s}".'.format(
                 planner_parameters_path))
 
-        self.base_planner = self.sbpl_planner
-
-        # Create action library
-        from prpy.action import ActionLibrary
-        self.actions = ActionLibrary()
-
-        # Register default actions and TSRs
-        import herbpy.action
-        import herbpy.tsr
-
-        # Setting necessary sim flags
-        self.talker_simulated = talker_sim
-        self.segway_sim = segway_sim
-
-    def CloneBindings(self, parent):
-        from prpy import Cloned
-        super(HERBRobot, self).CloneBindings(parent)
-        self.left_arm = Cloned(parent.left_arm)
-        self.right_arm = Cloned(parent.right_arm)
-        self.head = Cloned(parent.head)
-        self.left_arm.hand = Cloned(parent.left_arm.GetEndEffector())
-        self.right_arm.hand = Cloned(parent.right_arm.GetEndEffector())
-        self.left_hand = self.left_arm.hand
-        self.right_hand = self.right_arm.hand
-        self.manipulators = [ self.left_arm, self.right_arm, self.head ]
-        self.planner = parent.planner
-        self.base_planner = parent.base_planner
+        return sbpl_planner
 
     def SetStiffness(self, stiffness):
         """Set the stiffness of HERB's arms and head.
@@ -201,6 +405,82 @@ class HERBRobot(Robot):
         self.left_arm.SetStiffness(stiffness)
         self.right_arm.SetStiffness(stiffness)
 
+    def CreatePlanner(self):
+        """Create a planning pipeline that is equivalent to robot.planner
+        but shares no planner instances with it, so the two can plan at the
+        same time. Telemetry, caches and libraries are shared.
+        @return planner
+        """
+        return self._create_planner(independent=True)
+
+    def PlanAhead(self, prediction, method, args=(), kw_args=None, manip=None,
+                  tolerance=0.01):
+        """Start planning a motion in a cloned environment, from the state
+        the robot is predicted to be in when the motion is needed.
+        @param prediction trajectory or function, or a list of them, that
+               moves the cloned robot into the predicted state; see
+               herbpy.planahead.PlanningFuture
+        @param method name of the planning method, e.g. 'PlanToConfiguration'
+        @param args positional arguments of the planning method
+        @param kw_args keyword arguments of the planning method
+        @param manip plan with this manipulator's method instead of the robot's
+        @param tolerance maximum joint error for the plan to be adopted
+        @return PlanningFuture; call result() to get the trajectory
+        """
+        return PlanningFuture(self, method, args=args, kw_args=kw_args,
+                              manip=manip, prediction=prediction,
+                              tolerance=tolerance,
+                              statistics=self.plan_ahead_statistics)
+
+    def ExecuteAndPlanNext(self, path, method, args=(), kw_args=None,
+                           manip=None, prediction=None, **execute_args):
+        """Execute a path while the next motion is planned from its end.
+        The next motion is planned in a cloned environment while \p path
+        executes and is only used if the robot ends where the path does;
+        otherwise it is planned again.
+        @param path path to execute
+        @param method name of the planning method of the next motion
+        @param args positional arguments of the planning method
+        @param kw_args keyword arguments of the planning method
+        @param manip plan with this manipulator's method instead of the robot's
+        @param prediction additional trajectories or functions applied after
+               \p path to predict the state of the robot, e.g. a function
+               that grabs an object
+        @param **execute_args arguments passed to ExecutePath
+        @return trajectory of the next motion
+        """
+        if prediction is None:
+            prediction = []
+        elif not isinstance(prediction, (list, tuple)):
+            prediction = [ prediction ]
+
+        future = self.PlanAhead([ path ] + list(prediction), method, args=args,
+                                kw_args=kw_args, manip=manip)
+        self.ExecutePath(path, **execute_args)
+        return future.result()
+
+    def PlanBimanual(self, left=None, right=None):
+        """Plan motions of both arms that start and finish together.
+        The arms are planned concurrently, each in its own cloned environment,
+        and the paths are merged into one path over both arms. If the arms
+        collide with each other, they move one after the other instead.
+        @param left (method, args, kw_args) tuple of a planning method for the
+               left arm, e.g. ('PlanToNamedConfiguration', ('home',)), or None
+        @param right planning method for the right arm, or None
+        @return untimed path over both arms
+        """
+        return self.bimanual.plan(left=left, right=right)
+
+    def ExecuteBimanual(self, left=None, right=None, **execute_args):
+        """Plan and execute motions of both arms with a synchronized start.
+        @param left planning method for the left arm; see PlanBimanual
+        @param right planning method for the right arm; see PlanBimanual
+        @param **execute_args arguments passed to ExecutePath
+        @return executed trajectory
+        """
+        path = self.PlanBimanual(left=left, right=right)
+        return self.ExecutePath(path, **execute_args)
+
     def DetectObjects(self, 
                       detection_frame='head/kinect2_rgb_optical_frame',
                       destination_frame='map'):
@@ -0,0 +1,51 @@
+import atexit, logging, openravepy
+from prpy.base.wam import WAM
+from ikcache import IKCache
+
+logger = logging.getLogger('herbpy')
+
+
+class HERBWAM(WAM):
+    """WAM arm that answers IK queries from a persistent IKCache.
+
+    Only queries for 4x4 end-effector poses with filter options that the
+    cache can reproduce are cached. All other queries, including those that
+    request IkReturn objects, are passed directly to the IK solver.
+    """
+    def __init__(self, sim, owd_namespace, ik_cache=None, **kw_args):
+        """
+        @param ik_cache IKCache to use, True to create one that is saved in
+               the herbpy cache directory when the process exits, or None or
+               False to disable caching
+        """
+        WAM.__init__(self, sim, owd_namespace, **kw_args)
+
+        if ik_cache is True:
+            ik_cache = IKCache(self)
+            atexit.register(ik_cache.save)
+        elif ik_cache is False:
+            ik_cache = None
+        self.ik_cache = ik_cache
+
+    def CloneBindings(self, parent):
+        WAM.CloneBindings(self, parent)
+        self.ik_cache = parent.ik_cache
+
+    def _solve_ik(self, pose, filter_options):
+        return WAM.FindIKSolutions(self, pose, filter_options)
+
+    def FindIKSolutions(self, param, filteroptions, *args, **kw_args):
+        if (self.ik_cache is None or args or kw_args
+                or not self.ik_cache.is_supported(param, filteroptions)):
+            return WAM.FindIKSolutions(self, param, filteroptions, *args, **kw_args)
+
+        return self.ik_cache.find_solutions(self, param, filteroptions,
+                                            self._solve_ik)
+
+    def FindIKSolution(self, param, filteroptions, *args, **kw_args):
+        if (self.ik_cache is None or args or kw_args
+                or not self.ik_cache.is_supported(param, filteroptions)):
+            return WAM.FindIKSolution(self, param, filteroptions, *args, **kw_args)
+
+        return self.ik_cache.find_solution(self, param, filteroptions,
+                                           self._solve_ik)
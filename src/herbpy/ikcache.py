@@ -0,0 +1,419 @@
+import collections, cPickle, hashlib, logging, threading
+import numpy, openravepy
+from util import atomic_write, get_cache_path
+
+logger = logging.getLogger('herbpy')
+
+
+def get_manipulator_key(manip):
+    """Compute a digest of everything that IK solutions of a manipulator
+    depend on: the kinematic structure of the robot, the IK solver and the
+    manipulator's joint limits.
+    @param manip OpenRAVE manipulator
+    @return hexadecimal digest
+    """
+    robot = manip.GetRobot()
+    arm_indices = manip.GetArmIndices()
+    lower_limits, upper_limits = robot.GetDOFLimits(arm_indices)
+    ik_solver = manip.GetIkSolver()
+
+    digest = hashlib.sha1()
+    digest.update(robot.GetRobotStructureHash())
+    digest.update(manip.GetKinematicsStructureHash())
+    digest.update(ik_solver.GetXMLId() if ik_solver is not None else '')
+    digest.update(numpy.asarray(arm_indices, dtype=numpy.int64).tostring())
+    digest.update(numpy.round(lower_limits, 6).tostring())
+    digest.update(numpy.round(upper_limits, 6).tostring())
+    return digest.hexdigest()
+
+
+class IKCache(object):
+    """Cache of IK solutions of one manipulator indexed by end-effector pose.
+
+    Poses are expressed relative to the manipulator's base link and quantized
+    to \p position_resolution and \p rotation_resolution. Each entry stores
+    the pose that was solved and every solution within the joint limits,
+    without any collision checking or custom filters. A stored pose within
+    the resolution of the requested pose is only a candidate. If forward
+    kinematics confirms that every stored solution reaches the requested pose
+    within \p position_tolerance and \p rotation_tolerance, the query is an
+    exact hit. Otherwise, each stored solution is used as the seed of a damped
+    least-squares Jacobian correction towards the requested pose. If every
+    corrected solution stays within the joint limits and reaches the pose
+    within the same tolerances, the query is a refined hit. If not, the pose
+    is solved again and replaces the entry. Because the environment may have
+    changed, solutions are collision checked and passed through the IK
+    solver's custom filters again on every hit.
+
+    The cache is keyed on the robot's kinematics, the IK solver and the joint
+    limits: if any of them change, the entries on disk are discarded.
+    """
+    VERSION = 3
+
+    # Filter options that can be reproduced on cached solutions.
+    SUPPORTED_FILTER_OPTIONS = (openravepy.IkFilterOptions.CheckEnvCollisions
+                              | openravepy.IkFilterOptions.IgnoreSelfCollisions
+                              | openravepy.IkFilterOptions.IgnoreCustomFilters)
+
+    def __init__(self, manip, path=None, max_size=100000,
+                 position_resolution=0.01, rotation_resolution=0.05,
+                 position_tolerance=1e-5, rotation_tolerance=1e-5,
+                 refine=True, max_iterations=20, damping=1e-3):
+        """
+        @param manip manipulator whose solutions are cached
+        @param path file used to persist the cache; defaults to a file in the
+               herbpy cache directory, False to disable persistence
+        @param max_size maximum number of cached poses
+        @param position_resolution quantization of positions, in meters
+        @param rotation_resolution quantization of unit quaternions
+        @param position_tolerance maximum position error of a cached
+               solution, in meters
+        @param rotation_tolerance maximum difference between the unit
+               quaternions of a cached solution and the requested pose
+        @param refine correct the stored solutions of a nearby pose with the
+               Jacobian; if False, only poses that the stored solutions
+               already reach are hits
+        @param max_iterations maximum number of Jacobian steps per solution
+        @param damping damping factor of the least-squares steps
+        """
+        self.manipulator_name = manip.GetName()
+        self.key = get_manipulator_key(manip)
+        # Custom filters can only be run on cached solutions if the IK
+        # solver's bindings expose them.
+        ik_solver = manip.GetIkSolver()
+        self._can_call_filters = (ik_solver is not None
+                                  and hasattr(ik_solver, 'CallFilters'))
+        self.max_size = max_size
+        self.position_resolution = position_resolution
+        self.rotation_resolution = rotation_resolution
+        self.position_tolerance = position_tolerance
+        self.rotation_tolerance = rotation_tolerance
+        self.refine = refine
+        self.max_iterations = max_iterations
+        self.damping = damping
+        self.hits = 0
+        self.refined_hits = 0
+        self.misses = 0
+        self.rejections = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._modified = False
+
+        if path is None:
+            path = get_cache_path('ik', '{:s}-{:s}-{:s}.pkl'.format(
+                manip.GetRobot().GetName(), self.manipulator_name,
+                self.key[:8]))
+        self.path = path or None
+
+        if self.path is not None:
+            self.load(self.path)
+
+    def _get_relative_pose(self, manip, pose):
+        base_pose = manip.GetBase().GetTransform()
+        return numpy.dot(numpy.linalg.inv(base_pose), pose)
+
+    def _get_quaternion(self, pose):
+        quaternion = openravepy.quatFromRotationMatrix(pose[0:3, 0:3])
+        # q and -q represent the same rotation.
+        if quaternion[0] < 0.:
+            quaternion = -quaternion
+        return quaternion
+
+    def _get_key(self, relative_pose):
+        position = numpy.round(relative_pose[0:3, 3] / self.position_resolution)
+        quaternion = numpy.round(self._get_quaternion(relative_pose)
+                                 / self.rotation_resolution)
+        return tuple(position.astype(int)) + tuple(quaternion.astype(int))
+
+    def _is_close(self, pose_a, pose_b, position_tolerance,
+                  rotation_tolerance):
+        position_error = numpy.linalg.norm(pose_a[0:3, 3] - pose_b[0:3, 3])
+        quaternion_a = self._get_quaternion(pose_a)
+        quaternion_b = self._get_quaternion(pose_b)
+        rotation_error = numpy.linalg.norm(quaternion_a - quaternion_b)
+        return (position_error <= position_tolerance
+            and rotation_error <= rotation_tolerance)
+
+    def _reaches(self, manip, pose, relative_pose, entry):
+        """Check that the solutions of an entry reach a pose. The solutions
+        are checked with forward kinematics; an entry without solutions only
+        matches its own pose."""
+        stored_pose, solutions = entry
+        if len(solutions) == 0:
+            return self._is_close(stored_pose, relative_pose,
+                                  self.position_tolerance,
+                                  self.rotation_tolerance)
+
+        robot = manip.GetRobot()
+        arm_indices = manip.GetArmIndices()
+        with robot.GetEnv():
+            p = openravepy.KinBody.SaveParameters
+            with robot.CreateRobotStateSaver(p.LinkTransformation):
+                for solution in solutions:
+                    robot.SetDOFValues(solution, arm_indices)
+                    if not self._is_close(manip.GetEndEffectorTransform(), pose,
+                                          self.position_tolerance,
+                                          self.rotation_tolerance):
+                        return False
+        return True
+
+    def _refine(self, manip, pose, solutions):
+        """Move the solutions of a nearby pose onto a pose with damped
+        least-squares steps on the manipulator's Jacobian.
+        @param manip manipulator
+        @param pose end-effector pose in the world frame
+        @param solutions array of solutions, one per row
+        @return array of corrected solutions, or None if any of them leaves
+                the joint limits or does not converge
+        """
+        robot = manip.GetRobot()
+        arm_indices = manip.GetArmIndices()
+        refined = numpy.array(solutions, dtype=float)
+        damping = self.damping ** 2 * numpy.eye(6)
+
+        with robot.GetEnv():
+            lower_limits, upper_limits = robot.GetDOFLimits(arm_indices)
+            p = openravepy.KinBody.SaveParameters
+            with robot.CreateRobotStateSaver(p.LinkTransformation):
+                for solution in refined:
+                    for _ in xrange(self.max_iterations + 1):
+                        robot.SetDOFValues(solution, arm_indices)
+                        ee_pose = manip.GetEndEffectorTransform()
+                        if self._is_close(ee_pose, pose,
+                                          self.position_tolerance,
+                                          self.rotation_tolerance):
+                            break
+
+                        error = numpy.concatenate((
+                            pose[0:3, 3] - ee_pose[0:3, 3],
+                            openravepy.axisAngleFromRotationMatrix(numpy.dot(
+                                pose[0:3, 0:3], ee_pose[0:3, 0:3].T))))
+                        jacobian = numpy.vstack((
+                            manip.CalculateJacobian(),
+                            manip.CalculateAngularVelocityJacobian()))
+                        solution += numpy.dot(jacobian.T, numpy.linalg.solve(
+                            numpy.dot(jacobian, jacobian.T) + damping, error))
+
+                        if (numpy.any(solution < lower_limits)
+                                or numpy.any(solution > upper_limits)):
+                            return None
+                    else:
+                        return None
+        return refined
+
+    def _get_arm_links(self, manip):
+        """Get the links that the arm moves, other than the end-effector's."""
+        robot = manip.GetRobot()
+        joint_indices = [ robot.GetJointFromDOFIndex(dof_index).GetJointIndex()
+                          for dof_index in manip.GetArmIndices() ]
+        end_effector_links = set(link.GetIndex()
+                                 for link in manip.GetChildLinks())
+        return [ link for link in robot.GetLinks()
+                 if link.GetIndex() not in end_effector_links
+                 and any(robot.DoesAffect(joint_index, link.GetIndex())
+                         for joint_index in joint_indices) ]
+
+    def _passes_custom_filters(self, manip, pose):
+        """Run the IK filters registered on the manipulator's IK solver on the
+        robot's current configuration."""
+        ik_param = openravepy.IkParameterization(
+            pose, openravepy.IkParameterizationType.Transform6D)
+        result = manip.GetIkSolver().CallFilters(ik_param)
+        action = getattr(result, '_action', result)
+        return int(action) == int(openravepy.IkReturnAction.Success)
+
+    def _filter(self, manip, pose, solutions, filter_options):
+        """Remove the solutions that the IK solver would have rejected. This
+        makes the same checks as the solver's IkFilterOptions: the links that
+        do not move with the arm, the end-effector and its grabbed objects and
+        the arm's links are checked against the environment, the whole robot
+        against itself, and the IK solver's custom filters are called.
+        @param manip manipulator
+        @param pose end-effector pose in the world frame
+        @param solutions array of solutions, one per row
+        @param filter_options IkFilterOptions requested by the caller
+        @return array of valid solutions
+        """
+        options = openravepy.IkFilterOptions
+        check_env = filter_options & options.CheckEnvCollisions
+        check_self = not (filter_options & options.IgnoreSelfCollisions)
+        check_custom = not (filter_options & options.IgnoreCustomFilters)
+        if not (check_env or check_self or check_custom) or len(solutions) == 0:
+            return solutions
+
+        robot = manip.GetRobot()
+        env = robot.GetEnv()
+        arm_indices = manip.GetArmIndices()
+        valid = []
+
+        with env:
+            if check_env and manip.CheckIndependentCollision():
+                return numpy.zeros((0, len(arm_indices)))
+            arm_links = self._get_arm_links(manip) if check_env else []
+
+            p = openravepy.KinBody.SaveParameters
+            with robot.CreateRobotStateSaver(p.LinkTransformation):
+                for solution in solutions:
+                    robot.SetDOFValues(solution, arm_indices)
+                    if check_env and (manip.CheckEndEffectorCollision()
+                            or any(env.CheckCollision(link) for link in arm_links)):
+                        continue
+                    if check_self and robot.CheckSelfCollision():
+                        continue
+                    if check_custom and not self._passes_custom_filters(manip, pose):
+                        continue
+                    valid.append(solution)
+
+        return numpy.array(valid).reshape((-1, len(arm_indices)))
+
+    def is_supported(self, pose, filter_options):
+        """Check whether a query can be answered by the cache.
+        @param pose IK goal passed to FindIKSolution(s)
+        @param filter_options IkFilterOptions
+        @return True if the query can use the cache
+        """
+        if not (self._can_call_filters or filter_options
+                & openravepy.IkFilterOptions.IgnoreCustomFilters):
+            return False
+        return (isinstance(pose, numpy.ndarray) and pose.shape == (4, 4)
+            and not (filter_options & ~self.SUPPORTED_FILTER_OPTIONS))
+
+    def find_solutions(self, manip, pose, filter_options, solve):
+        """Find all IK solutions for an end-effector pose.
+        @param manip manipulator
+        @param pose end-effector pose in the world frame
+        @param filter_options IkFilterOptions
+        @param solve function that takes a pose and filter options and
+               returns all solutions, used on a cache miss
+        @return array of solutions, one per row
+        """
+        relative_pose = self._get_relative_pose(manip, pose)
+        key = self._get_key(relative_pose)
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+
+        solutions = None
+        refined = False
+        if entry is not None and self._is_close(entry[0], relative_pose,
+                                                self.position_resolution,
+                                                self.rotation_resolution):
+            if self._reaches(manip, pose, relative_pose, entry):
+                solutions = entry[1]
+            elif self.refine and len(entry[1]) > 0:
+                solutions = self._refine(manip, pose, entry[1])
+                refined = solutions is not None
+
+        with self._lock:
+            if solutions is not None:
+                self.hits += 1
+                if refined:
+                    self.refined_hits += 1
+            else:
+                self.misses += 1
+                if entry is not None:
+                    self.rejections += 1
+        if solutions is not None:
+            return self._filter(manip, pose, solutions, filter_options)
+
+        # Solve without collision checking or custom filters, so the solutions
+        # are valid in any environment, and filter them afterwards.
+        solutions = solve(pose, openravepy.IkFilterOptions.IgnoreSelfCollisions
+                              | openravepy.IkFilterOptions.IgnoreCustomFilters)
+        if solutions is None:
+            solutions = numpy.zeros((0, len(manip.GetArmIndices())))
+        solutions = numpy.array(solutions)
+
+        with self._lock:
+            self._entries[key] = (relative_pose, solutions)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._modified = True
+
+        return self._filter(manip, pose, solutions, filter_options)
+
+    def find_solution(self, manip, pose, filter_options, solve):
+        """Find the collision-free IK solution closest to the current
+        configuration of the manipulator.
+        @param manip manipulator
+        @param pose end-effector pose in the world frame
+        @param filter_options IkFilterOptions
+        @param solve function used on a cache miss; see find_solutions
+        @return solution or None if there is no solution
+        """
+        solutions = self.find_solutions(manip, pose, filter_options, solve)
+        if len(solutions) == 0:
+            return None
+
+        robot = manip.GetRobot()
+        with robot.GetEnv():
+            current = robot.GetDOFValues(manip.GetArmIndices())
+        distances = numpy.sum((solutions - current) ** 2, axis=1)
+        return solutions[numpy.argmin(distances)]
+
+    def load(self, path):
+        """Load entries from a file. Files created for a different robot,
+        IK solver or joint limits are ignored.
+        @param path file created by save
+        """
+        try:
+            with open(path, 'rb') as cache_file:
+                version, key, entries = cPickle.load(cache_file)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            return
+
+        if version != self.VERSION or key != self.key:
+            logger.info('Discarding IK cache "%s" for a different model.', path)
+            return
+
+        with self._lock:
+            for pose_key, entry in entries:
+                self._entries[pose_key] = entry
+
+        logger.debug('Loaded %d IK cache entries for %s from "%s".',
+                     len(entries), self.manipulator_name, path)
+
+    def save(self, path=None):
+        """Write the cache to a file if it has been modified.
+        @param path output path; defaults to the path passed to the constructor
+        """
+        if path is None:
+            path = self.path
+        if path is None:
+            return
+
+        with self._lock:
+            if not self._modified and path == self.path:
+                return
+            entries = self._entries.items()
+            self._modified = False
+
+        with atomic_write(path) as cache_file:
+            cPickle.dump((self.VERSION, self.key, entries), cache_file,
+                         cPickle.HIGHEST_PROTOCOL)
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._modified = True
+            self.hits = self.refined_hits = self.misses = self.rejections = 0
+
+    def get_statistics(self):
+        """Get the hit rate of the cache. Hits include refined hits.
+        @return dictionary of statistics
+        """
+        queries = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'refined_hits': self.refined_hits,
+            'misses': self.misses,
+            'rejections': self.rejections,
+            'hit_rate': float(self.hits) / queries if queries else 0.,
+        }
+
+    def __len__(self):
+        return len(self._entries)
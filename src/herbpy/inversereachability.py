@@ -0,0 +1,222 @@
+import logging
+import numpy, openravepy
+from ikcache import get_manipulator_key
+from util import atomic_write, get_cache_path
+
+logger = logging.getLogger('herbpy')
+
+
+def get_database_path(manip):
+    """Get the path of the inverse reachability database of a manipulator.
+    @param manip manipulator
+    @return path in the herbpy cache directory
+    """
+    return get_cache_path('inversereachability', '{:s}-{:s}-{:s}.npz'.format(
+        manip.GetRobot().GetName(), manip.GetName(),
+        get_manipulator_key(manip)[:8]))
+
+
+def _describe_poses(poses):
+    """Split end-effector poses into a part that does not change when the
+    robot rotates about the vertical axis and the planar frame it rotates.
+
+    The invariant part is the height of the end-effector and the direction of
+    gravity in the end-effector frame. The planar frame is located below the
+    end-effector and its yaw is the heading of the end-effector axis that is
+    closest to horizontal. Poses are only comparable if they use the same
+    axis to define the yaw.
+
+    @param poses array of shape (N, 4, 4)
+    @return tuple of heights (N,), gravity directions (N, 3), yaw axes (N,),
+            positions (N, 2) and yaws (N,)
+    """
+    rotations = poses[:, 0:3, 0:3]
+    gravity = rotations[:, 2, :]
+    axes = numpy.argmin(numpy.abs(gravity), axis=1)
+    headings = rotations[numpy.arange(len(poses)), 0:2, axes]
+    yaws = numpy.arctan2(headings[:, 1], headings[:, 0])
+    return poses[:, 2, 3], gravity, axes, poses[:, 0:2, 3], yaws
+
+
+def _rotate(yaws, vectors):
+    c, s = numpy.cos(yaws), numpy.sin(yaws)
+    return numpy.column_stack((c * vectors[:, 0] - s * vectors[:, 1],
+                               s * vectors[:, 0] + c * vectors[:, 1]))
+
+
+class InverseReachabilityDatabase(object):
+    """Database of base poses from which an arm can reach end-effector poses.
+
+    The database is built offline by sampling collision-free configurations
+    of the arm. For each sample it stores the height and tilt of the
+    end-effector and the planar pose of the robot relative to the
+    end-effector. A query looks up the samples whose end-effector has the
+    same height and tilt as the query pose and transforms their relative
+    robot poses into the world frame. Base poses are ranked by how many of
+    the query poses they can reach.
+    """
+    VERSION = 1
+
+    # Base position bins are packed into integer keys for ranking. This
+    # supports positions up to _KEY_OFFSET bins from the world origin.
+    _KEY_OFFSET = 1 << 20
+    _KEY_SCALE = 1 << 21
+
+    def __init__(self, key, heights, gravity, axes, offsets):
+        """
+        @param key manipulator key the database was built for
+        @param heights array of shape (N,) of end-effector heights above the
+               robot origin, sorted in increasing order
+        @param gravity array of shape (N, 3) of the vertical axis in the
+               end-effector frame
+        @param axes array of shape (N,) of end-effector axes used for yaw
+        @param offsets array of shape (N, 3) of the x, y and yaw of the robot
+               relative to the planar frame of the end-effector
+        """
+        self.key = key
+        self.heights = heights
+        self.gravity = gravity
+        self.axes = axes
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.heights)
+
+    @classmethod
+    def build(cls, manip, num_configurations=200000):
+        """Build a database by sampling configurations of an arm. This takes
+        several minutes and should be done offline.
+        @param manip manipulator
+        @param num_configurations number of configurations to sample; only
+               configurations without self-collision are stored
+        @return InverseReachabilityDatabase
+        """
+        robot = manip.GetRobot()
+        env = robot.GetEnv()
+        arm_indices = manip.GetArmIndices()
+        lower_limits, upper_limits = robot.GetDOFLimits(arm_indices)
+        configurations = lower_limits + (upper_limits - lower_limits) \
+            * numpy.random.random_sample((num_configurations, len(arm_indices)))
+
+        logger.info('Building the inverse reachability database of %s from'
+                    ' %d samples.', manip.GetName(), num_configurations)
+
+        poses = []
+        with env:
+            p = openravepy.KinBody.SaveParameters
+            with robot.CreateRobotStateSaver(p.LinkTransformation):
+                robot_inv = numpy.linalg.inv(robot.GetTransform())
+                for q in configurations:
+                    robot.SetDOFValues(q, arm_indices)
+                    if not robot.CheckSelfCollision():
+                        poses.append(numpy.dot(robot_inv,
+                                               manip.GetEndEffectorTransform()))
+
+        if not poses:
+            raise ValueError('All sampled configurations are in self-collision.')
+
+        heights, gravity, axes, positions, yaws = _describe_poses(numpy.array(poses))
+        offsets = numpy.column_stack((_rotate(-yaws, -positions), -yaws))
+
+        order = numpy.argsort(heights)
+        return cls(get_manipulator_key(manip),
+                   heights[order].astype(numpy.float32),
+                   gravity[order].astype(numpy.float32),
+                   axes[order].astype(numpy.int8),
+                   offsets[order].astype(numpy.float32))
+
+    @classmethod
+    def load(cls, path, manip=None):
+        """Load a database from a file.
+        @param path file written by save()
+        @param manip manipulator the database must have been built for; the
+               key is not checked if None
+        @return InverseReachabilityDatabase, or None if the file does not
+                exist or is out of date
+        """
+        try:
+            archive = numpy.load(path)
+            if int(archive['version']) != cls.VERSION:
+                return None
+            key = str(archive['key'])
+            if manip is not None and key != get_manipulator_key(manip):
+                logger.warning('Ignoring out of date inverse reachability'
+                               ' database "%s".', path)
+                return None
+            return cls(key, archive['heights'], archive['gravity'],
+                       archive['axes'], archive['offsets'])
+        except (IOError, KeyError, ValueError):
+            return None
+
+    def save(self, path):
+        """Save the database to a compressed file.
+        @param path output file
+        """
+        with atomic_write(path) as archive_file:
+            numpy.savez_compressed(archive_file, version=self.VERSION,
+                key=self.key, heights=self.heights, gravity=self.gravity,
+                axes=self.axes, offsets=self.offsets)
+
+    def query(self, poses, robot_height=0., height_tolerance=0.02,
+              angle_tolerance=0.1, xy_resolution=0.05,
+              yaw_resolution=numpy.pi / 16., max_matches=500):
+        """Find base poses from which the arm can reach end-effector poses.
+        @param poses array of shape (N, 4, 4) of end-effector poses in the
+               world frame, e.g. sampled from a grasp TSR
+        @param robot_height height of the robot origin in the world frame
+        @param height_tolerance maximum difference in end-effector height
+        @param angle_tolerance maximum angle between the end-effector tilts
+        @param xy_resolution size of the bins used to rank base positions
+        @param yaw_resolution size of the bins used to rank base headings
+        @param max_matches maximum number of samples used per query pose
+        @return tuple of an array of shape (M, 3) of base x, y and yaw in
+                the world frame and an array of shape (M,) of the fraction of
+                query poses each can reach, sorted by decreasing score
+        """
+        poses = numpy.array(poses, dtype=float)
+        poses[:, 2, 3] -= robot_height
+        heights, gravity, axes, positions, yaws = _describe_poses(poses)
+        min_cos = numpy.cos(angle_tolerance)
+        num_yaw_bins = int(numpy.ceil(2. * numpy.pi / yaw_resolution))
+
+        lower = numpy.searchsorted(self.heights, heights - height_tolerance)
+        upper = numpy.searchsorted(self.heights, heights + height_tolerance)
+
+        keys = []
+        for i in xrange(len(poses)):
+            candidates = slice(lower[i], upper[i])
+            matches = (self.axes[candidates] == axes[i]) \
+                & (numpy.dot(self.gravity[candidates], gravity[i]) >= min_cos)
+            offsets = self.offsets[candidates][matches][:max_matches]
+            if not len(offsets):
+                continue
+
+            base_yaws = yaws[i] + offsets[:, 2]
+            base_xy = positions[i] + _rotate(numpy.full(len(offsets), yaws[i]),
+                                             offsets[:, 0:2])
+            xy_bins = numpy.floor(base_xy / xy_resolution).astype(numpy.int64)
+            yaw_bins = numpy.floor(numpy.mod(base_yaws, 2. * numpy.pi)
+                                   / yaw_resolution).astype(numpy.int64)
+            pose_keys = ((xy_bins[:, 0] + self._KEY_OFFSET) * self._KEY_SCALE
+                         + xy_bins[:, 1] + self._KEY_OFFSET) * num_yaw_bins \
+                        + numpy.minimum(yaw_bins, num_yaw_bins - 1)
+            # Each query pose votes at most once for each bin.
+            keys.append(numpy.unique(pose_keys))
+
+        if not keys:
+            return numpy.empty((0, 3)), numpy.empty((0,))
+
+        unique_keys, inverse = numpy.unique(numpy.concatenate(keys),
+                                            return_inverse=True)
+        counts = numpy.bincount(inverse)
+        order = numpy.argsort(-counts, kind='mergesort')
+        unique_keys, counts = unique_keys[order], counts[order]
+
+        xy_keys, yaw_bins = numpy.divmod(unique_keys, num_yaw_bins)
+        x_bins, y_bins = numpy.divmod(xy_keys, self._KEY_SCALE)
+        base_poses = numpy.column_stack((
+            (x_bins - self._KEY_OFFSET + 0.5) * xy_resolution,
+            (y_bins - self._KEY_OFFSET + 0.5) * xy_resolution,
+            (yaw_bins + 0.5) * yaw_resolution,
+        ))
+        return base_poses, counts / float(len(poses))
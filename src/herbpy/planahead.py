@@ -0,0 +1,261 @@
+"""
+Plan the next motion of a sequence while the current one executes.
+
+A PlanningFuture clones the environment, moves the cloned robot into the
+state it is predicted to be in when the current motion finishes, and calls a
+planning method in the clone on a background thread. When the result is
+requested, it is adopted only if the prediction still holds: the robot must
+be within tolerance of the predicted configuration, hold the same objects,
+and the path must be collision-free in the live environment. Otherwise the
+query is planned again from the robot's actual state.
+
+The background thread plans with a pipeline borrowed from
+robot.planner_pool, so it never shares planner instances with robot.planner
+or with other futures.
+
+    path = robot.right_arm.PlanToNamedConfiguration('relaxed_home', execute=False)
+    traj = robot.ExecuteAndPlanNext(path, 'PlanToNamedConfiguration',
+                                    args=('home',), manip=robot.right_arm)
+    robot.ExecutePath(traj)
+"""
+import logging, threading, time
+import numpy, openravepy
+from planning.trajectories import (
+    deserialize_trajectory,
+    get_dof_indices,
+    get_waypoints,
+    is_path_collision_free,
+    serialize_trajectory,
+    set_start_configuration,
+)
+
+logger = logging.getLogger('herbpy')
+
+
+def clone_value(value, env):
+    """Replace KinBodies and manipulators in planning arguments by their
+    counterparts in a cloned environment.
+    @param value argument; lists, tuples and dictionaries are searched
+    @param env cloned environment
+    @return argument that refers to objects in \p env
+    """
+    from prpy.clone import Cloned
+
+    if isinstance(value, (openravepy.KinBody, openravepy.Robot.Manipulator)):
+        return Cloned(value, into=env)
+    elif isinstance(value, list):
+        return [ clone_value(element, env) for element in value ]
+    elif isinstance(value, tuple):
+        return tuple(clone_value(element, env) for element in value)
+    elif isinstance(value, dict):
+        return dict((key, clone_value(element, env))
+                    for key, element in value.iteritems())
+    else:
+        return value
+
+
+def _apply_prediction(robot, prediction):
+    """Move a robot into the state predicted by a list of trajectories and
+    functions. Trajectories move the robot to their last waypoint; functions
+    are called with the robot."""
+    for step in prediction:
+        if callable(step):
+            step(robot)
+        else:
+            dof_indices = get_dof_indices(step)
+            waypoints = get_waypoints(step, robot, dof_indices)
+            if len(waypoints):
+                robot.SetDOFValues(waypoints[-1], dof_indices)
+
+
+class PlanAheadStatistics(object):
+    """Counts how often plans made ahead of time are adopted."""
+    def __init__(self):
+        self.futures = 0
+        self.adopted = 0
+        self.rejected = 0
+        self.overlapped_time = 0.
+        self._lock = threading.Lock()
+
+    def record(self, adopted, overlapped_time):
+        with self._lock:
+            self.futures += 1
+            if adopted:
+                self.adopted += 1
+                self.overlapped_time += overlapped_time
+            else:
+                self.rejected += 1
+
+    def get_statistics(self):
+        """Get the number of futures, how many of them were adopted, and the
+        planning time that overlapped with other work.
+        @return dictionary of statistics
+        """
+        with self._lock:
+            return {
+                'futures': self.futures,
+                'adopted': self.adopted,
+                'rejected': self.rejected,
+                'overlapped_time': self.overlapped_time,
+            }
+
+
+class PlanningFuture(object):
+    """Planning query that runs in a cloned environment on a background
+    thread, starting from a predicted state of the robot."""
+    def __init__(self, robot, method, args=(), kw_args=None, manip=None,
+                 prediction=None, tolerance=0.01, statistics=None):
+        """Clone the environment and start planning.
+        @param robot robot to plan for
+        @param method name of a planning method, e.g. 'PlanToConfiguration'
+        @param args positional arguments of the planning method
+        @param kw_args keyword arguments of the planning method
+        @param manip plan with this manipulator's method instead of the
+               robot's
+        @param prediction trajectory or function, or a list of them, that
+               describes the state of the robot when the result is used;
+               trajectories move the cloned robot to their last waypoint and
+               functions are called with the cloned robot, e.g. to grab an
+               object
+        @param tolerance maximum difference, in radians, between the
+               predicted and actual joint values for the result to be adopted
+        @param statistics optional PlanAheadStatistics to update
+        """
+        from prpy.clone import Clone, Cloned
+
+        if prediction is None:
+            prediction = []
+        elif not isinstance(prediction, (list, tuple)):
+            prediction = [ prediction ]
+
+        self.robot = robot
+        self.method = method
+        self.args = tuple(args)
+        self.kw_args = dict(kw_args or dict())
+        self.kw_args['execute'] = False
+        self.manip = manip
+        self.tolerance = tolerance
+        self.statistics = statistics
+        self.planning_time = None
+        self.adopted = None
+
+        self._data = None
+        self._exception = None
+        self._start_time = time.time()
+        self._end_time = None
+
+        # The clone is a snapshot of the environment at the time of the call.
+        # It is not locked while planning, so that a Portfolio can clone it.
+        self._clone = Clone(robot.GetEnv(), lock=False)
+        cloned_env = self._clone.clone_env
+        with cloned_env:
+            cloned_robot = Cloned(robot, into=cloned_env)
+            _apply_prediction(cloned_robot, prediction)
+            self.predicted_values = cloned_robot.GetDOFValues()
+            self.predicted_grabbed = sorted(body.GetName()
+                                            for body in cloned_robot.GetGrabbed())
+
+            target = cloned_robot
+            if manip is not None:
+                target = Cloned(manip, into=cloned_env)
+            planning_args = clone_value(self.args, cloned_env)
+            planning_kw_args = clone_value(self.kw_args, cloned_env)
+
+        self._thread = threading.Thread(
+            target=self._run, name='PlanningFuture({:s})'.format(method),
+            args=(cloned_robot, target, planning_args, planning_kw_args))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, cloned_robot, target, args, kw_args):
+        try:
+            # The clone has its own planner registry, so this only replaces
+            # the clone's planner. Planning methods bind robot.planner when
+            # they are looked up, so the method is looked up afterwards.
+            with self.robot.planner_pool.get() as planner, self._clone:
+                cloned_robot.planner = planner
+                traj = getattr(target, self.method)(*args, **kw_args)
+                self._data = serialize_trajectory(traj)
+        except Exception as e:
+            self._exception = e
+        finally:
+            self._end_time = time.time()
+            self.planning_time = self._end_time - self._start_time
+
+    def done(self):
+        """Check whether planning has finished.
+        @return True if the result is ready
+        """
+        return not self._thread.is_alive()
+
+    def _prediction_holds(self):
+        robot = self.robot
+        with robot.GetEnv():
+            values = robot.GetDOFValues()
+            grabbed = sorted(body.GetName() for body in robot.GetGrabbed())
+
+        if grabbed != self.predicted_grabbed:
+            logger.info('Rejecting the plan made ahead of time: the robot is'
+                        ' holding %s instead of %s.', grabbed,
+                        self.predicted_grabbed)
+            return False
+
+        difference = robot.SubtractDOFValues(values, self.predicted_values)
+        if numpy.any(numpy.abs(difference) > self.tolerance):
+            logger.info('Rejecting the plan made ahead of time: the robot is'
+                        ' not in the predicted configuration.')
+            return False
+
+        return True
+
+    def _replan(self):
+        target = self.robot if self.manip is None else self.manip
+        return getattr(target, self.method)(*self.args, **self.kw_args)
+
+    def result(self, timeout=None, replan=True):
+        """Wait for the plan and adopt it if the prediction holds.
+        @param timeout maximum time to wait, in seconds; None to wait forever
+        @param replan plan again from the current state if the prediction
+               does not hold or planning failed; otherwise raise
+        @return OpenRAVE trajectory in the robot's environment
+        @throws PlanningError if planning fails
+        """
+        from prpy.planning.base import PlanningError
+
+        request_time = time.time()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            raise PlanningError('Timed out waiting for {:s} after {:.3f}'
+                                ' seconds.'.format(self.method, timeout))
+
+        traj = None
+        if self._exception is not None:
+            logger.info('Planning ahead of time failed: %s', self._exception)
+        elif self._prediction_holds():
+            robot = self.robot
+            traj = deserialize_trajectory(robot.GetEnv(), self._data)
+            dof_indices = get_dof_indices(traj)
+            with robot.GetEnv():
+                set_start_configuration(traj, robot, dof_indices,
+                                        robot.GetDOFValues(dof_indices))
+
+            if not is_path_collision_free(robot, traj, dof_indices):
+                logger.info('Rejecting the plan made ahead of time: it is in'
+                            ' collision.')
+                traj = None
+
+        self.adopted = traj is not None
+        if self.statistics is not None:
+            overlapped_time = max(0., min(self._end_time, request_time)
+                                      - self._start_time)
+            self.statistics.record(self.adopted, overlapped_time)
+
+        if traj is not None:
+            return traj
+        elif replan:
+            return self._replan()
+        elif self._exception is not None:
+            raise self._exception
+        else:
+            raise PlanningError('The prediction for {:s} did not hold.'.format(
+                                self.method))
@@ -0,0 +1,6 @@
+from cache import CachedPlanner, PlanningCache
+from experience import ExperienceLibrary, ExperiencePlanner
+from portfolio import Portfolio
+from registry import LazyPlanner, PipelinePool, PlannerRegistry
+from roadmap import NamedConfigurationRoadmap, RoadmapPlanner, build_roadmap
+from telemetry import AdaptiveSequence, InstrumentedPlanner, PlannerTelemetry
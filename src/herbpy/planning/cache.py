@@ -0,0 +1,314 @@
+import atexit, collections, cPickle, hashlib, logging, threading, time
+import numpy
+from prpy.planning.base import MetaPlanner
+from herbpy.util import atomic_write
+from trajectories import (
+    deserialize_trajectory,
+    is_path_collision_free,
+    serialize_trajectory,
+)
+
+logger = logging.getLogger('herbpy')
+
+
+def fingerprint(value, digest=None, resolution=1e-6):
+    """Compute a digest of a planning query argument.
+    Floating point values are quantized to \p resolution. TSRs and TSR chains
+    are identified by their parameters and KinBodies and manipulators by name.
+    Objects without a known representation fall back on repr().
+    @param value value to fingerprint
+    @param digest optional hashlib object to update
+    @param resolution quantization of floating point values
+    @return hashlib object
+    """
+    if digest is None:
+        digest = hashlib.sha1()
+
+    def update(value):
+        if value is None or isinstance(value, (bool, int, long, basestring)):
+            digest.update(repr(value))
+        elif isinstance(value, float):
+            digest.update(repr(int(round(value / resolution))))
+        elif isinstance(value, numpy.ndarray):
+            quantized = numpy.round(numpy.asarray(value, dtype=float) / resolution)
+            digest.update(repr(value.shape))
+            digest.update(quantized.astype(numpy.int64).tostring())
+        elif isinstance(value, (list, tuple)):
+            digest.update('[')
+            for element in value:
+                update(element)
+                digest.update(',')
+            digest.update(']')
+        elif isinstance(value, dict):
+            digest.update('{')
+            for key in sorted(value.keys()):
+                update(key)
+                digest.update(':')
+                update(value[key])
+            digest.update('}')
+        elif hasattr(value, 'TSRs'):
+            # TSRChain
+            digest.update('TSRChain')
+            update([ value.sample_start, value.sample_goal, value.constrain ])
+            update(list(value.TSRs))
+        elif hasattr(value, 'Tw_e') and hasattr(value, 'Bw'):
+            # TSR
+            digest.update('TSR')
+            update([ value.T0_w, value.Tw_e, value.Bw, value.manipindex,
+                     getattr(value, 'bodyandlink', None) ])
+        elif hasattr(value, 'GetName'):
+            # KinBody, Robot, Manipulator, or Link
+            digest.update(type(value).__name__)
+            digest.update(value.GetName())
+        else:
+            digest.update(repr(value))
+
+    update(value)
+    return digest
+
+
+def fingerprint_environment(robot, digest=None, resolution=1e-6):
+    """Compute a digest of the state of the robot's environment.
+    This includes the geometry, pose, joint values and enabled state of every
+    body, the robot's active DOFs and manipulator, and any grabbed objects.
+    @param robot robot whose environment should be fingerprinted
+    @param digest optional hashlib object to update
+    @param resolution quantization of floating point values
+    @return hashlib object
+    """
+    if digest is None:
+        digest = hashlib.sha1()
+
+    env = robot.GetEnv()
+    with env:
+        for body in sorted(env.GetBodies(), key=lambda body: body.GetName()):
+            fingerprint([
+                body.GetName(),
+                body.GetKinematicsGeometryHash(),
+                body.IsEnabled(),
+                body.GetTransform(),
+                body.GetDOFValues(),
+            ], digest=digest, resolution=resolution)
+
+        fingerprint([
+            robot.GetActiveDOFIndices(),
+            robot.GetAffineDOF(),
+            robot.GetActiveManipulatorIndex(),
+            sorted(body.GetName() for body in robot.GetGrabbed()),
+        ], digest=digest, resolution=resolution)
+
+    return digest
+
+
+class PlanningCache(object):
+    """Least-recently-used cache of serialized trajectories.
+
+    The cache is thread-safe. If \p path is specified, entries are loaded
+    from the file when the cache is created. Modified entries are written back
+    when an entry is added at least \p save_interval seconds after the last
+    write, when save is called, and when the process exits.
+    """
+    VERSION = 1
+
+    def __init__(self, max_size=256, path=None, resolution=1e-6,
+                 save_interval=60.):
+        """
+        @param max_size maximum number of cached trajectories
+        @param path optional file used to persist the cache
+        @param resolution quantization of configurations and poses in keys
+        @param save_interval minimum number of seconds between writes to
+               \p path when entries are added, or None to only write when
+               save is called and when the process exits
+        """
+        self.max_size = max_size
+        self.path = path
+        self.resolution = resolution
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._modified = False
+        self._save_time = time.time()
+
+        if path is not None:
+            self.load(path)
+            atexit.register(self.save)
+
+    def get_key(self, method, robot, args, kw_args):
+        """Compute the cache key of a planning query.
+        @param method name of the planning method
+        @param robot robot passed to the planning method
+        @param args remaining positional arguments
+        @param kw_args keyword arguments
+        @return key
+        """
+        digest = hashlib.sha1(method)
+        fingerprint([ list(args), kw_args ], digest=digest,
+                    resolution=self.resolution)
+        fingerprint_environment(robot, digest=digest,
+                                resolution=self.resolution)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Get a serialized trajectory and mark it as recently used.
+        @param key cache key
+        @return serialized trajectory or None
+        """
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._entries[key] = data
+            return data
+
+    def add(self, key, data):
+        """Add a serialized trajectory, evicting the least recently used entry
+        if the cache is full.
+        @param key cache key
+        @param data serialized trajectory
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = data
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._modified = True
+            save = (self.path is not None and self.save_interval is not None
+                    and time.time() - self._save_time >= self.save_interval)
+
+        if save:
+            self.save()
+
+    def discard(self, key):
+        """Remove an entry from the cache.
+        @param key cache key
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._modified = True
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._modified = True
+            self.hits = self.misses = self.invalidations = 0
+
+    def update_statistics(self, hits=0, misses=0, invalidations=0):
+        """Add to the hit, miss and invalidation counters.
+        @param hits number of hits
+        @param misses number of misses
+        @param invalidations number of cached trajectories found invalid
+        """
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.invalidations += invalidations
+
+    def load(self, path):
+        """Load entries from a file. Missing or incompatible files are ignored.
+        @param path file created by save
+        """
+        try:
+            with open(path, 'rb') as cache_file:
+                version, entries = cPickle.load(cache_file)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            return
+
+        if version != self.VERSION:
+            logger.warning('Ignoring planning cache "%s" with version %s.',
+                           path, version)
+            return
+
+        with self._lock:
+            for key, data in entries:
+                self._entries[key] = data
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def save(self, path=None):
+        """Write all entries to a file if the cache has been modified.
+        @param path output path; defaults to the path passed to the constructor
+        """
+        if path is None:
+            path = self.path
+        if path is None:
+            return
+
+        with self._lock:
+            if not self._modified and path == self.path:
+                return
+            entries = self._entries.items()
+            if path == self.path:
+                self._modified = False
+                self._save_time = time.time()
+
+        with atomic_write(path) as cache_file:
+            cPickle.dump((self.VERSION, entries), cache_file,
+                         cPickle.HIGHEST_PROTOCOL)
+
+    def get_statistics(self):
+        """Get the hit and miss counters.
+        @return dictionary of statistics
+        """
+        with self._lock:
+            queries = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': float(self.hits) / queries if queries else 0.,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedPlanner(MetaPlanner):
+    """Meta-planner that reuses the results of identical planning queries.
+
+    Queries are keyed by the planning method, its arguments and a fingerprint
+    of the environment, including the robot's start configuration. On a hit,
+    the cached trajectory is checked for collision before it is returned;
+    if the check fails the entry is discarded and the delegate planner is
+    called instead.
+    """
+    def __init__(self, delegate_planner, cache=None, validate=True):
+        """
+        @param delegate_planner planner used on a cache miss
+        @param cache PlanningCache; a new in-memory cache is created if None
+        @param validate collision check cached trajectories before use
+        """
+        super(CachedPlanner, self).__init__()
+        self.delegate_planner = delegate_planner
+        self.cache = cache if cache is not None else PlanningCache()
+        self.validate = validate
+        self._planners = [ delegate_planner ]
+
+    def __str__(self):
+        return 'CachedPlanner({:s})'.format(str(self.delegate_planner))
+
+    def plan(self, method, args, kw_args):
+        robot = args[0]
+        key = self.cache.get_key(method, robot, args[1:], kw_args)
+
+        data = self.cache.get(key)
+        if data is not None:
+            traj = deserialize_trajectory(robot.GetEnv(), data)
+            if not self.validate or is_path_collision_free(robot, traj):
+                self.cache.update_statistics(hits=1)
+                logger.debug('Planning cache hit for %s.', method)
+                return traj
+
+            logger.info('Cached trajectory for %s is in collision. Replanning.',
+                        method)
+            self.cache.update_statistics(invalidations=1)
+            self.cache.discard(key)
+
+        self.cache.update_statistics(misses=1)
+        traj = getattr(self.delegate_planner, method)(*args, **kw_args)
+        self.cache.add(key, serialize_trajectory(traj))
+        return traj
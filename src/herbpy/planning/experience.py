@@ -0,0 +1,289 @@
+import collections, cPickle, logging, threading
+import numpy, openravepy
+from prpy.planning.base import MetaPlanner, PlanningError
+from herbpy.util import atomic_write
+from trajectories import create_path, get_waypoints
+
+logger = logging.getLogger('herbpy')
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+def adapt_waypoints(waypoints, start, goal):
+    """Deform a path so that it starts and ends at new configurations.
+    The offsets at the start and goal are blended linearly along the path,
+    weighted by the distance travelled.
+    @param waypoints array with one row per waypoint
+    @param start new start configuration
+    @param goal new goal configuration
+    @return array of the same shape as \p waypoints
+    """
+    waypoints = numpy.asarray(waypoints, dtype=float)
+    lengths = numpy.linalg.norm(numpy.diff(waypoints, axis=0), axis=1)
+    total_length = numpy.sum(lengths)
+    if total_length > 0.:
+        s = numpy.concatenate(([ 0. ], numpy.cumsum(lengths))) / total_length
+    else:
+        s = numpy.linspace(0., 1., len(waypoints))
+
+    start_offset = numpy.asarray(start) - waypoints[0]
+    goal_offset = numpy.asarray(goal) - waypoints[-1]
+    return waypoints + numpy.outer(1. - s, start_offset) + numpy.outer(s, goal_offset)
+
+
+class ExperienceLibrary(object):
+    """Library of paths indexed by their start and goal configurations.
+
+    Paths are grouped by the DOFs they move. Within a group, the nearest
+    paths to a query are found with a KD-tree over the concatenated start
+    and goal configurations. The tree is rebuilt lazily after the group
+    changes. The library holds at most \p max_size paths and evicts the
+    least recently used path when it is full.
+    """
+    VERSION = 1
+
+    def __init__(self, max_size=1000, path=None):
+        """
+        @param max_size maximum number of paths
+        @param path optional file to load paths from
+        """
+        if cKDTree is None:
+            logger.warning('Failed importing scipy.spatial.cKDTree. The'
+                           ' experience library will fall back on a linear'
+                           ' search.')
+
+        self.max_size = max_size
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._groups = dict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        if path is not None:
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get_group(self, dof_indices):
+        key = tuple(int(i) for i in dof_indices)
+        group = self._groups.get(key)
+        if group is None:
+            group = { 'ids': [], 'tree': None, 'points': None }
+            self._groups[key] = group
+        return group
+
+    def _invalidate(self, dof_indices):
+        group = self._get_group(dof_indices)
+        group['tree'] = None
+        group['points'] = None
+
+    def add(self, dof_indices, waypoints):
+        """Add a path to the library.
+        @param dof_indices DOFs the path moves
+        @param waypoints array with one row per waypoint
+        """
+        waypoints = numpy.array(waypoints, dtype=float)
+        if len(waypoints) < 2:
+            return
+
+        dof_indices = tuple(int(i) for i in dof_indices)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (dof_indices, waypoints)
+            self._get_group(dof_indices)['ids'].append(entry_id)
+            self._invalidate(dof_indices)
+
+            while len(self._entries) > self.max_size:
+                old_id, (old_indices, _) = self._entries.popitem(last=False)
+                self._get_group(old_indices)['ids'].remove(old_id)
+                self._invalidate(old_indices)
+                self.evictions += 1
+
+    def query(self, dof_indices, start, goal, k=1):
+        """Find the paths whose start and goal are nearest to a query.
+        The paths are marked as recently used.
+        @param dof_indices DOFs of the query
+        @param start start configuration
+        @param goal goal configuration
+        @param k maximum number of paths to return
+        @return list of arrays of waypoints, nearest first
+        """
+        point = numpy.concatenate((start, goal))
+
+        with self._lock:
+            group = self._get_group(dof_indices)
+            if not group['ids']:
+                return []
+
+            if group['points'] is None:
+                group['points'] = numpy.array([
+                    numpy.concatenate((self._entries[i][1][0],
+                                       self._entries[i][1][-1]))
+                    for i in group['ids'] ])
+                if cKDTree is not None:
+                    group['tree'] = cKDTree(group['points'])
+
+            k = min(k, len(group['ids']))
+            if group['tree'] is not None:
+                _, indices = group['tree'].query(point, k=k)
+                indices = numpy.atleast_1d(indices)
+            else:
+                distances = numpy.linalg.norm(group['points'] - point, axis=1)
+                indices = numpy.argsort(distances)[:k]
+
+            results = []
+            for index in indices:
+                entry_id = group['ids'][index]
+                entry = self._entries.pop(entry_id)
+                self._entries[entry_id] = entry
+                results.append(entry[1])
+            return results
+
+    def clear(self):
+        """Remove all paths."""
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def load(self, path):
+        """Load paths from a file. Missing or incompatible files are ignored.
+        @param path file created by save
+        """
+        try:
+            with open(path, 'rb') as library_file:
+                version, entries = cPickle.load(library_file)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            return
+
+        if version != self.VERSION:
+            logger.warning('Ignoring experience library "%s" with version %s.',
+                           path, version)
+            return
+
+        for dof_indices, waypoints in entries:
+            self.add(dof_indices, waypoints)
+
+    def save(self, path):
+        """Write all paths to a file, least recently used first.
+        @param path output path
+        """
+        with self._lock:
+            entries = self._entries.values()
+
+        with atomic_write(path) as library_file:
+            cPickle.dump((self.VERSION, entries), library_file,
+                         cPickle.HIGHEST_PROTOCOL)
+
+
+class ExperiencePlanner(MetaPlanner):
+    """Meta-planner that seeds a trajectory optimizer from past solutions.
+
+    PlanToConfiguration queries are first answered by optimizing the \p k
+    nearest paths in the library, deformed to the query's start and goal,
+    with the optimizer's OptimizeTrajectory method. The optimizer does not
+    constrain the endpoints of the seed, so an optimized path is only used if
+    it starts and ends within \p tolerance of the query. If no path is stored
+    or none of the seeds converges to the query, the optimizer plans from its
+    default seed. Every path the optimizer returns is added to the library.
+    """
+    def __init__(self, delegate_planner, library, k=1, tolerance=1e-3):
+        """
+        @param delegate_planner trajectory optimizer, e.g. TrajOpt or CHOMP
+        @param library ExperienceLibrary
+        @param k number of stored paths to try as seeds
+        @param tolerance maximum difference of each DOF between the ends of
+               an optimized seed and the query's start and goal
+        """
+        super(ExperiencePlanner, self).__init__()
+        self.delegate_planner = delegate_planner
+        self.library = library
+        self.k = k
+        self.tolerance = tolerance
+        self.warm_starts = 0
+        self.cold_starts = 0
+        self.seed_failures = 0
+        self._planners = [ delegate_planner ]
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return 'ExperiencePlanner({:s})'.format(str(self.delegate_planner))
+
+    def plan(self, method, args, kw_args):
+        robot = args[0]
+        with robot.GetEnv():
+            dof_indices = robot.GetActiveDOFIndices()
+            start = robot.GetActiveDOFValues()
+
+        if (method == 'PlanToConfiguration'
+                and self.delegate_planner.has_planning_method('OptimizeTrajectory')):
+            goal = numpy.asarray(args[1] if len(args) > 1 else kw_args['goal'])
+            other_kw_args = dict(kw_args)
+            other_kw_args.pop('goal', None)
+
+            for waypoints in self.library.query(dof_indices, start, goal, k=self.k):
+                seed = create_path(robot, adapt_waypoints(waypoints, start, goal))
+                try:
+                    traj = self.delegate_planner.OptimizeTrajectory(
+                        robot, seed, **other_kw_args)
+                except PlanningError as e:
+                    logger.debug('Failed optimizing a stored path: %s', e)
+                    self.update_statistics(seed_failures=1)
+                    continue
+
+                with robot.GetEnv():
+                    optimized = get_waypoints(traj, robot, dof_indices)
+                if not (len(optimized)
+                        and numpy.allclose(optimized[0], start, rtol=0.,
+                                           atol=self.tolerance)
+                        and numpy.allclose(optimized[-1], goal, rtol=0.,
+                                           atol=self.tolerance)):
+                    logger.debug('Optimized a stored path that does not reach'
+                                 ' the goal.')
+                    self.update_statistics(seed_failures=1)
+                    continue
+
+                self.update_statistics(warm_starts=1)
+                self._record(robot, traj, dof_indices)
+                return traj
+
+            self.update_statistics(cold_starts=1)
+
+        traj = getattr(self.delegate_planner, method)(*args, **kw_args)
+        self._record(robot, traj, dof_indices)
+        return traj
+
+    def _record(self, robot, traj, dof_indices):
+        with robot.GetEnv():
+            self.library.add(dof_indices, get_waypoints(traj, robot, dof_indices))
+
+    def update_statistics(self, warm_starts=0, cold_starts=0, seed_failures=0):
+        """Add to the warm start, cold start and seed failure counters.
+        @param warm_starts number of queries solved from a stored path
+        @param cold_starts number of queries solved from the default seed
+        @param seed_failures number of stored paths that did not converge
+        """
+        with self._lock:
+            self.warm_starts += warm_starts
+            self.cold_starts += cold_starts
+            self.seed_failures += seed_failures
+
+    def get_statistics(self):
+        """Get the number of queries solved from a stored path and from the
+        default seed.
+        @return dictionary of statistics
+        """
+        with self._lock:
+            statistics = {
+                'warm_starts': self.warm_starts,
+                'cold_starts': self.cold_starts,
+                'seed_failures': self.seed_failures,
+            }
+        statistics['paths'] = len(self.library)
+        statistics['evictions'] = self.library.evictions
+        return statistics
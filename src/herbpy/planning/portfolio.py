@@ -0,0 +1,164 @@
+import logging, threading, time
+from prpy.planning.base import (
+    MetaPlanner,
+    MetaPlanningError,
+    PlanningError,
+    UnsupportedPlanningError,
+)
+
+logger = logging.getLogger('herbpy')
+
+
+class Portfolio(MetaPlanner):
+    """Race several planners and return the first successful result.
+
+    Every planner that supports the requested planning method is called in
+    its own thread. Each prpy planner plans in a clone of the environment that
+    it owns, so the planners run concurrently without interfering with each
+    other. As soon as one planner succeeds its trajectory is returned and the
+    remaining planners are abandoned: prpy planners cannot be interrupted, so
+    they run to completion in the background and their results are discarded.
+
+    A planner that is still running for an earlier query is not called again
+    until it finishes, and is skipped if the new query has been answered by
+    then. This only protects against the portfolio's own calls, so a member
+    must not be shared with any other planner, e.g. robot.planner; construct
+    dedicated instances with PlannerRegistry.create.
+
+    Each planner needs to lock the environment briefly to clone the robot, so
+    the planners can only run concurrently if the environment is not locked
+    when a planning method is called. If another thread can not lock it
+    within \p lock_timeout seconds, e.g. because the caller holds the lock,
+    the planners are called one after another on the calling thread instead.
+    A portfolio should not be the delegate of a meta-planner such as
+    TSRPlanner or NamedPlanner, which always call their delegate while
+    holding the lock of their cloned environment.
+    """
+    # Maximum time to wait for a result if none is specified, in seconds.
+    DEFAULT_TIMEOUT = 60.
+
+    def __init__(self, *planners, **kw_args):
+        """
+        @param *planners planners to race
+        @param timeout maximum time to wait for a result, in seconds; defaults
+               to DEFAULT_TIMEOUT, or None to wait indefinitely
+        @param lock_timeout maximum time to wait for another thread to lock
+               the environment before planning sequentially, in seconds
+        """
+        super(Portfolio, self).__init__()
+        self._planners = planners
+        self._planner_locks = dict((planner, threading.Lock())
+                                   for planner in planners)
+        self.timeout = kw_args.pop('timeout', self.DEFAULT_TIMEOUT)
+        self.lock_timeout = kw_args.pop('lock_timeout', 0.1)
+
+        if kw_args:
+            raise TypeError('Unexpected keyword arguments: {:s}'.format(
+                            ', '.join(kw_args.keys())))
+
+    def __str__(self):
+        return 'Portfolio({:s})'.format(', '.join(map(str, self._planners)))
+
+    def plan(self, method, args, kw_args):
+        planners = [ planner for planner in self._planners
+                     if planner.has_planning_method(method) ]
+        if not planners:
+            raise UnsupportedPlanningError(
+                'No planner in the portfolio supports "{:s}".'.format(method))
+
+        env = args[0].GetEnv() if args else None
+        if env is not None and not self._can_lock(env):
+            logger.info('The environment is locked; calling the planners in'
+                        ' the portfolio one after another.')
+            return self._plan_sequentially(planners, method, args, kw_args)
+
+        condition = threading.Condition()
+        results = []
+        errors = dict()
+        finished = threading.Event()
+
+        def call_planner(planner):
+            try:
+                # Wait for the planner to finish any query it was abandoned in.
+                with self._planner_locks[planner]:
+                    if finished.is_set():
+                        return
+                    result = getattr(planner, method)(*args, **kw_args)
+                error = None
+            except PlanningError as e:
+                result, error = None, e
+            except Exception as e:
+                logger.exception('Planner %s raised an unexpected exception.',
+                                 planner)
+                result, error = None, e
+
+            with condition:
+                if error is None:
+                    results.append((planner, result))
+                else:
+                    logger.warning('Planning with %s failed: %s', planner, error)
+                    errors[planner] = error
+                condition.notify_all()
+
+        for planner in planners:
+            thread = threading.Thread(target=call_planner, args=(planner,),
+                                      name='Portfolio-' + str(planner))
+            thread.daemon = True
+            thread.start()
+
+        start_time = time.time()
+        try:
+            return self._wait(planners, condition, results, errors, start_time)
+        finally:
+            finished.set()
+
+    def _can_lock(self, env):
+        """Check whether another thread can lock the environment. If it can
+        not, the probe keeps waiting for the lock in the background and
+        releases it as soon as it gets it."""
+        locked = threading.Event()
+
+        def probe():
+            with env:
+                locked.set()
+
+        thread = threading.Thread(target=probe, name='Portfolio-probe')
+        thread.daemon = True
+        thread.start()
+        return locked.wait(self.lock_timeout)
+
+    def _plan_sequentially(self, planners, method, args, kw_args):
+        errors = dict()
+        for planner in planners:
+            try:
+                with self._planner_locks[planner]:
+                    return getattr(planner, method)(*args, **kw_args)
+            except PlanningError as e:
+                logger.warning('Planning with %s failed: %s', planner, e)
+                errors[planner] = e
+
+        raise MetaPlanningError('All planners failed.', errors)
+
+    def _wait(self, planners, condition, results, errors, start_time):
+        with condition:
+            while not results and len(errors) < len(planners):
+                if self.timeout is None:
+                    # Waiting without a timeout blocks KeyboardInterrupt.
+                    condition.wait(1.)
+                else:
+                    remaining_time = self.timeout - (time.time() - start_time)
+                    if remaining_time <= 0.:
+                        break
+                    condition.wait(remaining_time)
+
+            if results:
+                planner, result = results[0]
+                logger.info('Portfolio returning the result of %s after'
+                            ' %.3f seconds.', planner, time.time() - start_time)
+                return result
+
+        if len(errors) < len(planners):
+            raise MetaPlanningError('Portfolio timed out after {:.3f} seconds.'.format(
+                                    self.timeout), errors)
+        else:
+            raise MetaPlanningError('All planners failed.', errors)
@@ -0,0 +1,201 @@
+import contextlib, logging, threading, time
+
+logger = logging.getLogger('herbpy')
+
+
+class PlannerRegistry(object):
+    """Collection of planners that are only constructed when first used.
+
+    Each planner is registered under a name with a factory function that
+    takes no arguments and returns the planner. Factories may look up other
+    planners in the same registry, e.g. to compose a meta-planner.
+
+    A registry may have a parent, e.g. the registry of the robot a clone was
+    made from. Planners that are neither registered nor assigned in the child
+    are looked up in the parent, so they are shared, but planners registered
+    or assigned in the child never affect the parent.
+    """
+    def __init__(self, profiler=None, parent=None):
+        """
+        @param profiler optional StartupProfiler that records the
+               construction of each planner as a "planner:<name>" phase
+        @param parent optional PlannerRegistry used for planners that are not
+               registered or assigned in this one
+        """
+        self.profiler = profiler
+        self.parent = parent
+        self._factories = dict()
+        self._instances = dict()
+        self._load_times = dict()
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        """Register a factory for a planner.
+        Any previously constructed or assigned planner with the same name is
+        discarded.
+        @param name name of the planner
+        @param factory function that returns the planner
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+            self._load_times.pop(name, None)
+
+    def get(self, name):
+        """Get a planner, constructing it if this is the first use.
+        @param name name of the planner
+        @return planner
+        """
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            if name not in self._factories and self.parent is not None:
+                return self.parent.get(name)
+
+            try:
+                factory = self._factories[name]
+            except KeyError:
+                raise AttributeError('There is no planner named "{:s}".'.format(name))
+
+            start_time = time.time()
+            if self.profiler is None:
+                planner = factory()
+            else:
+                with self.profiler.phase('planner:' + name):
+                    planner = factory()
+            self._load_times[name] = time.time() - start_time
+            self._instances[name] = planner
+
+            logger.debug('Constructed planner "%s" in %.3f seconds.',
+                         name, self._load_times[name])
+            return planner
+
+    def set(self, name, planner):
+        """Assign a planner, overriding its factory.
+        @param name name of the planner
+        @param planner planner to use
+        """
+        with self._lock:
+            self._instances[name] = planner
+
+    def create(self, name):
+        """Construct a new instance of a planner without caching it.
+        @param name name of the planner
+        @return new planner
+        """
+        if name not in self._factories and self.parent is not None:
+            return self.parent.create(name)
+        return self._factories[name]()
+
+    def create_child(self):
+        """Create a registry that shares this one's planners, but keeps the
+        planners registered or assigned in it to itself.
+        @return new PlannerRegistry
+        """
+        return PlannerRegistry(profiler=self.profiler, parent=self)
+
+    def load_all(self):
+        """Construct every registered planner."""
+        if self.parent is not None:
+            self.parent.load_all()
+        with self._lock:
+            for name in self._factories.keys():
+                self.get(name)
+
+    def is_loaded(self, name):
+        """Check whether a planner has already been constructed.
+        @param name name of the planner
+        @return True if the planner exists
+        """
+        if name in self._instances:
+            return True
+        return (name not in self._factories and self.parent is not None
+                and self.parent.is_loaded(name))
+
+    def get_names(self):
+        """Get the names of all registered planners."""
+        names = set(self._factories.keys()) | set(self._instances.keys())
+        if self.parent is not None:
+            names.update(self.parent.get_names())
+        return sorted(names)
+
+    def get_load_times(self):
+        """Get the time spent constructing each planner.
+        @return dictionary of planner name to construction time in seconds
+        """
+        load_times = dict()
+        if self.parent is not None:
+            load_times.update(self.parent.get_load_times())
+        load_times.update(self._load_times)
+        return load_times
+
+
+class PipelinePool(object):
+    """Bounded set of independent planning pipelines that are reused.
+
+    Constructing a pipeline creates a new instance of every planner in it,
+    each with its own OpenRAVE environment, so pipelines are kept and handed
+    out again instead of being constructed for every call. At most
+    \p max_size pipelines are constructed; callers wait for one to be
+    returned when all of them are in use.
+    """
+    def __init__(self, factory, max_size=4):
+        """
+        @param factory function that returns a new pipeline
+        @param max_size maximum number of pipelines
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self._idle = []
+        self._num_created = 0
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def get(self):
+        """Borrow a pipeline that no other caller is using.
+        @return context manager that yields the pipeline
+        """
+        with self._condition:
+            while not self._idle and self._num_created >= self.max_size:
+                self._condition.wait()
+
+            if self._idle:
+                planner = self._idle.pop()
+            else:
+                planner = None
+                self._num_created += 1
+
+        if planner is None:
+            try:
+                planner = self.factory()
+            except:
+                with self._condition:
+                    self._num_created -= 1
+                    self._condition.notify()
+                raise
+
+        try:
+            yield planner
+        finally:
+            with self._condition:
+                self._idle.append(planner)
+                self._condition.notify()
+
+    def __len__(self):
+        return self._num_created
+
+
+class LazyPlanner(object):
+    """Descriptor that exposes a planner in the owner's PlannerRegistry.
+    The owner must store the registry in its \p planner_registry attribute.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.planner_registry.get(self.name)
+
+    def __set__(self, instance, planner):
+        instance.planner_registry.set(self.name, planner)
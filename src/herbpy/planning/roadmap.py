@@ -0,0 +1,281 @@
+import cPickle, hashlib, logging, threading
+import numpy, openravepy, yaml
+from prpy.planning.base import MetaPlanner
+from herbpy.util import atomic_write, get_cache_path
+from trajectories import (
+    deserialize_trajectory,
+    is_path_collision_free,
+    serialize_trajectory,
+    set_start_configuration,
+)
+
+logger = logging.getLogger('herbpy')
+
+
+class NamedConfigurationRoadmap(object):
+    """Library of paths between the named configurations in a YAML file.
+
+    Each entry is a path between two named configurations that was returned
+    by a planner, keyed by the names of its start and goal and the DOFs it
+    moves. A path from A to B is also used, reversed, from B to A. Entries
+    are written to disk as they are added and are discarded when the YAML
+    file changes.
+    """
+    VERSION = 1
+
+    def __init__(self, configurations_path, path=None, tolerance=0.01):
+        """
+        @param configurations_path YAML file of named configurations
+        @param path file the roadmap is stored in; defaults to a file in the
+               herbpy cache directory, False to only keep it in memory
+        @param tolerance maximum difference, in radians, between the robot's
+               joint values and a named configuration for the robot to be
+               considered in that configuration
+        """
+        with open(configurations_path, 'rb') as configurations_file:
+            data = configurations_file.read()
+
+        configurations = yaml.safe_load(data).get('configurations') or dict()
+        self.names = sorted(configurations.keys())
+        self.digest = hashlib.sha1(data).hexdigest()
+        self.tolerance = tolerance
+
+        if path is None:
+            path = get_cache_path('roadmap', 'named_configurations.pkl')
+        self.path = path
+
+        self.hits = 0
+        self.misses = 0
+        self.replans = 0
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+        if path:
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _get_key(start, goal, dof_indices):
+        return (start, goal, tuple(int(i) for i in dof_indices))
+
+    def find_configuration(self, robot, dof_indices):
+        """Find the named configuration the robot is currently in.
+        @param robot robot with a ConfigurationLibrary
+        @param dof_indices only consider configurations of these DOFs
+        @return name of the configuration, or None if there is none
+        """
+        dof_indices = list(dof_indices)
+
+        with robot.GetEnv():
+            current_values = robot.GetDOFValues(dof_indices)
+
+        for name in self.names:
+            indices, values = robot.configurations.get_configuration(name)
+            if list(indices) != dof_indices:
+                continue
+
+            difference = robot.SubtractDOFValues(current_values, values,
+                                                 dof_indices)
+            if numpy.all(numpy.abs(difference) <= self.tolerance):
+                return name
+        return None
+
+    def get(self, env, start, goal, dof_indices):
+        """Get the stored path between two named configurations.
+        @param env environment that will own the trajectory
+        @param start name of the start configuration
+        @param goal name of the goal configuration
+        @param dof_indices DOFs of the configurations
+        @return OpenRAVE trajectory, or None if there is no entry
+        """
+        with self._lock:
+            data = self._entries.get(self._get_key(start, goal, dof_indices))
+            reverse_data = self._entries.get(self._get_key(goal, start, dof_indices))
+
+        if data is not None:
+            return deserialize_trajectory(env, data)
+        elif reverse_data is not None:
+            return openravepy.planningutils.ReverseTrajectory(
+                deserialize_trajectory(env, reverse_data))
+        else:
+            return None
+
+    def add(self, start, goal, dof_indices, traj):
+        """Store the path between two named configurations.
+        @param start name of the start configuration
+        @param goal name of the goal configuration
+        @param dof_indices DOFs of the configurations
+        @param traj OpenRAVE trajectory
+        """
+        with self._lock:
+            self._entries[self._get_key(start, goal, dof_indices)] = \
+                serialize_trajectory(traj)
+        if self.path:
+            self.save(self.path)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def load(self, path):
+        """Load entries from a file. Missing files and files created from a
+        different version of the YAML file are ignored.
+        @param path file created by save
+        """
+        try:
+            with open(path, 'rb') as roadmap_file:
+                version, digest, entries = cPickle.load(roadmap_file)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            return
+
+        if version != self.VERSION:
+            logger.warning('Ignoring named configuration roadmap "%s" with'
+                           ' version %s.', path, version)
+            return
+        if digest != self.digest:
+            logger.info('Named configurations have changed. Rebuilding the'
+                        ' roadmap in "%s".', path)
+            return
+
+        with self._lock:
+            self._entries.update(entries)
+
+    def save(self, path):
+        """Write all entries to a file.
+        @param path output path
+        """
+        with self._lock:
+            entries = dict(self._entries)
+
+        with atomic_write(path) as roadmap_file:
+            cPickle.dump((self.VERSION, self.digest, entries), roadmap_file,
+                         cPickle.HIGHEST_PROTOCOL)
+
+    def update_statistics(self, hits=0, misses=0, replans=0):
+        """Add to the hit, miss and replan counters.
+        @param hits number of stored paths returned
+        @param misses number of queries without a stored path
+        @param replans number of stored paths found in collision
+        """
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.replans += replans
+
+    def get_statistics(self):
+        """Get the number of hits, misses and replans.
+        @return dictionary of statistics
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'replans': self.replans,
+            }
+
+
+class RoadmapPlanner(MetaPlanner):
+    """Meta-planner that answers PlanToNamedConfiguration from a roadmap.
+
+    If the robot is in a named configuration, the stored path to the goal is
+    checked for collision in the current environment and returned. The
+    delegate planner is only called if there is no stored path or the path is
+    in collision; its result then replaces the stored path. Queries from
+    other configurations, and all other planning methods, are passed to the
+    delegate planner.
+    """
+    def __init__(self, delegate_planner, roadmap):
+        """
+        @param delegate_planner planner that supports PlanToNamedConfiguration,
+               e.g. prpy.planning.NamedPlanner
+        @param roadmap NamedConfigurationRoadmap
+        """
+        super(RoadmapPlanner, self).__init__()
+        self.delegate_planner = delegate_planner
+        self.roadmap = roadmap
+        self._planners = [ delegate_planner ]
+
+    def __str__(self):
+        return 'RoadmapPlanner({:s})'.format(str(self.delegate_planner))
+
+    def plan(self, method, args, kw_args):
+        delegate_method = getattr(self.delegate_planner, method)
+        if method != 'PlanToNamedConfiguration':
+            return delegate_method(*args, **kw_args)
+
+        robot = args[0]
+        name = args[1] if len(args) > 1 else kw_args['name']
+        roadmap = self.roadmap
+
+        indices, _ = robot.configurations.get_configuration(name)
+        start = roadmap.find_configuration(robot, indices)
+        if start is None or start == name:
+            return delegate_method(*args, **kw_args)
+
+        traj = roadmap.get(robot.GetEnv(), start, name, indices)
+        if traj is not None:
+            with robot.GetEnv():
+                set_start_configuration(traj, robot, indices,
+                                        robot.GetDOFValues(indices))
+
+            if is_path_collision_free(robot, traj, indices):
+                roadmap.update_statistics(hits=1)
+                logger.debug('Using the stored path from "%s" to "%s".',
+                             start, name)
+                return traj
+
+            logger.info('Stored path from "%s" to "%s" is in collision.'
+                        ' Replanning.', start, name)
+            roadmap.update_statistics(replans=1)
+        else:
+            roadmap.update_statistics(misses=1)
+
+        traj = delegate_method(*args, **kw_args)
+        roadmap.add(start, name, indices, traj)
+        return traj
+
+
+def build_roadmap(robot, names=None):
+    """Plan between every pair of named configurations. The robot's planner
+    must include a RoadmapPlanner, which stores the paths. This moves the
+    robot between configurations and should only be used in simulation.
+    @param robot robot with a RoadmapPlanner in its planning pipeline
+    @param names names of the configurations to connect; defaults to all
+    @return number of paths that could not be planned
+    """
+    from prpy.planning.base import PlanningError
+
+    roadmap = robot.named_roadmap
+    if names is None:
+        names = roadmap.names
+
+    num_failures = 0
+    p = openravepy.KinBody.SaveParameters
+    with robot.CreateRobotStateSaver(p.LinkTransformation):
+        for i, start in enumerate(names):
+            start_indices, start_values = robot.configurations.get_configuration(start)
+
+            # Paths are reversible, so only plan from each configuration to
+            # the ones after it.
+            for goal in names[i + 1:]:
+                goal_indices, _ = robot.configurations.get_configuration(goal)
+                if list(goal_indices) != list(start_indices):
+                    continue
+
+                with robot.GetEnv():
+                    robot.SetDOFValues(start_values, start_indices)
+                if roadmap.get(robot.GetEnv(), start, goal, start_indices) is not None:
+                    continue
+
+                try:
+                    robot.planner.PlanToNamedConfiguration(robot, goal)
+                except PlanningError as e:
+                    logger.warning('Failed planning from "%s" to "%s": %s',
+                                   start, goal, e)
+                    num_failures += 1
+
+    return num_failures
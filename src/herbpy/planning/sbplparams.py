@@ -0,0 +1,115 @@
+import hashlib, logging, os, numpy
+from herbpy.util import atomic_write, get_cache_path, hash_file
+
+logger = logging.getLogger('herbpy')
+
+
+def compile_parameters(params):
+    """Convert SBPL planner parameters to a dictionary of NumPy arrays.
+    Primitives from every action are stored contiguously: primitive i belongs
+    to action primitive_actions[i] and its poses are the rows
+    primitive_offsets[i]:primitive_offsets[i + 1] of poses.
+    @param params parameters in the format of base_planner_parameters.yaml
+    @return dictionary of arrays suitable for numpy.savez
+    """
+    action_angles = []
+    primitive_actions = []
+    primitive_weights = []
+    primitive_offsets = [ 0 ]
+    poses = []
+
+    for action_index, action in enumerate(params['actions']):
+        action_angles.append(action['angle'])
+
+        for primitive in action['primitives']:
+            primitive_actions.append(action_index)
+            primitive_weights.append(primitive['weight'])
+            poses.extend(primitive['poses'])
+            primitive_offsets.append(len(poses))
+
+    return {
+        'cellsize': numpy.array(params['cellsize'], dtype=float),
+        'numangles': numpy.array(params['numangles'], dtype=int),
+        'linear_weight': numpy.array(params['linear_weight'], dtype=float),
+        'theta_weight': numpy.array(params['theta_weight'], dtype=float),
+        'action_angles': numpy.array(action_angles, dtype=int),
+        'primitive_actions': numpy.array(primitive_actions, dtype=int),
+        'primitive_weights': numpy.array(primitive_weights, dtype=float),
+        'primitive_offsets': numpy.array(primitive_offsets, dtype=int),
+        'poses': numpy.array(poses, dtype=float).reshape((-1, 3)),
+    }
+
+
+def decompile_parameters(arrays):
+    """Convert arrays produced by compile_parameters back to parameters.
+    The result only contains built-in Python types, so it is identical to
+    the output of parsing the original YAML file.
+    @param arrays dictionary of arrays
+    @return parameters in the format of base_planner_parameters.yaml
+    """
+    actions = [ { 'angle': angle, 'primitives': [] }
+                for angle in arrays['action_angles'].tolist() ]
+    offsets = arrays['primitive_offsets'].tolist()
+    poses = arrays['poses'].tolist()
+
+    for i, (action_index, weight) in enumerate(zip(
+            arrays['primitive_actions'].tolist(),
+            arrays['primitive_weights'].tolist())):
+        actions[action_index]['primitives'].append({
+            'poses': poses[offsets[i]:offsets[i + 1]],
+            'weight': weight,
+        })
+
+    return {
+        'actions': actions,
+        'cellsize': float(arrays['cellsize']),
+        'numangles': int(arrays['numangles']),
+        'linear_weight': float(arrays['linear_weight']),
+        'theta_weight': float(arrays['theta_weight']),
+    }
+
+
+def load_planner_parameters(yaml_path, use_cache=True):
+    """Load SBPL planner parameters, using a compiled cache if possible.
+    The compiled form of \p yaml_path is stored in herbpy's cache directory
+    and is rebuilt whenever the SHA1 digest of the YAML file changes.
+    @param yaml_path path to the YAML parameter file
+    @param use_cache use the compiled cache; otherwise always parse the YAML
+    @return parameters in the format of base_planner_parameters.yaml
+    """
+    import yaml
+
+    if not use_cache:
+        with open(yaml_path, 'rb') as config_file:
+            return yaml.load(config_file)
+
+    source_hash = hash_file(yaml_path)
+    path_hash = hashlib.sha1(os.path.abspath(yaml_path)).hexdigest()[:8]
+    cache_name = '{:s}-{:s}.npz'.format(
+        os.path.splitext(os.path.basename(yaml_path))[0], path_hash)
+    cache_path = get_cache_path('sbpl', cache_name)
+
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            arrays = numpy.load(cache_file)
+            if str(arrays['source_hash']) == source_hash:
+                return decompile_parameters(arrays)
+        logger.info('Base planner parameters in "%s" have changed. Rebuilding'
+                    ' the compiled cache.', yaml_path)
+    except (IOError, KeyError, ValueError):
+        logger.info('Building the compiled cache of base planner parameters'
+                    ' in "%s".', yaml_path)
+
+    with open(yaml_path, 'rb') as config_file:
+        params = yaml.load(config_file)
+
+    arrays = compile_parameters(params)
+    arrays['source_hash'] = numpy.array(source_hash)
+    try:
+        with atomic_write(cache_path) as cache_file:
+            numpy.savez(cache_file, **arrays)
+    except (IOError, OSError) as e:
+        logger.warning('Failed writing compiled base planner parameters to'
+                       ' "%s": %s', cache_path, e)
+
+    return params
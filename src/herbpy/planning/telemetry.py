@@ -0,0 +1,254 @@
+import collections, json, logging, threading, time
+import numpy
+from prpy.planning.base import (
+    MetaPlanner,
+    MetaPlanningError,
+    PlanningError,
+    UnsupportedPlanningError,
+)
+
+logger = logging.getLogger('herbpy')
+
+
+class PlannerTelemetry(object):
+    """Call count, success rate and latency of planners per planning method.
+
+    Latency percentiles and the recent success count are computed over the
+    most recent \p window calls of each planner and method. All methods are
+    thread-safe.
+    """
+    PERCENTILES = [ 50, 90, 99 ]
+
+    def __init__(self, window=1000):
+        """
+        @param window number of calls kept per planner and method
+        """
+        self.window = window
+        self._records = dict()
+        self._lock = threading.Lock()
+
+    def record(self, name, method, success, latency):
+        """Record the outcome of one planning call.
+        @param name name of the planner
+        @param method name of the planning method
+        @param success True if the planner returned a trajectory
+        @param latency wall time of the call, in seconds
+        """
+        with self._lock:
+            record = self._records.get((name, method))
+            if record is None:
+                record = self._records[(name, method)] = {
+                    'calls': 0,
+                    'successes': 0,
+                    'total_latency': 0.,
+                    'latencies': collections.deque(maxlen=self.window),
+                    'outcomes': collections.deque(maxlen=self.window),
+                }
+
+            record['calls'] += 1
+            record['successes'] += int(bool(success))
+            record['total_latency'] += latency
+            record['latencies'].append(latency)
+            record['outcomes'].append(bool(success))
+
+    def get_statistics(self, name, method):
+        """Get the statistics of one planner for one planning method.
+        @param name name of the planner
+        @param method name of the planning method
+        @return dictionary of statistics; None if the planner was never called
+        """
+        with self._lock:
+            record = self._records.get((name, method))
+            if record is None:
+                return None
+
+            calls = record['calls']
+            latencies = numpy.array(record['latencies'])
+            percentiles = numpy.percentile(latencies, self.PERCENTILES)
+
+            return {
+                'calls': calls,
+                'successes': record['successes'],
+                'failures': calls - record['successes'],
+                'recent_calls': len(record['outcomes']),
+                'recent_successes': sum(record['outcomes']),
+                'success_rate': float(record['successes']) / calls,
+                'mean_latency': record['total_latency'] / calls,
+                'latency_percentiles': dict(
+                    (str(p), float(value))
+                    for p, value in zip(self.PERCENTILES, percentiles)),
+            }
+
+    def clear(self):
+        """Discard all recorded calls."""
+        with self._lock:
+            self._records.clear()
+
+    def as_dict(self):
+        """Get the statistics of every planner.
+        @return dictionary of planner name to planning method to statistics
+        """
+        with self._lock:
+            keys = self._records.keys()
+
+        output = dict()
+        for name, method in keys:
+            output.setdefault(name, dict())[method] = \
+                self.get_statistics(name, method)
+        return output
+
+    def dump_json(self, path):
+        """Write the statistics of every planner to a JSON file.
+        @param path output path
+        """
+        with open(path, 'wb') as output_file:
+            json.dump(self.as_dict(), output_file, indent=2, sort_keys=True)
+
+    def __str__(self):
+        lines = []
+        for name, methods in sorted(self.as_dict().items()):
+            for method, stats in sorted(methods.items()):
+                lines.append('{:s}.{:s}: {:d} calls, {:.0%} success,'
+                             ' p50 {:.3f} s, p90 {:.3f} s'.format(
+                    name, method, stats['calls'], stats['success_rate'],
+                    stats['latency_percentiles']['50'],
+                    stats['latency_percentiles']['90']))
+        return '\n'.join(lines)
+
+
+class InstrumentedPlanner(MetaPlanner):
+    """Meta-planner that records the outcome of every call to a planner.
+    Calls to planning methods that the planner does not support are not
+    recorded.
+    """
+    def __init__(self, planner, telemetry, name=None):
+        """
+        @param planner planner to instrument
+        @param telemetry PlannerTelemetry that receives the results
+        @param name name to record the planner under; defaults to str(planner)
+        """
+        super(InstrumentedPlanner, self).__init__()
+        self.planner = planner
+        self.telemetry = telemetry
+        self.name = name if name is not None else str(planner)
+        self._planners = [ planner ]
+
+    def __str__(self):
+        return str(self.planner)
+
+    def plan(self, method, args, kw_args):
+        start_time = time.time()
+        success = False
+        try:
+            result = getattr(self.planner, method)(*args, **kw_args)
+            success = True
+            return result
+        except UnsupportedPlanningError:
+            start_time = None
+            raise
+        finally:
+            if start_time is not None:
+                self.telemetry.record(self.name, method, success,
+                                      time.time() - start_time)
+
+
+class AdaptiveSequence(MetaPlanner):
+    """Sequence of planners that is reordered using their history.
+
+    Planners are normally called in the order they are given, like a prpy
+    Sequence. Once every planner has been called at least \p min_calls times
+    for a planning method, they are instead sorted by their expected time to
+    find a solution, i.e. mean latency divided by success rate, so planners
+    that are slow or rarely succeed on that kind of query are demoted.
+    Planners that have not succeeded in any of their last \p skip_after or
+    more calls, within the telemetry's window, are skipped, unless every
+    planner would be skipped. Because only recent calls count, a planner is
+    not kept forever because of old successes. Every \p retry_every-th query
+    of a method calls the skipped planners first, so a planner that starts
+    succeeding, e.g. because the environment changed, is no longer skipped.
+
+    Each planner must be an InstrumentedPlanner that shares \p telemetry.
+    """
+    def __init__(self, *planners, **kw_args):
+        """
+        @param *planners InstrumentedPlanners in their default order
+        @param telemetry PlannerTelemetry used to order the planners
+        @param min_calls calls per planner before the order adapts
+        @param skip_after skip planners that did not succeed in this many
+               recent calls; None to never skip planners
+        @param retry_every call skipped planners again on every query that
+               is a multiple of this number for a planning method
+        """
+        super(AdaptiveSequence, self).__init__()
+        self._planners = planners
+        self.telemetry = kw_args.pop('telemetry')
+        self.min_calls = kw_args.pop('min_calls', 10)
+        self.skip_after = kw_args.pop('skip_after', 50)
+        self.retry_every = kw_args.pop('retry_every', 20)
+        self._queries = collections.Counter()
+        self._lock = threading.Lock()
+
+        if kw_args:
+            raise TypeError('Unexpected keyword arguments: {:s}'.format(
+                            ', '.join(kw_args.keys())))
+
+    def __str__(self):
+        return 'AdaptiveSequence({:s})'.format(', '.join(map(str, self._planners)))
+
+    def get_order(self, method, retry_skipped=False):
+        """Get the order in which the planners will be called.
+        @param method name of the planning method
+        @param retry_skipped include planners that would be skipped, before
+               all of the others
+        @return list of planners that support the method
+        """
+        planners = [ planner for planner in self._planners
+                     if planner.has_planning_method(method) ]
+        stats = [ self.telemetry.get_statistics(planner.name, method)
+                  for planner in planners ]
+
+        if any(s is None or s['calls'] < self.min_calls for s in stats):
+            return planners
+
+        def get_expected_time(s):
+            # Laplace smoothing keeps planners that always failed orderable.
+            success_rate = (s['successes'] + 1.) / (s['calls'] + 2.)
+            return s['mean_latency'] / success_rate
+
+        order = sorted(zip(planners, stats),
+                       key=lambda (planner, s): get_expected_time(s))
+
+        if self.skip_after is not None:
+            active, skipped = [], []
+            for planner, s in order:
+                if (s['recent_successes'] > 0
+                        or s['recent_calls'] < self.skip_after):
+                    active.append((planner, s))
+                else:
+                    skipped.append((planner, s))
+            if active:
+                order = skipped + active if retry_skipped else active
+
+        return [ planner for planner, _ in order ]
+
+    def plan(self, method, args, kw_args):
+        with self._lock:
+            self._queries[method] += 1
+            retry_skipped = self._queries[method] % self.retry_every == 0
+
+        planners = self.get_order(method, retry_skipped=retry_skipped)
+        if not planners:
+            raise UnsupportedPlanningError(
+                'No planner in the sequence supports "{:s}".'.format(method))
+
+        errors = dict()
+        for planner in planners:
+            try:
+                return getattr(planner, method)(*args, **kw_args)
+            except MetaPlanningError as e:
+                errors[planner] = e
+            except PlanningError as e:
+                logger.warning('Planning with %s failed: %s', planner, e)
+                errors[planner] = e
+
+        raise MetaPlanningError('All planners failed.', errors)
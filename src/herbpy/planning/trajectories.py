@@ -0,0 +1,159 @@
+import numpy, openravepy
+
+
+def serialize_trajectory(traj):
+    """Serialize a trajectory to a string.
+    @param traj OpenRAVE trajectory
+    @return serialized trajectory
+    """
+    return traj.serialize(0)
+
+
+def deserialize_trajectory(env, data):
+    """Create a trajectory in an environment from a serialized trajectory.
+    @param env OpenRAVE environment that will own the trajectory
+    @param data string created by serialize_trajectory
+    @return OpenRAVE trajectory
+    """
+    traj = openravepy.RaveCreateTrajectory(env, '')
+    traj.deserialize(data)
+    return traj
+
+
+def copy_trajectory(traj, env):
+    """Copy a trajectory into another environment.
+    @param traj OpenRAVE trajectory
+    @param env environment that will own the copy
+    @return OpenRAVE trajectory
+    """
+    return deserialize_trajectory(env, serialize_trajectory(traj))
+
+
+def create_path(robot, waypoints, dof_indices=None):
+    """Create an untimed path with linear interpolation between waypoints.
+    @param robot robot the path is for
+    @param waypoints array with one row per waypoint
+    @param dof_indices DOF indices of the columns; defaults to the active DOFs
+    @return OpenRAVE trajectory
+    """
+    env = robot.GetEnv()
+    with env:
+        if dof_indices is None:
+            spec = robot.GetActiveConfigurationSpecification('linear')
+        else:
+            spec = robot.GetConfigurationSpecificationIndices(dof_indices, 'linear')
+
+        traj = openravepy.RaveCreateTrajectory(env, '')
+        traj.Init(spec)
+        for i, waypoint in enumerate(waypoints):
+            traj.Insert(i, waypoint)
+    return traj
+
+
+def get_waypoints(traj, robot, dof_indices):
+    """Extract the joint values of each waypoint of a trajectory.
+    @param traj OpenRAVE trajectory
+    @param robot robot the trajectory is for
+    @param dof_indices DOF indices to extract
+    @return array with one row per waypoint
+    """
+    spec = traj.GetConfigurationSpecification()
+    return numpy.array([ spec.ExtractJointValues(traj.GetWaypoint(i), robot,
+                                                 dof_indices, 0)
+                         for i in xrange(traj.GetNumWaypoints()) ])
+
+
+def _is_waypoints_collision_free(robot, waypoints, dof_indices):
+    """Check straight lines between waypoints at the robot's DOF resolutions.
+    The caller must hold the environment lock."""
+    env = robot.GetEnv()
+    resolutions = robot.GetDOFResolutions()[dof_indices]
+
+    p = openravepy.KinBody.SaveParameters
+    with robot.CreateRobotStateSaver(p.LinkTransformation):
+        def in_collision(q):
+            robot.SetDOFValues(q, dof_indices)
+            return env.CheckCollision(robot) or robot.CheckSelfCollision()
+
+        if in_collision(waypoints[0]):
+            return False
+
+        for q_start, q_end in zip(waypoints[:-1], waypoints[1:]):
+            num_steps = int(numpy.ceil(numpy.max(
+                numpy.abs(q_end - q_start) / resolutions)))
+            for t in numpy.linspace(0., 1., num_steps + 1)[1:]:
+                if in_collision((1. - t) * q_start + t * q_end):
+                    return False
+
+    return True
+
+
+def is_path_collision_free(robot, traj, dof_indices=None):
+    """Check a trajectory for collisions in the robot's current environment.
+    Waypoints are connected by straight lines, which are checked at the
+    robot's DOF resolutions.
+    @param robot robot the trajectory is for
+    @param traj OpenRAVE trajectory
+    @param dof_indices DOF indices in the trajectory; defaults to the active DOFs
+    @return True if no configuration along the path is in collision
+    """
+    with robot.GetEnv():
+        if dof_indices is None:
+            dof_indices = robot.GetActiveDOFIndices()
+        if traj.GetNumWaypoints() == 0:
+            return True
+
+        waypoints = get_waypoints(traj, robot, dof_indices)
+        return _is_waypoints_collision_free(robot, waypoints, dof_indices)
+
+
+def is_trajectory_collision_free(robot, traj, dof_indices=None, timestep=0.01):
+    """Check a timed trajectory for collisions in the robot's current
+    environment. Unlike is_path_collision_free, this follows the trajectory's
+    own interpolation, e.g. the parabolic segments of a smoothed trajectory:
+    it is sampled every \p timestep seconds and the samples are connected by
+    straight lines, which are checked at the robot's DOF resolutions.
+    @param robot robot the trajectory is for
+    @param traj timed OpenRAVE trajectory
+    @param dof_indices DOF indices in the trajectory; defaults to the active DOFs
+    @param timestep time between samples, in seconds
+    @return True if no configuration along the trajectory is in collision
+    """
+    with robot.GetEnv():
+        if dof_indices is None:
+            dof_indices = robot.GetActiveDOFIndices()
+        if traj.GetNumWaypoints() == 0:
+            return True
+
+        spec = traj.GetConfigurationSpecification()
+        duration = traj.GetDuration()
+        times = numpy.append(numpy.arange(0., duration, timestep), duration)
+        waypoints = numpy.array([ spec.ExtractJointValues(traj.Sample(t), robot,
+                                                          dof_indices, 0)
+                                  for t in times ])
+        return _is_waypoints_collision_free(robot, waypoints, dof_indices)
+
+
+def set_start_configuration(traj, robot, dof_indices, values):
+    """Replace the joint values of the first waypoint of a trajectory.
+    This is used to start a stored path exactly at the robot's current
+    configuration when it is within tolerance of the path's start.
+    @param traj OpenRAVE trajectory; modified in place
+    @param robot robot the trajectory is for
+    @param dof_indices DOF indices to replace
+    @param values new joint values
+    """
+    spec = traj.GetConfigurationSpecification()
+    waypoint = traj.GetWaypoint(0)
+    spec.InsertJointValues(waypoint, values, robot, dof_indices, 0)
+    traj.Insert(0, waypoint, True)
+
+
+def get_dof_indices(traj):
+    """Get the DOF indices of the joint values in a trajectory.
+    @param traj OpenRAVE trajectory
+    @return list of DOF indices
+    """
+    spec = traj.GetConfigurationSpecification()
+    group = spec.GetGroupFromName('joint_values')
+    return [ int(index) for index in group.name.split()[2:] ]
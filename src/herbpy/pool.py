@@ -0,0 +1,145 @@
+"""
+Pool of worker processes that share one initialized HERB environment.
+
+Creating a HERB environment with herbpy.initialize takes several seconds, most
+of which is spent loading plugins, parsing the robot model and building the IK
+database. A Pool pays this cost once: the environment is initialized in the
+parent process, which then forks the workers. Every job runs in a clone of the
+inherited environment, so jobs are isolated from each other and the parent's
+memory is shared copy-on-write.
+
+Jobs are module-level functions that receive the cloned environment and robot:
+
+    def plan_home(env, robot, arm_name):
+        manip = getattr(robot, arm_name)
+        traj = manip.PlanToNamedConfiguration('home', execute=False)
+        return traj.serialize(0)
+
+    with herbpy.pool.Pool(processes=4) as pool:
+        results = pool.map(plan_home, [ 'left_arm', 'right_arm' ])
+
+Arguments and return values are pickled, so OpenRAVE objects such as
+trajectories must be serialized before they are returned.
+
+fork copies only the thread that calls it. A worker forked while another
+thread, such as a ROS callback, the simulation or a viewer, is inside
+OpenRAVE may inherit a half-modified environment or a lock that is never
+released, and holding the environment lock in the parent does not prevent
+this. Create the Pool before starting any of those threads, e.g. right after
+herbpy.initialize(sim=True) with no viewer and before rospy.init_node.
+"""
+import logging, multiprocessing
+
+logger = logging.getLogger('herbpy')
+
+# Environment and robot of the Pool that forked this worker process.
+_worker = None
+
+
+def _initialize(env, robot):
+    global _worker
+    _worker = (env, robot)
+
+
+def _run(function, args, kw_args):
+    from prpy.clone import Clone, Cloned
+
+    env, robot = _worker
+    with Clone(env) as cloned_env:
+        cloned_robot = Cloned(robot)
+        return function(cloned_env, cloned_robot, *args, **kw_args)
+
+
+def _run_item(job):
+    function, item = job
+    return _run(function, (item,), {})
+
+
+class Pool(object):
+    def __init__(self, processes=None, env=None, robot=None, **kw_args):
+        """Initialize HERB and fork a pool of worker processes.
+        @param processes number of workers; defaults to the number of CPUs
+        @param env environment to share; if None, herbpy.initialize is called
+        @param robot robot in \p env; required if \p env is specified
+        @param **kw_args arguments passed to herbpy.initialize
+        """
+        if env is None:
+            from herb import initialize
+            kw_args.setdefault('sim', True)
+            env, robot = initialize(**kw_args)
+        elif robot is None:
+            raise ValueError('A robot must be specified with the environment.')
+
+        if env.GetViewer() is not None:
+            logger.warning('Forking an environment with a viewer attached. The'
+                           ' viewer will not be available in the workers.')
+
+        self.env = env
+        self.robot = robot
+
+        # The workers are forked, so the initializer's arguments are inherited
+        # rather than pickled, and each Pool's workers keep their own robot.
+        self._pool = multiprocessing.Pool(processes, initializer=_initialize,
+                                          initargs=(env, robot))
+
+    def apply(self, function, *args, **kw_args):
+        """Run a job in a worker and wait for the result.
+        @param function function called as function(env, robot, *args, **kw_args)
+        @return return value of \p function
+        """
+        return self._pool.apply(_run, (function, args, kw_args))
+
+    def apply_async(self, function, args=(), kw_args=None, callback=None):
+        """Run a job in a worker without waiting for the result.
+        @param function function called as function(env, robot, *args, **kw_args)
+        @param args positional arguments
+        @param kw_args keyword arguments
+        @param callback function called with the result when it is ready
+        @return multiprocessing.pool.AsyncResult
+        """
+        if kw_args is None:
+            kw_args = dict()
+        return self._pool.apply_async(_run, (function, args, kw_args),
+                                      callback=callback)
+
+    def map(self, function, iterable, chunksize=None):
+        """Run a job for each item and wait for all of the results.
+        @param function function called as function(env, robot, item)
+        @param iterable items to process
+        @param chunksize number of items sent to a worker at once
+        @return list of results in the order of \p iterable
+        """
+        jobs = [ (function, item) for item in iterable ]
+        return self._pool.map(_run_item, jobs, chunksize)
+
+    def imap_unordered(self, function, iterable, chunksize=1):
+        """Run a job for each item and yield results as they finish.
+        @param function function called as function(env, robot, item)
+        @param iterable items to process
+        @param chunksize number of items sent to a worker at once
+        @return iterator over results in completion order
+        """
+        jobs = ((function, item) for item in iterable)
+        return self._pool.imap_unordered(_run_item, jobs, chunksize)
+
+    def close(self):
+        """Stop accepting new jobs."""
+        self._pool.close()
+
+    def terminate(self):
+        """Stop the workers immediately."""
+        self._pool.terminate()
+
+    def join(self):
+        """Wait for the workers to exit. close or terminate must be called first."""
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+        self.join()
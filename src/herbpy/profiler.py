@@ -0,0 +1,107 @@
+import contextlib, json, os, resource, threading, time
+
+
+def get_rss():
+    """Get the resident set size of this process.
+    Uses /proc/self/statm if it is available. Otherwise, falls back on the
+    peak resident set size reported by getrusage.
+    @return resident set size in bytes
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StartupProfiler(object):
+    """Records the wall time and memory used by each phase of startup.
+
+    Phases are nested by entering one phase inside another; the name of a
+    nested phase is prefixed with the names of its parents, separated by
+    slashes, e.g. "HERBRobot/load_configurations".
+
+    Phases may also be recorded after startup, e.g. when a planner is
+    constructed on first use. Once finish() is called, later phases are
+    marked as after startup and are not counted in the startup total.
+    """
+    def __init__(self):
+        self.phases = []
+        self.end_time = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def finish(self):
+        """Mark the end of startup."""
+        with self._lock:
+            self.end_time = time.time()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager that records one phase.
+        @param name name of the phase
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        stack.append(name)
+        full_name = '/'.join(stack)
+        start_rss = get_rss()
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            end_time = time.time()
+            end_rss = get_rss()
+            stack.pop()
+
+            with self._lock:
+                self.phases.append({
+                    'name': full_name,
+                    'depth': len(stack),
+                    'after_startup': (self.end_time is not None
+                                      and start_time >= self.end_time),
+                    'start_time': start_time,
+                    'wall_time': end_time - start_time,
+                    'rss': end_rss,
+                    'rss_delta': end_rss - start_rss,
+                })
+
+    def as_dict(self):
+        """Get the recorded phases.
+        Phases are sorted by start time. The total is the sum of the wall
+        time of the top-level phases of startup; top-level phases recorded
+        after startup are summed separately.
+        @return dictionary with the keys "total_wall_time",
+                "after_startup_wall_time" and "phases"
+        """
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase['start_time'])
+
+        top_level = [ phase for phase in phases if phase['depth'] == 0 ]
+        return {
+            'total_wall_time': sum(phase['wall_time'] for phase in top_level
+                                   if not phase['after_startup']),
+            'after_startup_wall_time': sum(phase['wall_time']
+                                           for phase in top_level
+                                           if phase['after_startup']),
+            'phases': [ dict(phase) for phase in phases ],
+        }
+
+    def dump_json(self, path):
+        """Write the recorded phases to a JSON file.
+        @param path output path
+        """
+        with open(path, 'wb') as output_file:
+            json.dump(self.as_dict(), output_file, indent=2, sort_keys=True)
+
+    def __str__(self):
+        lines = []
+        for phase in self.as_dict()['phases']:
+            lines.append('{:s}{:s}: {:.3f} s, {:+.1f} MB{:s}'.format(
+                '  ' * phase['depth'], phase['name'].rsplit('/', 1)[-1],
+                phase['wall_time'], phase['rss_delta'] / 1e6,
+                ' (after startup)' if phase['after_startup'] else ''))
+        return '\n'.join(lines)
@@ -0,0 +1,352 @@
+import logging, threading
+import numpy, openravepy, prpy.tsr
+from ikcache import get_manipulator_key
+from util import atomic_write, get_cache_path
+from tsr.sampling import xyzrpy_to_transforms
+
+logger = logging.getLogger('herbpy')
+
+
+class ReachabilityMap(object):
+    """Voxel grid of end-effector positions that an arm can reach.
+
+    The map is built by sampling configurations uniformly within the arm's
+    joint limits and recording the position of the end-effector relative to
+    the arm's base link. It ignores orientation and collisions, so a position
+    inside of the map might not be reachable. Because it is built from a
+    finite number of samples, a reachable position outside of the map is also
+    possible, mostly near the boundary of the workspace, where samples are
+    sparse. Dilating the map by \p dilation voxels in every direction,
+    including diagonals, makes such misses less likely but does not rule them
+    out.
+    """
+    VERSION = 3
+
+    def __init__(self, manip, resolution=0.05, extent=1.4,
+                 num_configurations=100000, dilation=2,
+                 path=None):
+        """
+        @param manip manipulator to build the map for
+        @param resolution edge length of each voxel, in meters
+        @param extent half-width of the mapped cube around the base, in meters
+        @param num_configurations number of configurations sampled to build
+               the map
+        @param dilation number of voxels the sampled positions are grown by
+               in every direction
+        @param path file used to cache the map; defaults to a file in the
+               herbpy cache directory, False to always rebuild the map
+        """
+        self.manipulator_name = manip.GetName()
+        self.resolution = resolution
+        self.extent = extent
+        self.num_configurations = num_configurations
+        self.dilation = dilation
+        self.key = get_manipulator_key(manip)
+
+        if path is None:
+            path = get_cache_path('reachability', '{:s}-{:s}-{:s}.npz'.format(
+                manip.GetRobot().GetName(), self.manipulator_name,
+                self.key[:8]))
+
+        self.reachable = None
+        self.complete = False
+        if path:
+            self.reachable = self._load(path)
+        if self.reachable is None:
+            self.reachable = self._build(manip)
+            if path:
+                self._save(path)
+
+    def _get_shape(self):
+        num_voxels = int(numpy.ceil(2. * self.extent / self.resolution))
+        return (num_voxels, num_voxels, num_voxels)
+
+    def _build(self, manip):
+        robot = manip.GetRobot()
+        arm_indices = manip.GetArmIndices()
+        lower_limits, upper_limits = robot.GetDOFLimits(arm_indices)
+        configurations = lower_limits + (upper_limits - lower_limits) \
+            * numpy.random.random_sample((self.num_configurations,
+                                          len(arm_indices)))
+
+        logger.info('Building the reachability map of %s from %d samples.',
+                    self.manipulator_name, self.num_configurations)
+
+        positions = numpy.empty((self.num_configurations, 3))
+        with robot.GetEnv():
+            p = openravepy.KinBody.SaveParameters
+            with robot.CreateRobotStateSaver(p.LinkTransformation):
+                base_inv = numpy.linalg.inv(manip.GetBase().GetTransform())
+                for i, q in enumerate(configurations):
+                    robot.SetDOFValues(q, arm_indices)
+                    ee_pose = numpy.dot(base_inv, manip.GetEndEffectorTransform())
+                    positions[i, :] = ee_pose[0:3, 3]
+
+        reachable = numpy.zeros(self._get_shape(), dtype=bool)
+        indices, valid = self._get_indices(positions)
+        reachable[tuple(indices[valid].T)] = True
+        self.complete = bool(numpy.all(valid))
+        if not self.complete:
+            logger.warning('The reachability map of %s does not contain every'
+                           ' reachable position. Increase its extent.',
+                           self.manipulator_name)
+
+        # Dilate by a cube of voxels, i.e. across faces, edges and corners,
+        # one axis at a time.
+        for _ in xrange(self.dilation):
+            for axis in xrange(3):
+                dilated = reachable.copy()
+                lower = [ slice(None) ] * 3
+                upper = [ slice(None) ] * 3
+                lower[axis] = slice(None, -1)
+                upper[axis] = slice(1, None)
+                dilated[tuple(upper)] |= reachable[tuple(lower)]
+                dilated[tuple(lower)] |= reachable[tuple(upper)]
+                reachable = dilated
+        return reachable
+
+    def _load(self, path):
+        try:
+            archive = numpy.load(path)
+            if (int(archive['version']) != self.VERSION
+                    or str(archive['key']) != self.key
+                    or float(archive['resolution']) != self.resolution
+                    or float(archive['extent']) != self.extent
+                    or int(archive['dilation']) != self.dilation):
+                return None
+            self.complete = bool(archive['complete'])
+            return archive['reachable']
+        except (IOError, KeyError, ValueError):
+            return None
+
+    def _save(self, path):
+        with atomic_write(path) as archive_file:
+            numpy.savez_compressed(archive_file, version=self.VERSION,
+                key=self.key, resolution=self.resolution, extent=self.extent,
+                dilation=self.dilation, complete=self.complete, reachable=self.reachable)
+
+    def _get_indices(self, positions):
+        indices = numpy.floor((positions + self.extent) / self.resolution).astype(int)
+        valid = numpy.all((indices >= 0) & (indices < self._get_shape()[0]), axis=1)
+        return indices, valid
+
+    def is_reachable(self, manip, poses):
+        """Check which end-effector poses may be reachable.
+        @param manip manipulator the map was built for
+        @param poses array of shape (N, 4, 4) of poses in the world frame
+        @return boolean array of shape (N,)
+        """
+        base_inv = numpy.linalg.inv(manip.GetBase().GetTransform())
+        positions = numpy.einsum('ij,nj->ni', base_inv[0:3, 0:3],
+                                 poses[:, 0:3, 3]) + base_inv[0:3, 3]
+        indices, valid = self._get_indices(positions)
+
+        reachable = numpy.zeros(len(poses), dtype=bool)
+        reachable[valid] = self.reachable[tuple(indices[valid].T)]
+        return reachable
+
+    def is_tsr_reachable(self, manip, T0_w, Tw_e, Bw):
+        """Check whether any end-effector pose of a TSR may be reachable.
+        This returns False only if every voxel of the bounding box of the
+        TSR's end-effector positions is unreachable in the map.
+        @param manip manipulator the map was built for
+        @param T0_w TSR frame in the world frame
+        @param Tw_e end-effector pose in the TSR frame
+        @param Bw array of shape (6, 2) of bounds
+        @return False if no pose of the TSR is reachable
+        """
+        Bw = numpy.asarray(Bw, dtype=float)
+        if not numpy.all(numpy.isfinite(Bw[0:3])):
+            return True
+
+        # Bound the end-effector positions in the TSR frame. With a fixed
+        # rotation the offset of Tw_e is known; otherwise it lies within a
+        # sphere of its length.
+        lower, upper = Bw[0:3, 0].copy(), Bw[0:3, 1].copy()
+        offset = numpy.asarray(Tw_e)[0:3, 3]
+        if numpy.all(Bw[3:6, 1] <= Bw[3:6, 0]):
+            rotation = xyzrpy_to_transforms([ numpy.concatenate(
+                (numpy.zeros(3), Bw[3:6, 0])) ])[0, 0:3, 0:3]
+            lower += numpy.dot(rotation, offset)
+            upper += numpy.dot(rotation, offset)
+        else:
+            radius = numpy.linalg.norm(offset)
+            lower -= radius
+            upper += radius
+
+        corners = numpy.array([ [ x, y, z, 1. ] for x in (lower[0], upper[0])
+                                                for y in (lower[1], upper[1])
+                                                for z in (lower[2], upper[2]) ])
+        base_inv = numpy.linalg.inv(manip.GetBase().GetTransform())
+        positions = numpy.dot(corners, numpy.dot(base_inv, T0_w).T)[:, 0:3]
+
+        num_voxels = self._get_shape()[0]
+        min_indices = numpy.floor((numpy.min(positions, axis=0) + self.extent)
+                                  / self.resolution).astype(int)
+        max_indices = numpy.floor((numpy.max(positions, axis=0) + self.extent)
+                                  / self.resolution).astype(int)
+        outside = numpy.any(min_indices < 0) or numpy.any(max_indices >= num_voxels)
+        if outside and not self.complete:
+            return True
+
+        min_indices = numpy.maximum(min_indices, 0)
+        max_indices = numpy.minimum(max_indices, num_voxels - 1)
+        if numpy.any(min_indices > max_indices):
+            return False
+
+        return bool(numpy.any(self.reachable[
+            min_indices[0]:max_indices[0] + 1,
+            min_indices[1]:max_indices[1] + 1,
+            min_indices[2]:max_indices[2] + 1]))
+
+
+class ReachabilityFilter(object):
+    """Removes TSR chains that the arms can not reach before planning.
+
+    Goal chains that consist of a single TSR are checked against the
+    reachability map of the arm they are for. Chains whose end-effector
+    positions all lie in voxels the dilated map marks unreachable are
+    removed, so no planner is called on them. Each bounded dimension of Bw of
+    the remaining chains is also split into bins, and bins at the ends of the
+    range that fail the same test are cut off. If every goal chain would be
+    removed, the unfiltered list is returned instead, since the map is built
+    from samples and can miss reachable positions. Chains with several TSRs
+    and chains that are only used as constraints are left untouched.
+
+    With prune=False, unreachable chains are moved to the end of the list and
+    each narrowed chain is followed by the original chain instead.
+    """
+    def __init__(self, num_bins=8, prune=True, **map_args):
+        """
+        @param num_bins number of bins each dimension of Bw is split into
+        @param prune remove unreachable chains instead of reordering them
+        @param **map_args arguments passed to ReachabilityMap
+        """
+        self.num_bins = num_bins
+        self.prune = prune
+        self.map_args = map_args
+        self.chains_checked = 0
+        self.chains_pruned = 0
+        self.chains_deprioritized = 0
+        self.bounds_narrowed = 0
+        self.planner_calls_saved = 0
+        self._maps = dict()
+        self._lock = threading.Lock()
+
+    def get_map(self, manip):
+        """Get the reachability map of a manipulator, building it on first use.
+        @param manip manipulator
+        @return ReachabilityMap
+        """
+        with self._lock:
+            reachability_map = self._maps.get(manip.GetName())
+            if reachability_map is None:
+                reachability_map = ReachabilityMap(manip, **self.map_args)
+                self._maps[manip.GetName()] = reachability_map
+            return reachability_map
+
+    def _narrow_bounds(self, manip, chain):
+        """Narrow the Bw of a single-TSR chain by removing unreachable bins.
+        @return new chain, or the input chain if nothing changed
+        """
+        reachability_map = self.get_map(manip)
+        tsr = chain.TSRs[0]
+        Bw = numpy.array(tsr.Bw, dtype=float)
+        narrowed = Bw.copy()
+
+        for dim in xrange(6):
+            lower, upper = Bw[dim]
+            if upper <= lower or not numpy.isfinite(upper - lower):
+                continue
+
+            edges = numpy.linspace(lower, upper, self.num_bins + 1)
+            reachable_bins = []
+            for i in xrange(self.num_bins):
+                bin_Bw = Bw.copy()
+                bin_Bw[dim] = edges[i:i + 2]
+                if reachability_map.is_tsr_reachable(manip, tsr.T0_w, tsr.Tw_e,
+                                                     bin_Bw):
+                    reachable_bins.append(i)
+
+            if reachable_bins:
+                narrowed[dim] = [ edges[reachable_bins[0]],
+                                  edges[reachable_bins[-1] + 1] ]
+
+        if numpy.allclose(narrowed, Bw):
+            return chain
+
+        self.bounds_narrowed += 1
+        narrowed_tsr = prpy.tsr.TSR(T0_w=tsr.T0_w, Tw_e=tsr.Tw_e, Bw=narrowed,
+                                    manip=tsr.manipindex)
+        return prpy.tsr.TSRChain(sample_start=chain.sample_start,
+                                 sample_goal=chain.sample_goal,
+                                 constrain=chain.constrain, TSR=narrowed_tsr)
+
+    def filter(self, robot, tsrlist):
+        """Remove, or with prune=False deprioritize, the goal chains that the
+        map considers unreachable and narrow the bounds of the others. The
+        input chains are not modified.
+        @param robot robot that will plan to the chains
+        @param tsrlist list of TSRChains
+        @return list of TSRChains
+        """
+        manipulators = robot.GetManipulators()
+        preferred = []
+        fallback = []
+        num_goals = 0
+        num_unreachable = 0
+
+        for chain in tsrlist:
+            if (not chain.sample_goal or not chain.TSRs
+                    or len(chain.TSRs) != 1):
+                preferred.append(chain)
+                continue
+
+            num_goals += 1
+            tsr = chain.TSRs[0]
+            manip = manipulators[tsr.manipindex]
+            self.chains_checked += 1
+            if not self.get_map(manip).is_tsr_reachable(manip, tsr.T0_w,
+                                                        tsr.Tw_e, tsr.Bw):
+                num_unreachable += 1
+                fallback.append(chain)
+                continue
+
+            narrowed = self._narrow_bounds(manip, chain)
+            preferred.append(narrowed)
+            if narrowed is not chain:
+                fallback.append(chain)
+
+        if not self.prune:
+            self.chains_deprioritized += num_unreachable
+            if num_unreachable:
+                logger.info('Reachability filter moved %d of %d goal TSR'
+                            ' chains to the end of the list.',
+                            num_unreachable, num_goals)
+            return preferred + fallback
+
+        if num_goals and num_unreachable == num_goals:
+            logger.info('Reachability filter found none of %d goal TSR chains'
+                        ' reachable; planning to all of them.', num_goals)
+            return list(tsrlist)
+
+        self.chains_pruned += num_unreachable
+        # Each removed goal chain is one chain no planner is called on.
+        self.planner_calls_saved += num_unreachable
+        if num_unreachable:
+            logger.info('Reachability filter removed %d of %d goal TSR chains.',
+                        num_unreachable, num_goals)
+        return preferred
+
+    def get_statistics(self):
+        """Get the number of chains checked, pruned, deprioritized and
+        narrowed, and the number of planner calls saved by pruning.
+        @return dictionary of statistics
+        """
+        return {
+            'chains_checked': self.chains_checked,
+            'chains_pruned': self.chains_pruned,
+            'chains_deprioritized': self.chains_deprioritized,
+            'bounds_narrowed': self.bounds_narrowed,
+            'planner_calls_saved': self.planner_calls_saved,
+        }
@@ -0,0 +1,107 @@
+"""
+Decide whether and how HERB's actions draw the TSRs and directions they plan
+with.
+
+Nothing is drawn when the environment has no viewer, so headless processes
+skip sampling TSRs entirely. Otherwise, a fixed number of TSR samples is drawn
+on a background thread while the action plans, and the drawings are removed
+when the action finishes.
+
+    robot.render_policy = RenderPolicy(num_samples=50)
+"""
+import contextlib, logging, threading
+import numpy, openravepy
+
+logger = logging.getLogger('herbpy')
+
+
+class RenderPolicy(object):
+    """Draws TSR samples and vectors for HERB's actions."""
+    def __init__(self, enabled=None, asynchronous=True, num_samples=20):
+        """
+        @param enabled True or False to always or never draw; None to draw
+               only when a viewer is attached to the environment
+        @param asynchronous draw on a background thread instead of before
+               the action starts planning
+        @param num_samples maximum number of TSR samples drawn per TSR list
+        """
+        self.enabled = enabled
+        self.asynchronous = asynchronous
+        self.num_samples = num_samples
+
+    def is_enabled(self, env):
+        """Check whether anything will be drawn in an environment.
+        @param env OpenRAVE environment
+        @return True if drawing is enabled
+        """
+        if self.enabled is None:
+            return env.GetViewer() is not None
+        return self.enabled
+
+    @contextlib.contextmanager
+    def _render(self, env, render, drawings):
+        """Draw the handles produced by an iterable while the context is
+        active. The iterable is only consumed if drawing is enabled."""
+        if not render or not self.is_enabled(env):
+            yield
+            return
+
+        handles = []
+        stop = threading.Event()
+
+        def draw():
+            try:
+                for handle in drawings:
+                    handles.append(handle)
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                logger.debug('Failed drawing: %s', e)
+
+        if self.asynchronous:
+            thread = threading.Thread(target=draw, name='RenderPolicy')
+            thread.daemon = True
+            thread.start()
+        else:
+            thread = None
+            draw()
+
+        try:
+            yield
+        finally:
+            stop.set()
+            if thread is not None:
+                thread.join()
+            del handles[:]
+
+    def _draw_tsr_samples(self, tsrlist, env):
+        for i in xrange(self.num_samples):
+            pose = tsrlist[i % len(tsrlist)].sample()
+            yield openravepy.misc.DrawAxes(env, pose, dist=0.05, linewidth=2)
+
+    def render_tsr_list(self, tsrlist, env, render=True):
+        """Draw samples of a list of TSR chains.
+        @param tsrlist list of TSRChain objects
+        @param env OpenRAVE environment
+        @param render False to draw nothing
+        @return context manager that removes the drawings on exit
+        """
+        if not tsrlist:
+            render = False
+        return self._render(env, render, self._draw_tsr_samples(tsrlist, env))
+
+    def render_vector(self, start, direction, length, env, render=True):
+        """Draw an arrow.
+        @param start start of the arrow
+        @param direction direction of the arrow
+        @param length length of the arrow
+        @param env OpenRAVE environment
+        @param render False to draw nothing
+        @return context manager that removes the drawing on exit
+        """
+        def draw():
+            start_point = numpy.array(start, dtype=float)
+            end_point = start_point + length * numpy.array(direction, dtype=float)
+            yield env.drawarrow(p1=start_point, p2=end_point, linewidth=0.005,
+                                color=[ 1., 0., 0., 1. ])
+        return self._render(env, render, draw())
@@ -1,9 +1,3 @@
-from fuze import *
-from glass import *
-from table import *
-from plate import *
-from bowl import * 
-from block import *
-from pitcher import *
-from tray import *
-from pop_tarts import *
+# TSR factories are registered the first time they are used. See
+# config/tsr_library.yaml for the list of object kinds.
+from library import HERBTSRLibrary, load, load_all
@@ -1,7 +1,10 @@
 import numpy
-import prpy.tsr 
+import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'block', 'place')
+@memoized(depends_on_robot=True)
 def block_at_pose(robot, block, position, manip=None):
     '''
     Generates end-effector poses for placing the block on another object
@@ -14,12 +17,8 @@ def block_at_pose(robot, block, position, manip=None):
     '''
     
     if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
         manip = robot.GetActiveManipulator()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     # Block on the object
     T0_w = numpy.eye(4)
@@ -1,37 +1,10 @@
 import numpy
 import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
-@prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_bowl', 'grasp')
-def bowl_grasp(robot, bowl, manip=None):
-    '''
-    @param robot The robot performing the grasp
-    @param bowl The bowl to grasp
-    @param manip The manipulator to perform the grasp, 
-       if None the active manipulator on the robot is used
-    '''
-    if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
-
-    T0_w = bowl.GetTransform()
-    Tw_e = numpy.array([[1.,  0.,  0., 0.08],
-                        [0., -1.,  0., 0.],
-                        [0.,  0., -1., 0.34],
-                        [0.,  0.,  0., 1.]])
-    Bw = numpy.zeros((6,2))
-    Bw[2,:] = [-0.02, 0.02] # Allow a little verticle movement
-    Bw[5,:] = [-numpy.pi, numpy.pi] # Allow any orientation
-
-    grasp_tsr = prpy.tsr.TSR(T0_w = T0_w, Tw_e = Tw_e, Bw = Bw, manip = manip_idx)
-    grasp_chain = prpy.tsr.TSRChain(sample_start=False, sample_goal = True, 
-                                    constrain=False, TSR = grasp_tsr)
-
-    return [grasp_chain]
-    
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_bowl', 'place')
+@memoized(depends_on_robot=True)
 def bowl_on_table(robot, bowl, pose_tsr_chain, manip=None):
     '''
     Generates end-effector poses for placing the bowl on the table.
@@ -44,12 +17,8 @@ def bowl_on_table(robot, bowl, pose_tsr_chain, manip=None):
        manipulator of the robot is used
     '''
     if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
         manip = robot.GetActiveManipulator()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     ee_in_bowl = numpy.dot(numpy.linalg.inv(bowl.GetTransform()), manip.GetEndEffectorTransform())
     Bw = numpy.zeros((6,2)) 
@@ -1,7 +1,10 @@
 import numpy
 import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'fuze_bottle', 'lift')
+@memoized(depends_on_robot=True)
 def fuze_lift(robot, bottle, manip=None, distance=0.1):
     """
     This creates a TSR for lifting the bottle a specified distance. 
@@ -16,11 +19,7 @@ def fuze_lift(robot, bottle, manip=None, distance=0.1):
 
     if manip is None:
         manip = robot.GetActiveManipulator()
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-         with manip.GetRobot():
-             manip.SetActive()
-             manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     #TSR for the goal
     start_position = manip.GetEndEffectorTransform()
@@ -57,6 +56,7 @@ def fuze_lift(robot, bottle, manip=None, distance=0.1):
     return [goal_tsr_chain, movement_chain] 
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'fuze_bottle', 'grasp')
+@memoized()
 def fuze_grasp(robot, fuze, manip=None):
     """
     @param robot The robot performing the grasp
@@ -67,6 +67,7 @@ def fuze_grasp(robot, fuze, manip=None):
     return _fuze_grasp(robot, fuze, manip = manip)
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'fuze_bottle', 'push_grasp')
+@memoized()
 def fuze_grasp(robot, fuze, push_distance = 0.1, manip=None):
     """
     @param robot The robot performing the grasp
@@ -85,12 +86,7 @@ def _fuze_grasp(robot, fuze, push_distance = 0.0, manip = None):
     @param manip The manipulator to perform the grasp, if None
        the active manipulator on the robot is used
     """
-    if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     T0_w = fuze.GetTransform()
     ee_to_palm_distance = 0.18
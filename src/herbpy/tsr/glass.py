@@ -1,7 +1,10 @@
 import numpy
 import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_glass', 'lift')
+@memoized(depends_on_robot=True)
 def glass_lift(robot, glass, manip=None, distance=0.1):
 
     '''
@@ -18,11 +21,7 @@ def glass_lift(robot, glass, manip=None, distance=0.1):
 
     if manip is None:
         manip = robot.GetActiveManipulator()
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-         with manip.GetRobot():
-             manip.SetActive()
-             manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     #TSR for the goal
     start_position = manip.GetEndEffectorTransform()
@@ -60,6 +59,7 @@ def glass_lift(robot, glass, manip=None, distance=0.1):
     return [goal_tsr_chain, movement_chain]
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_glass', 'grasp')
+@memoized()
 def glass_grasp(robot, glass, manip=None, **kw_args):
     '''
     @param robot The robot performing the grasp
@@ -70,6 +70,7 @@ def glass_grasp(robot, glass, manip=None, **kw_args):
     return _glass_grasp(robot, glass, manip=manip, **kw_args)
     
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_glass', 'push_grasp')
+@memoized()
 def glass_push_grasp(robot, glass, manip=None, push_distance=0.1, **kw_args):
     '''
     This factory differes from glass_grasp in that it places the manipulator 
@@ -96,12 +97,7 @@ def _glass_grasp(robot, glass, manip=None, push_distance=0.0, **kw_args):
        the active manipulator on the robot is used
     @param push_distance The offset distance for pushing
     """
-    if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     T0_w = glass.GetTransform()
     
@@ -124,6 +120,7 @@ def _glass_grasp(robot, glass, manip=None, push_distance=0.0, **kw_args):
     return [grasp_chain]
                 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_glass', 'place')
+@memoized(depends_on_robot=True)
 def glass_on_table(robot, glass, pose_tsr_chain, manip=None):
     '''
     Generates end-effector poses for placing the glass on the table.
@@ -136,12 +133,8 @@ def glass_on_table(robot, glass, pose_tsr_chain, manip=None):
        manipulator of the robot is used
     '''
     if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
         manip = robot.GetActiveManipulator()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     ee_in_glass = numpy.dot(numpy.linalg.inv(glass.GetTransform()), manip.GetEndEffectorTransform())
     ee_in_glass[2,3] += 0.04 # Let go slightly above table
@@ -160,6 +153,7 @@ def glass_on_table(robot, glass, pose_tsr_chain, manip=None):
     return  [ place_chain ]
     
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_glass', 'transport')
+@memoized(depends_on_robot=True)
 def glass_transport(robot, glass, manip=None, roll_epsilon=0.2, pitch_epsilon=0.2, yaw_epsilon=0.2):
     '''
     Generates a trajectory-wide constraint for transporting the object with little roll, pitch or yaw
@@ -176,12 +170,8 @@ def glass_transport(robot, glass, manip=None, roll_epsilon=0.2, pitch_epsilon=0.
     '''
    
     if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
         manip = robot.GetActiveManipulator()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     ee_in_glass = numpy.dot(numpy.linalg.inv(glass.GetTransform()), manip.GetEndEffectorTransform())
     Bw = numpy.array([[-100., 100.], # bounds that cover full reachability of manip
@@ -0,0 +1,153 @@
+import importlib, logging, os, threading
+import numpy, prpy.tsr, yaml
+from prpy.tsr.tsrlibrary import TSRFactory, TSRLibrary
+from manipulators import get_manipulator_index
+from memoize import memoized
+
+logger = logging.getLogger('herbpy')
+
+ROBOT_NAME = 'herb'
+
+_config = None
+_loaded = set()
+_failed = set()
+_all_loaded = False
+_lock = threading.RLock()
+
+
+def get_object_type(body):
+    """Get the kind of an object from the name of its KinBody XML file, e.g.
+    "fuze_bottle" for fuze_bottle.kinbody.xml. Falls back on the name of the
+    KinBody if it was not loaded from a file.
+    @param body KinBody
+    @return object kind
+    """
+    filename = os.path.basename(body.GetXMLFilename())
+    if filename:
+        return filename.partition('.')[0]
+    return body.GetName()
+
+
+def get_config(path=None):
+    """Get the TSR library description, reading it on first use.
+    @param path YAML file; defaults to config/tsr_library.yaml
+    @return dictionary with the keys "modules" and "tsrs"
+    """
+    global _config
+
+    with _lock:
+        if _config is None or path is not None:
+            if path is None:
+                from prpy.util import FindCatkinResource
+                path = FindCatkinResource('herbpy', 'config/tsr_library.yaml')
+
+            with open(path, 'rb') as config_file:
+                config = yaml.safe_load(config_file)
+            config.setdefault('modules', dict())
+            config.setdefault('tsrs', dict())
+            _config = config
+        return _config
+
+
+def create_factory(spec):
+    """Create a TSR factory from a declarative description.
+    @param spec dictionary with the keys Tw_e and Bw and, optionally,
+           sample_start, sample_goal and constrain
+    @return TSR factory
+    """
+    Tw_e = numpy.array(spec['Tw_e'], dtype=float)
+    Bw = numpy.array(spec['Bw'], dtype=float)
+    sample_start = spec.get('sample_start', False)
+    sample_goal = spec.get('sample_goal', True)
+    constrain = spec.get('constrain', False)
+
+    if Tw_e.shape != (4, 4) or Bw.shape != (6, 2):
+        raise ValueError('Tw_e must be 4x4 and Bw must be 6x2.')
+
+    def factory(robot, obj, manip=None):
+        manip_idx = get_manipulator_index(robot, manip)
+        tsr = prpy.tsr.TSR(T0_w=obj.GetTransform(), Tw_e=Tw_e, Bw=Bw,
+                           manip=manip_idx)
+        chain = prpy.tsr.TSRChain(sample_start=sample_start,
+                                  sample_goal=sample_goal,
+                                  constrain=constrain, TSR=tsr)
+        return [ chain ]
+
+    return factory
+
+
+def load(kind):
+    """Register the TSR factories for an object kind if this is the first
+    time it is requested. This imports the kind's module in herbpy.tsr, if
+    any, and registers its declarative TSRs. A kind whose module fails to
+    import is logged and treated as unknown.
+    @param kind object kind
+    @return True if the library knows about the kind
+    """
+    if kind in _loaded:
+        return True
+
+    with _lock:
+        if kind in _loaded:
+            return True
+        if kind in _failed:
+            return False
+
+        config = get_config()
+        module_name = config['modules'].get(kind)
+        specs = config['tsrs'].get(kind, dict())
+        if module_name is None and not specs:
+            return False
+
+        if module_name is not None:
+            try:
+                importlib.import_module('herbpy.tsr.' + module_name)
+            except Exception:
+                logger.exception('Failed loading the TSR factories for "%s"'
+                                 ' from herbpy.tsr.%s.', kind, module_name)
+                _failed.add(kind)
+                return False
+
+        for action, spec in specs.iteritems():
+            factory = memoized()(create_factory(spec))
+            factory.__name__ = '{:s}_{:s}'.format(kind, action)
+            TSRFactory(ROBOT_NAME, kind, action)(factory)
+
+        _loaded.add(kind)
+        logger.debug('Loaded TSR factories for "%s".', kind)
+        return True
+
+
+def load_all():
+    """Register the TSR factories for every object kind."""
+    global _all_loaded
+
+    config = get_config()
+    for kind in set(config['modules'].keys()) | set(config['tsrs'].keys()):
+        load(kind)
+    _all_loaded = True
+
+
+class HERBTSRLibrary(TSRLibrary):
+    """TSR library that registers HERB's factories on demand.
+    The factories for an object kind are loaded the first time a TSR is
+    requested for an object of that kind.
+    """
+    def __call__(self, kinbody, action_name, *args, **kw_args):
+        if kinbody is not None:
+            kind = get_object_type(kinbody)
+        else:
+            kind = kw_args.get('kinbody_name')
+
+        if kind is None or not load(kind):
+            load_all()
+
+        try:
+            return TSRLibrary.__call__(self, kinbody, action_name, *args, **kw_args)
+        except KeyError:
+            if _all_loaded:
+                raise
+
+            # prpy may determine the object kind differently.
+            load_all()
+            return TSRLibrary.__call__(self, kinbody, action_name, *args, **kw_args)
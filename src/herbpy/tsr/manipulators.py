@@ -0,0 +1,34 @@
+import threading
+
+_indices = dict()
+_lock = threading.Lock()
+
+
+def get_manipulator_index(robot, manip=None):
+    """Get the index of a manipulator without changing the robot's state.
+    Unlike activating the manipulator and calling GetActiveManipulatorIndex,
+    this does not modify the robot or lock the environment, so it is safe to
+    call concurrently from multiple threads. Indices are looked up in a table
+    of manipulator names that is built once per robot model.
+    @param robot robot that owns the manipulator
+    @param manip manipulator; if None, the active manipulator is used
+    @return index of the manipulator in robot.GetManipulators()
+    """
+    if manip is None:
+        return robot.GetActiveManipulatorIndex()
+
+    key = (robot.GetName(), robot.GetRobotStructureHash())
+    name = manip.GetName()
+
+    indices = _indices.get(key)
+    if indices is None or name not in indices:
+        with _lock:
+            indices = dict((m.GetName(), index) for index, m
+                           in enumerate(robot.GetManipulators()))
+            _indices[key] = indices
+
+    try:
+        return indices[name]
+    except KeyError:
+        raise ValueError('Robot "{:s}" has no manipulator named "{:s}".'.format(
+                         robot.GetName(), name))
@@ -0,0 +1,98 @@
+import collections, copy, functools, threading
+from herbpy.planning.cache import fingerprint
+
+# Maximum number of (object, manipulator, arguments) combinations remembered
+# by each factory.
+MAX_SIZE = 64
+
+_factories = []
+
+
+def memoized(depends_on_robot=False):
+    """Decorator that remembers the TSR chains returned by a TSR factory.
+
+    Results are keyed by the object, the manipulator and the arguments passed
+    to the factory, including the active manipulator if none is specified.
+    Each key remembers the object's transform at the time the chains were
+    built: if the object has moved, the chains are rebuilt and replace the
+    old ones. Factories that also depend on the current state of the robot,
+    e.g. on the pose of the end-effector, must pass \p depends_on_robot=True
+    to include the robot's transform and joint values in the key.
+
+    Every call returns deep copies of the cached chains, so callers may modify
+    them without affecting the cache or each other.
+
+    @param depends_on_robot the result depends on the robot's configuration
+    """
+    def decorator(factory):
+        cache = collections.OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(factory)
+        def wrapper(robot, obj, *args, **kw_args):
+            # Like the factories, this only reads state and does not lock the
+            # environment, so factories can be called from multiple threads.
+            key = fingerprint([
+                obj.GetName(),
+                robot.GetName(),
+                robot.GetActiveManipulatorIndex(),
+                list(args),
+                kw_args,
+            ]).digest()
+            state = fingerprint([
+                obj.GetTransform(),
+                robot.GetTransform() if depends_on_robot else None,
+                robot.GetDOFValues() if depends_on_robot else None,
+            ]).digest()
+
+            with lock:
+                entry = cache.pop(key, None)
+                hit = entry is not None and entry[0] == state
+                if hit:
+                    cache[key] = entry
+                    wrapper.hits += 1
+
+            # The cached chains are never modified, so they can be copied
+            # without holding the lock.
+            if hit:
+                return copy.deepcopy(entry[1])
+
+            chains = factory(robot, obj, *args, **kw_args)
+
+            with lock:
+                wrapper.misses += 1
+                cache[key] = (state, copy.deepcopy(chains))
+                while len(cache) > MAX_SIZE:
+                    cache.popitem(last=False)
+
+            return chains
+
+        def clear():
+            with lock:
+                cache.clear()
+                wrapper.hits = wrapper.misses = 0
+
+        wrapper.hits = 0
+        wrapper.misses = 0
+        wrapper.clear = clear
+        _factories.append(wrapper)
+        return wrapper
+
+    return decorator
+
+
+def clear_cache():
+    """Forget the chains remembered by every memoized TSR factory."""
+    for factory in _factories:
+        factory.clear()
+
+
+def get_statistics():
+    """Get the number of hits and misses of each memoized TSR factory.
+    @return list of dictionaries with the keys "name", "hits" and "misses"
+    """
+    return [ {
+        'name': '{:s}.{:s}'.format(factory.__module__, factory.__name__),
+        'hits': factory.hits,
+        'misses': factory.misses,
+    } for factory in _factories ]
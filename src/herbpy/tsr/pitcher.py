@@ -1,37 +1,10 @@
 import numpy
 import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
-@prpy.tsr.tsrlibrary.TSRFactory('herb', 'rubbermaid_ice_guard_pitcher', 'grasp')
-def pitcher_grasp(robot, pitcher, manip=None):
-    '''
-    @param robot The robot performing the grasp
-    @param pitcher The pitcher to grasp
-    @param manip The manipulator to perform the grasp, if None
-       the active manipulator on the robot is used
-    '''
-    
-    if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
-
-    T0_w = pitcher.GetTransform()
-    Tw_e = numpy.array([[0.802, 0., -0.596, 0.199], 
-                        [-0.5961, 0., -0.8028, 0.2684], 
-                        [0., 1., 0., 0.1841], 
-                        [0., 0., 0., 1.]])
-    Bw = numpy.zeros((6,2))
-    Bw[2,:] = [-0.01, 0.01]  # Allow a little vertical movement
-    
-    grasp_tsr = prpy.tsr.TSR(T0_w = T0_w, Tw_e = Tw_e, Bw = Bw, manip = manip_idx)
-    grasp_chain = prpy.tsr.TSRChain(sample_start=False, sample_goal = True, 
-                                    constrain=False, TSR = grasp_tsr)
-
-    return [grasp_chain]
-        
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'rubbermaid_ice_guard_pitcher', 'pour')
+@memoized(depends_on_robot=True)
 def pitcher_pour(robot, pitcher, min_tilt = 1.4, max_tilt = 1.57, manip=None, grasp_transform = None, 
                  pitcher_pose = None):
     '''
@@ -46,11 +19,7 @@ def pitcher_pour(robot, pitcher, min_tilt = 1.4, max_tilt = 1.57, manip=None, gr
 
     if manip is None:
         manip = robot.GetActiveManipulator()
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     if pitcher_pose is None:
         pitcher_pose = pitcher.GetTransform()
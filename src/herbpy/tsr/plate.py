@@ -1,7 +1,10 @@
 import numpy
 import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_plate', 'lift')
+@memoized(depends_on_robot=True)
 def plate_lift(robot, plate, manip=None, distance=0.1):
     '''
     This creates a TSR for lifting the plate a specified distance. 
@@ -16,11 +19,7 @@ def plate_lift(robot, plate, manip=None, distance=0.1):
 
     if manip is None:
         manip = robot.GetActiveManipulator()
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-         with manip.GetRobot():
-             manip.SetActive()
-             manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     #TSR for the goal
     start_position = manip.GetEndEffectorTransform()
@@ -57,6 +56,7 @@ def plate_lift(robot, plate, manip=None, distance=0.1):
     return [goal_tsr_chain, movement_chain]
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_plate', 'grasp')
+@memoized()
 def plate_grasp(robot, plate, manip=None):
     '''
     @param robot The robot performing the grasp
@@ -64,12 +64,7 @@ def plate_grasp(robot, plate, manip=None):
     @param manip The manipulator to perform the grasp, 
        if None the active manipulator on the robot is used
     '''
-    if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     plate_radius = plate.ComputeAABB().extents()[0]
     T0_w = plate.GetTransform()
@@ -88,6 +83,7 @@ def plate_grasp(robot, plate, manip=None):
     return [grasp_chain]
     
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'plastic_plate', 'place')
+@memoized(depends_on_robot=True)
 def plate_on_table(robot, plate, pose_tsr_chain, manip=None):
     '''
     Generates end-effector poses for placing the plate on the table.
@@ -100,12 +96,8 @@ def plate_on_table(robot, plate, pose_tsr_chain, manip=None):
        manipulator of the robot is used
     '''
     if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
         manip = robot.GetActiveManipulator()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     ee_in_plate = numpy.dot(numpy.linalg.inv(plate.GetTransform()), manip.GetEndEffectorTransform())
     Bw = numpy.zeros((6,2))
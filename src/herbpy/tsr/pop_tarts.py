@@ -1,7 +1,10 @@
 import numpy
 import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'pop_tarts', 'lift')
+@memoized(depends_on_robot=True)
 def poptarts_lift(robot, pop_tarts, manip=None, distance=0.1):
     '''
     This creates a TSR for lifting the pop tarts a specified distance. 
@@ -16,11 +19,7 @@ def poptarts_lift(robot, pop_tarts, manip=None, distance=0.1):
 
     if manip is None:
         manip = robot.GetActiveManipulator()
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-         with manip.GetRobot():
-             manip.SetActive()
-             manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     #TSR for the goal
     start_position = manip.GetEndEffectorTransform()
@@ -58,6 +57,7 @@ def poptarts_lift(robot, pop_tarts, manip=None, distance=0.1):
 
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'pop_tarts', 'grasp')
+@memoized()
 def poptarts_grasp(robot, pop_tarts, manip=None):
     """
     @param robot The robot performing the grasp
@@ -68,6 +68,7 @@ def poptarts_grasp(robot, pop_tarts, manip=None):
     return _poptarts_grasp(robot, pop_tarts, manip = manip)
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'pop_tarts', 'push_grasp')
+@memoized()
 def poptarts_grasp(robot, pop_tarts, push_distance = 0.1, manip=None):
     """
     @param robot The robot performing the grasp
@@ -86,12 +87,7 @@ def _poptarts_grasp(robot, pop_tarts, push_distance = 0.0, manip = None):
     @param manip The manipulator to perform the grasp, if None
        the active manipulator on the robot is used
     """
-    if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
 
     T0_w = pop_tarts.GetTransform()
     ee_to_palm_distance = 0.18
@@ -0,0 +1,144 @@
+import numpy
+
+
+def xyzrpy_to_transforms(xyzrpy):
+    """Convert displacements to homogeneous transforms.
+    Rotations use the same convention as prpy.tsr.TSR, i.e. R = Rz(yaw) *
+    Ry(pitch) * Rx(roll).
+    @param xyzrpy array of shape (N, 6) of x, y, z, roll, pitch and yaw
+    @return array of shape (N, 4, 4)
+    """
+    xyzrpy = numpy.asarray(xyzrpy, dtype=float)
+    cr, cp, cy = [ numpy.cos(xyzrpy[:, i]) for i in (3, 4, 5) ]
+    sr, sp, sy = [ numpy.sin(xyzrpy[:, i]) for i in (3, 4, 5) ]
+
+    transforms = numpy.zeros((len(xyzrpy), 4, 4))
+    transforms[:, 0, 0] = cy * cp
+    transforms[:, 0, 1] = cy * sp * sr - sy * cr
+    transforms[:, 0, 2] = cy * sp * cr + sy * sr
+    transforms[:, 1, 0] = sy * cp
+    transforms[:, 1, 1] = sy * sp * sr + cy * cr
+    transforms[:, 1, 2] = sy * sp * cr - cy * sr
+    transforms[:, 2, 0] = -sp
+    transforms[:, 2, 1] = cp * sr
+    transforms[:, 2, 2] = cp * cr
+    transforms[:, 0:3, 3] = xyzrpy[:, 0:3]
+    transforms[:, 3, 3] = 1.
+    return transforms
+
+
+def sample_displacements(Bw, num_samples, random_state=None):
+    """Sample displacements uniformly from TSR bounds.
+    @param Bw array of shape (6, 2) of lower and upper bounds
+    @param num_samples number of samples
+    @param random_state numpy.random.RandomState; defaults to numpy.random
+    @return array of shape (N, 4, 4) of displacement transforms
+    """
+    if random_state is None:
+        random_state = numpy.random
+
+    Bw = numpy.asarray(Bw, dtype=float)
+    if not numpy.all(numpy.isfinite(Bw)):
+        raise ValueError('Unable to sample from a TSR with infinite bounds.')
+
+    lower, upper = Bw[:, 0], Bw[:, 1]
+    xyzrpy = lower + (upper - lower) * random_state.random_sample((num_samples, 6))
+    return xyzrpy_to_transforms(xyzrpy)
+
+
+def compose(*transforms):
+    """Multiply transforms, each of which is a single (4, 4) matrix or a
+    batch of shape (N, 4, 4).
+    @return array of shape (N, 4, 4), or (4, 4) if no input is a batch
+    """
+    result = numpy.asarray(transforms[0])
+    for transform in transforms[1:]:
+        transform = numpy.asarray(transform)
+        # einsum broadcasts over the batch and does not require numpy.matmul.
+        if result.ndim == 2 and transform.ndim == 2:
+            result = numpy.dot(result, transform)
+        elif result.ndim == 2:
+            result = numpy.einsum('ij,njk->nik', result, transform)
+        elif transform.ndim == 2:
+            result = numpy.einsum('nij,jk->nik', result, transform)
+        else:
+            result = numpy.einsum('nij,njk->nik', result, transform)
+    return result
+
+
+def sample_tsr(tsr, num_samples, random_state=None):
+    """Sample end-effector poses from a TSR.
+    This is equivalent to calling tsr.sample() \p num_samples times.
+    @param tsr prpy.tsr.TSR
+    @param num_samples number of samples
+    @param random_state numpy.random.RandomState; defaults to numpy.random
+    @return array of shape (N, 4, 4) of poses
+    """
+    Tw = sample_displacements(tsr.Bw, num_samples, random_state)
+    return compose(tsr.T0_w, Tw, tsr.Tw_e)
+
+
+def sample_tsr_chain(chain, num_samples, random_state=None):
+    """Sample end-effector poses from a TSR chain.
+    Each TSR in the chain is attached to the end-effector frame of the
+    previous one, i.e. only the T0_w of the first TSR is used.
+    @param chain prpy.tsr.TSRChain
+    @param num_samples number of samples
+    @param random_state numpy.random.RandomState; defaults to numpy.random
+    @return array of shape (N, 4, 4) of poses
+    """
+    if not chain.TSRs:
+        raise ValueError('Unable to sample from an empty TSR chain.')
+
+    poses = numpy.asarray(chain.TSRs[0].T0_w, dtype=float)
+    for tsr in chain.TSRs:
+        Tw = sample_displacements(tsr.Bw, num_samples, random_state)
+        poses = compose(poses, Tw, tsr.Tw_e)
+    return poses
+
+
+def sample_tsr_chains(chains, num_samples, random_state=None):
+    """Sample end-effector poses from a list of TSR chains.
+    Chains with sample_goal set are sampled; if there are none, all chains
+    are sampled. Each sample is drawn from a chain chosen uniformly at random.
+    @param chains list of prpy.tsr.TSRChain, e.g. returned by a TSR factory
+    @param num_samples number of samples
+    @param random_state numpy.random.RandomState; defaults to numpy.random
+    @return tuple of an array of shape (N, 4, 4) of poses and an array of
+            shape (N,) of the index of the chain each pose was drawn from
+    """
+    if random_state is None:
+        random_state = numpy.random
+
+    indices = [ i for i, chain in enumerate(chains) if chain.sample_goal ]
+    if not indices:
+        indices = range(len(chains))
+    if not indices:
+        raise ValueError('There are no TSR chains to sample from.')
+
+    chain_indices = numpy.array(indices)[
+        random_state.randint(len(indices), size=num_samples)]
+    poses = numpy.empty((num_samples, 4, 4))
+
+    for index in indices:
+        mask = (chain_indices == index)
+        count = numpy.count_nonzero(mask)
+        if count > 0:
+            poses[mask] = sample_tsr_chain(chains[index], count, random_state)
+
+    return poses, chain_indices
+
+
+def sample_poses(robot, obj, action, num_samples, random_state=None, **kw_args):
+    """Sample end-effector poses from the TSRs returned by a factory.
+    @param robot robot whose tsrlibrary is used
+    @param obj object passed to the TSR factory
+    @param action name of the action, e.g. "grasp"
+    @param num_samples number of samples
+    @param random_state numpy.random.RandomState; defaults to numpy.random
+    @param **kw_args additional arguments passed to the TSR factory
+    @return array of shape (N, 4, 4) of poses
+    """
+    chains = robot.tsrlibrary(obj, action, **kw_args)
+    poses, _ = sample_tsr_chains(chains, num_samples, random_state)
+    return poses
@@ -1,8 +1,11 @@
 import numpy
 import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'conference_table', 'point_on')
-def point_on(robot, table, manip=None):
+@memoized()
+def point_on(robot, table, manip=None, padding=0.0):
     '''
     This creates a TSR that allows you to sample poses on the table.
     The samples from this TSR should be used to find points for object placement.
@@ -13,13 +16,10 @@ def point_on(robot, table, manip=None):
     @param pitcher The pitcher to grasp
     @param manip The manipulator to perform the grasp, if None
        the active manipulator on the robot is used
+    @param padding The amount of space around the edge to exclude
+       from the TSR
     '''
-    if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
             
     T0_w = table.GetTransform()
 
@@ -1,7 +1,10 @@
 import numpy, prpy
 import prpy.tsr
+from manipulators import get_manipulator_index
+from memoize import memoized
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'wicker_tray', 'point_on')
+@memoized()
 def point_on(robot, tray, manip=None, padding=0.0, handle_padding=True):
     '''
     This creates a TSR that allows you to sample poses on the tray.
@@ -18,12 +21,7 @@ def point_on(robot, tray, manip=None, padding=0.0, handle_padding=True):
     @param handle_padding If true add extra padding along the edges of the tray that
        have the handles to prevent choosing a pose too near the handle of the tray
     '''
-    if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
             
     T0_w = tray.GetTransform()
 
@@ -51,6 +49,7 @@ def point_on(robot, tray, manip=None, padding=0.0, handle_padding=True):
 
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'wicker_tray', 'handle_grasp')
+@memoized(depends_on_robot=True)
 def handle_grasp(robot, tray, manip=None, handle=None):
     '''
     This creates a TSR for grasping the left handle of the tray
@@ -62,11 +61,8 @@ def handle_grasp(robot, tray, manip=None, handle=None):
       the active manipulator on the robot is used
     '''
     if manip is None:
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+        manip = robot.GetActiveManipulator()
+    manip_idx = get_manipulator_index(robot, manip)
             
     tray_in_world = tray.GetTransform()
 
@@ -113,6 +109,7 @@ def handle_grasp(robot, tray, manip=None, handle=None):
     return chains
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'wicker_tray', 'lift')
+@memoized(depends_on_robot=True)
 def lift(robot, tray, distance=0.1):
     '''
     This creates a TSR for lifting the tray a specified distance with both arms
@@ -124,12 +121,8 @@ def lift(robot, tray, distance=0.1):
     '''
     print 'distance = %0.2f' % distance
 
-    with robot:
-        robot.left_arm.SetActive()
-        left_manip_idx = robot.GetActiveManipulatorIndex()
-
-        robot.right_arm.SetActive()
-        right_manip_idx = robot.GetActiveManipulatorIndex()
+    left_manip_idx = get_manipulator_index(robot, robot.left_arm)
+    right_manip_idx = get_manipulator_index(robot, robot.right_arm)
 
     # First TSR defines a goal for the left arm
     left_in_world = robot.left_arm.GetEndEffectorTransform()
@@ -190,6 +183,7 @@ def lift(robot, tray, distance=0.1):
     return [goal_tsr_chain, movement_chain] 
 
 @prpy.tsr.tsrlibrary.TSRFactory('herb', 'wicker_tray', 'pull')
+@memoized(depends_on_robot=True)
 def pull_tray(robot, tray, manip=None, max_distance=0.0, min_distance=0.0, 
               direction=[1., 0., 0.], angular_tolerance=[0., 0., 0.],  position_tolerance=[0., 0., 0.]):
     """
@@ -208,11 +202,7 @@ def pull_tray(robot, tray, manip=None, max_distance=0.0, min_distance=0.0,
     """
     if manip is None:
         manip = robot.GetActiveManipulator()
-        manip_idx = robot.GetActiveManipulatorIndex()
-    else:
-        with manip.GetRobot():
-            manip.SetActive()
-            manip_idx = manip.GetRobot().GetActiveManipulatorIndex()
+    manip_idx = get_manipulator_index(robot, manip)
             
     # Create a w frame with z-axis pointing in direction of pull
     ee_in_world = manip.GetEndEffectorTransform()
@@ -0,0 +1,58 @@
+import contextlib, hashlib, os, tempfile
+
+
+def get_cache_path(*components):
+    """Get a path in herbpy's on-disk cache.
+    The cache is stored in $HERBPY_CACHE_DIR, if it is set, and otherwise in
+    $ROS_HOME/herbpy (default: ~/.ros/herbpy). Parent directories of the
+    returned path are created if necessary.
+    @param components path components relative to the cache directory
+    @return absolute path
+    """
+    root = os.environ.get('HERBPY_CACHE_DIR')
+    if root is None:
+        ros_home = os.environ.get('ROS_HOME',
+                                  os.path.join(os.path.expanduser('~'), '.ros'))
+        root = os.path.join(ros_home, 'herbpy')
+
+    path = os.path.join(root, *components)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Another process may have created it first.
+            if not os.path.isdir(directory):
+                raise
+    return path
+
+
+def hash_file(path):
+    """Compute the SHA1 digest of a file's contents.
+    @param path path to the file
+    @return hexadecimal digest
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def atomic_write(path):
+    """Write a file so concurrent readers never see a partial result.
+    The context manager yields a binary file object for a temporary file that
+    is renamed to \p path when the block exits without an exception.
+    @param path destination path
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    f = tempfile.NamedTemporaryFile(dir=directory, delete=False,
+                                    prefix='.' + os.path.basename(path))
+    try:
+        with f:
+            yield f
+        os.rename(f.name, path)
+    except:
+        os.remove(f.name)
+        raise
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, unittest
+from herbpy.bimanual import concatenate_paths, get_path_parameters, merge_paths
+
+class MergePathsTest(unittest.TestCase):
+    def test_GetPathParameters_NormalizesArcLength(self):
+        waypoints = numpy.array([ [ 0., 0. ], [ 3., 4. ], [ 3., 9. ] ])
+        numpy.testing.assert_array_almost_equal(
+            get_path_parameters(waypoints), [ 0., 0.5, 1. ])
+
+    def test_GetPathParameters_ZeroLengthPath(self):
+        numpy.testing.assert_array_almost_equal(
+            get_path_parameters(numpy.zeros((3, 1))), [ 0., 0.5, 1. ])
+
+    def test_MergePaths_StartsAndEndsTogether(self):
+        left = ([ 0, 1 ], numpy.array([ [ 0., 0. ], [ 1., 1. ] ]))
+        right = ([ 2 ], numpy.array([ [ 0. ], [ 1. ], [ 4. ] ]))
+        dof_indices, waypoints = merge_paths([ left, right ])
+
+        self.assertEqual(list(dof_indices), [ 0, 1, 2 ])
+        numpy.testing.assert_array_almost_equal(waypoints[0], [ 0., 0., 0. ])
+        numpy.testing.assert_array_almost_equal(waypoints[-1], [ 1., 1., 4. ])
+
+    def test_MergePaths_KeepsEveryWaypoint(self):
+        left = ([ 0 ], numpy.array([ [ 0. ], [ 1. ], [ 2. ] ]))
+        right = ([ 1 ], numpy.array([ [ 0. ], [ 1. ], [ 4. ] ]))
+        dof_indices, waypoints = merge_paths([ left, right ])
+
+        # Waypoints at s = 0, 0.25, 0.5 and 1.
+        numpy.testing.assert_array_almost_equal(waypoints, [
+            [ 0., 0. ], [ 0.5, 1. ], [ 1., 2. ], [ 2., 4. ] ])
+
+class ConcatenatePathsTest(unittest.TestCase):
+    def test_ConcatenatePaths_RunsPathsInOrder(self):
+        left = ([ 0 ], numpy.array([ [ 0. ], [ 1. ] ]))
+        right = ([ 1 ], numpy.array([ [ 5. ], [ 6. ], [ 7. ] ]))
+        dof_indices, waypoints = concatenate_paths(
+            [ left, right ], { 0: 0., 1: 5. })
+
+        self.assertEqual(dof_indices, [ 0, 1 ])
+        numpy.testing.assert_array_almost_equal(waypoints, [
+            [ 0., 5. ], [ 1., 5. ], [ 1., 6. ], [ 1., 7. ] ])
+
+    def test_ConcatenatePaths_HoldsStartValues(self):
+        left = ([ 0, 1 ], numpy.array([ [ 0., 0. ], [ 1., 2. ] ]))
+        right = ([ 2 ], numpy.array([ [ 3. ], [ 4. ] ]))
+        dof_indices, waypoints = concatenate_paths(
+            [ left, right ], { 0: 0., 1: 0., 2: 3. })
+
+        self.assertEqual(dof_indices, [ 0, 1, 2 ])
+        numpy.testing.assert_array_almost_equal(waypoints[0], [ 0., 0., 3. ])
+        numpy.testing.assert_array_almost_equal(waypoints[1], [ 1., 2., 3. ])
+        numpy.testing.assert_array_almost_equal(waypoints[-1], [ 1., 2., 4. ])
+        self.assertEqual(len(waypoints), 3)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_merge_paths', MergePathsTest)
+    rosunit.unitrun(PKG, 'test_concatenate_paths', ConcatenatePathsTest)
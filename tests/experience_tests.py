@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, os, shutil, tempfile, unittest
+from herbpy.planning.experience import ExperienceLibrary, adapt_waypoints
+
+class AdaptWaypointsTest(unittest.TestCase):
+    def test_AdaptWaypoints_MovesEndpoints(self):
+        waypoints = numpy.array([ [ 0., 0. ], [ 1., 0. ], [ 2., 0. ] ])
+        adapted = adapt_waypoints(waypoints, [ 0., 1. ], [ 2., -1. ])
+        self.assertEqual(adapted.shape, waypoints.shape)
+        numpy.testing.assert_array_almost_equal(adapted[0], [ 0., 1. ])
+        numpy.testing.assert_array_almost_equal(adapted[-1], [ 2., -1. ])
+
+    def test_AdaptWaypoints_BlendsByDistance(self):
+        waypoints = numpy.array([ [ 0. ], [ 1. ], [ 4. ] ])
+        adapted = adapt_waypoints(waypoints, [ 1. ], [ 4. ])
+        # The start offset of 1 fades out over a quarter of the path.
+        numpy.testing.assert_array_almost_equal(adapted, [ [ 1. ], [ 1.75 ], [ 4. ] ])
+
+    def test_AdaptWaypoints_ZeroLengthPath(self):
+        waypoints = numpy.zeros((3, 2))
+        adapted = adapt_waypoints(waypoints, [ 0., 0. ], [ 2., 2. ])
+        numpy.testing.assert_array_almost_equal(
+            adapted, [ [ 0., 0. ], [ 1., 1. ], [ 2., 2. ] ])
+
+class ExperienceLibraryTest(unittest.TestCase):
+    def setUp(self):
+        self._library = ExperienceLibrary(max_size=3)
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _CreatePath(self, start, goal):
+        return numpy.array([ start, 0.5*(numpy.array(start) + goal), goal ])
+
+    def test_Query_EmptyReturnsNothing(self):
+        self.assertEqual(self._library.query([ 0, 1 ], [ 0., 0. ], [ 1., 1. ]), [])
+
+    def test_Query_ReturnsNearestFirst(self):
+        near = self._CreatePath([ 0., 0. ], [ 1., 1. ])
+        far = self._CreatePath([ 5., 5. ], [ 6., 6. ])
+        self._library.add([ 0, 1 ], far)
+        self._library.add([ 0, 1 ], near)
+
+        results = self._library.query([ 0, 1 ], [ 0.1, 0. ], [ 1., 0.9 ], k=2)
+        self.assertEqual(len(results), 2)
+        numpy.testing.assert_array_equal(results[0], near)
+        numpy.testing.assert_array_equal(results[1], far)
+
+    def test_Query_SeparatesDOFs(self):
+        self._library.add([ 0, 1 ], self._CreatePath([ 0., 0. ], [ 1., 1. ]))
+        self.assertEqual(self._library.query([ 2, 3 ], [ 0., 0. ], [ 1., 1. ]), [])
+
+    def test_Add_IgnoresSingleWaypoint(self):
+        self._library.add([ 0, 1 ], [ [ 0., 0. ] ])
+        self.assertEqual(len(self._library), 0)
+
+    def test_Add_EvictsLeastRecentlyUsed(self):
+        paths = [ self._CreatePath([ float(i), 0. ], [ float(i), 1. ])
+                  for i in xrange(4) ]
+        for path in paths[:3]:
+            self._library.add([ 0, 1 ], path)
+
+        # Using the oldest path makes the second one the least recently used.
+        self._library.query([ 0, 1 ], [ 0., 0. ], [ 0., 1. ])
+        self._library.add([ 0, 1 ], paths[3])
+
+        self.assertEqual(len(self._library), 3)
+        self.assertEqual(self._library.evictions, 1)
+        results = self._library.query([ 0, 1 ], [ 1., 0. ], [ 1., 1. ], k=3)
+        for result in results:
+            self.assertFalse(numpy.array_equal(result, paths[1]))
+
+    def test_Save_LoadRestoresPaths(self):
+        path = self._CreatePath([ 0., 0. ], [ 1., 1. ])
+        self._library.add([ 0, 1 ], path)
+        filename = os.path.join(self._directory, 'experience.pkl')
+        self._library.save(filename)
+
+        library = ExperienceLibrary(path=filename)
+        self.assertEqual(len(library), 1)
+        results = library.query([ 0, 1 ], [ 0., 0. ], [ 1., 1. ])
+        numpy.testing.assert_array_equal(results[0], path)
+
+    def test_Load_IgnoresMissingFile(self):
+        library = ExperienceLibrary(path=os.path.join(self._directory, 'missing.pkl'))
+        self.assertEqual(len(library), 0)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_adapt_waypoints', AdaptWaypointsTest)
+    rosunit.unitrun(PKG, 'test_experience_library', ExperienceLibraryTest)
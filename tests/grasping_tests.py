@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, unittest
+from herbpy.action.grasping import find_contact
+
+class FakeObject(object):
+    def __init__(self, x):
+        self.pose = numpy.eye(4)
+        self.pose[0, 3] = x
+
+    def GetTransform(self):
+        return self.pose.copy()
+
+    def SetTransform(self, pose):
+        self.pose = numpy.array(pose)
+
+class FakeEnvironment(object):
+    """The object collides with the robot while its x coordinate is inside
+    [lower, upper]."""
+    def __init__(self, lower, upper):
+        self.lower = lower
+        self.upper = upper
+
+    def CheckCollision(self, robot, obj):
+        return self.lower <= obj.pose[0, 3] <= self.upper
+
+class FindContactTest(unittest.TestCase):
+    def setUp(self):
+        # The object is pushed along +x, so find_contact moves it along -x.
+        self._direction = [ 2., 0., 0. ]
+        self._tolerance = 0.001
+
+    def _FindContact(self, env, obj, max_distance=0.2, step=0.01):
+        distance, num_checks = find_contact(
+            env, None, obj, self._direction, max_distance, step=step,
+            tolerance=self._tolerance)
+        self.assertGreater(num_checks, 0)
+        return distance
+
+    def test_FindContact_StartsFree(self):
+        env = FakeEnvironment(-1., 0.)
+        obj = FakeObject(0.1234)
+        distance = self._FindContact(env, obj)
+        self.assertLessEqual(distance, 0.1234)
+        self.assertGreater(distance, 0.1234 - self._tolerance)
+        self.assertAlmostEqual(obj.pose[0, 3], 0.1234 - distance)
+        self.assertFalse(env.CheckCollision(None, obj))
+
+    def test_FindContact_StartsInCollision(self):
+        env = FakeEnvironment(-1., 0.)
+        obj = FakeObject(-0.0567)
+        distance = self._FindContact(env, obj)
+        self.assertLess(distance, -0.0567)
+        self.assertGreater(distance, -0.0567 - self._tolerance)
+        self.assertAlmostEqual(obj.pose[0, 3], -0.0567 - distance)
+        self.assertFalse(env.CheckCollision(None, obj))
+
+    def test_FindContact_ThinObstacle(self):
+        # The step is smaller than the obstacle, so it cannot be skipped.
+        env = FakeEnvironment(0.05, 0.06)
+        obj = FakeObject(0.1)
+        distance = self._FindContact(env, obj, step=0.008)
+        self.assertLessEqual(distance, 0.04)
+        self.assertGreater(distance, 0.04 - self._tolerance)
+        self.assertFalse(env.CheckCollision(None, obj))
+
+    def test_FindContact_NeverCollides(self):
+        env = FakeEnvironment(-1., -0.5)
+        obj = FakeObject(0.)
+        distance = self._FindContact(env, obj, max_distance=0.2)
+        self.assertAlmostEqual(distance, 0.2)
+        self.assertAlmostEqual(obj.pose[0, 3], -0.2)
+
+    def test_FindContact_NeverFree(self):
+        env = FakeEnvironment(-1., 1.)
+        obj = FakeObject(0.)
+        distance = self._FindContact(env, obj, max_distance=0.2)
+        self.assertAlmostEqual(distance, -0.2)
+
+    def test_FindContact_RejectsNonPositiveTolerance(self):
+        env = FakeEnvironment(-1., 0.)
+        obj = FakeObject(0.1)
+        with self.assertRaises(ValueError):
+            find_contact(env, None, obj, self._direction, 0.2, tolerance=0.)
+
+    def test_FindContact_RejectsNonPositiveStep(self):
+        env = FakeEnvironment(-1., 0.)
+        obj = FakeObject(0.1)
+        with self.assertRaises(ValueError):
+            find_contact(env, None, obj, self._direction, 0.2, step=0.)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_find_contact', FindContactTest)
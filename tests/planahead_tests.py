@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import openravepy, unittest
+import herbpy
+from herbpy.planning import PipelinePool
+from prpy.planning.base import BasePlanner, PlanningMethod
+
+env, robot = herbpy.initialize(sim=True)
+
+class RecordingPlanner(BasePlanner):
+    def __init__(self):
+        super(RecordingPlanner, self).__init__()
+        self.calls = 0
+
+    def __str__(self):
+        return 'RecordingPlanner'
+
+    @PlanningMethod
+    def PlanToConfiguration(self, robot, goal, **kw_args):
+        self.calls += 1
+        traj = openravepy.RaveCreateTrajectory(robot.GetEnv(), '')
+        traj.Init(robot.GetActiveConfigurationSpecification())
+        traj.Insert(0, robot.GetActiveDOFValues())
+        traj.Insert(1, goal)
+        return traj
+
+class PlanningFutureTest(unittest.TestCase):
+    def setUp(self):
+        self._planner = robot.planner
+        self._planner_pool = robot.planner_pool
+
+    def tearDown(self):
+        robot.planner = self._planner
+        robot.planner_pool = self._planner_pool
+
+    def test_PlanAhead_UsesPooledPipeline(self):
+        default_planner = RecordingPlanner()
+        pooled_planner = RecordingPlanner()
+        robot.planner = default_planner
+        robot.planner_pool = PipelinePool(lambda: pooled_planner, max_size=1)
+
+        with env:
+            goal = robot.right_arm.GetDOFValues()
+        future = robot.PlanAhead([], 'PlanToConfiguration', args=(goal,),
+                                 manip=robot.right_arm)
+        future.result(replan=False)
+
+        self.assertEqual(pooled_planner.calls, 1)
+        self.assertEqual(default_planner.calls, 0)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_planning_future', PlanningFutureTest)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import openravepy, time, unittest
+import herbpy
+from herbpy.planning import Portfolio
+from prpy.clone import Clone, Cloned
+from prpy.planning.base import BasePlanner, PlanningMethod
+
+env, robot = herbpy.initialize(sim=True)
+
+class StraightLinePlanner(BasePlanner):
+    def __str__(self):
+        return 'StraightLinePlanner'
+
+    @PlanningMethod
+    def PlanToConfiguration(self, robot, goal, **kw_args):
+        traj = openravepy.RaveCreateTrajectory(robot.GetEnv(), '')
+        traj.Init(robot.GetActiveConfigurationSpecification())
+        traj.Insert(0, robot.GetActiveDOFValues())
+        traj.Insert(1, goal)
+        return traj
+
+class PortfolioTest(unittest.TestCase):
+    def test_Portfolio_InsideLockedClone_PlansSequentially(self):
+        portfolio = Portfolio(StraightLinePlanner(), StraightLinePlanner(),
+                              timeout=5.)
+
+        with Clone(env) as cloned_env:
+            cloned_robot = Cloned(robot, into=cloned_env)
+            cloned_robot.SetActiveDOFs(cloned_robot.right_arm.GetArmIndices())
+            goal = cloned_robot.GetActiveDOFValues()
+
+            start_time = time.time()
+            traj = portfolio.PlanToConfiguration(cloned_robot, goal)
+
+        self.assertLess(time.time() - start_time, portfolio.timeout)
+        self.assertEqual(traj.GetNumWaypoints(), 2)
+
+    def test_Portfolio_UnlockedClone_PlansConcurrently(self):
+        portfolio = Portfolio(StraightLinePlanner(), StraightLinePlanner(),
+                              timeout=5.)
+
+        with Clone(env, lock=False) as cloned_env:
+            with cloned_env:
+                cloned_robot = Cloned(robot, into=cloned_env)
+                cloned_robot.SetActiveDOFs(cloned_robot.right_arm.GetArmIndices())
+                goal = cloned_robot.GetActiveDOFValues()
+
+            traj = portfolio.PlanToConfiguration(cloned_robot, goal)
+
+        self.assertEqual(traj.GetNumWaypoints(), 2)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_portfolio', PortfolioTest)
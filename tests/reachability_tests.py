@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, prpy.tsr, unittest
+import herbpy
+from herbpy.inversereachability import InverseReachabilityDatabase
+from herbpy.reachability import ReachabilityFilter
+
+env, robot = herbpy.initialize(sim=True)
+
+class ReachabilityFilterTest(unittest.TestCase):
+    def setUp(self):
+        self._env, self._robot = env, robot
+        self._filter = ReachabilityFilter(num_configurations=20000, path=False)
+        self._manip_idx = robot.GetManipulators().index(robot.right_arm)
+
+    def _CreateChain(self, offset, Bw=None):
+        with env:
+            T0_w = robot.right_arm.GetEndEffectorTransform()
+        T0_w[0:3, 3] += offset
+        if Bw is None:
+            Bw = numpy.zeros((6, 2))
+        tsr = prpy.tsr.TSR(T0_w=T0_w, Tw_e=numpy.eye(4), Bw=Bw,
+                           manip=self._manip_idx)
+        return prpy.tsr.TSRChain(sample_goal=True, TSR=tsr)
+
+    def test_Filter_KeepsCurrentPose(self):
+        chain = self._CreateChain([ 0., 0., 0. ])
+        self.assertEqual(self._filter.filter(robot, [ chain ]), [ chain ])
+
+    def test_Filter_PrunesDistantChain(self):
+        near = self._CreateChain([ 0., 0., 0. ])
+        far = self._CreateChain([ 10., 0., 0. ])
+        self.assertEqual(self._filter.filter(robot, [ far, near ]), [ near ])
+        statistics = self._filter.get_statistics()
+        self.assertEqual(statistics['chains_pruned'], 1)
+        self.assertEqual(statistics['planner_calls_saved'], 1)
+
+    def test_Filter_WithoutPruning_DeprioritizesDistantChain(self):
+        reachability_filter = ReachabilityFilter(prune=False,
+            num_configurations=20000, path=False)
+        near = self._CreateChain([ 0., 0., 0. ])
+        far = self._CreateChain([ 10., 0., 0. ])
+        self.assertEqual(reachability_filter.filter(robot, [ far, near ]),
+                         [ near, far ])
+        self.assertEqual(reachability_filter.get_statistics()['chains_deprioritized'], 1)
+
+    def test_Filter_NarrowsBounds(self):
+        Bw = numpy.zeros((6, 2))
+        Bw[0, :] = [ -5., 5. ]
+        chain = self._CreateChain([ 0., 0., 0. ], Bw)
+        filtered = self._filter.filter(robot, [ chain ])
+        self.assertEqual(len(filtered), 1)
+        narrowed = filtered[0].TSRs[0].Bw
+        self.assertGreater(narrowed[0, 0], -5.)
+        self.assertLess(narrowed[0, 1], 5.)
+
+    def test_Filter_AllUnreachable_KeepsChains(self):
+        far = self._CreateChain([ 10., 0., 0. ])
+        self.assertEqual(self._filter.filter(robot, [ far ]), [ far ])
+        self.assertEqual(self._filter.get_statistics()['planner_calls_saved'], 0)
+
+class InverseReachabilityTest(unittest.TestCase):
+    def test_Query_ContainsCurrentBasePose(self):
+        manip = robot.right_arm
+        database = InverseReachabilityDatabase.build(manip, num_configurations=20000)
+
+        with env:
+            robot_pose = robot.GetTransform()
+            ee_pose = manip.GetEndEffectorTransform()
+        base_poses, scores = database.query([ ee_pose ], robot_height=robot_pose[2, 3],
+                                            height_tolerance=0.05, angle_tolerance=0.3)
+        self.assertGreater(len(base_poses), 0)
+
+        robot_yaw = numpy.arctan2(robot_pose[1, 0], robot_pose[0, 0])
+        position_errors = numpy.linalg.norm(base_poses[:, 0:2] - robot_pose[0:2, 3], axis=1)
+        yaw_errors = numpy.abs(numpy.angle(numpy.exp(1j * (base_poses[:, 2] - robot_yaw))))
+        self.assertTrue(numpy.any((position_errors < 0.15) & (yaw_errors < 0.5)))
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_reachability', ReachabilityFilterTest)
+    rosunit.unitrun(PKG, 'test_inverse_reachability', InverseReachabilityTest)
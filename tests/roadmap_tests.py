@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, openravepy, unittest
+import herbpy
+from herbpy.planning import NamedConfigurationRoadmap, RoadmapPlanner
+from herbpy.planning.trajectories import create_path, get_waypoints
+from prpy.planning.base import BasePlanner, PlanningMethod
+from prpy.util import FindCatkinResource
+
+env, robot = herbpy.initialize(sim=True)
+
+class StraightLineNamedPlanner(BasePlanner):
+    def __init__(self):
+        super(StraightLineNamedPlanner, self).__init__()
+        self.calls = 0
+
+    def __str__(self):
+        return 'StraightLineNamedPlanner'
+
+    @PlanningMethod
+    def PlanToNamedConfiguration(self, robot, name, **kw_args):
+        self.calls += 1
+        indices, goal = robot.configurations.get_configuration(name)
+        return create_path(robot, [ robot.GetDOFValues(indices), goal ], indices)
+
+class RoadmapPlannerTest(unittest.TestCase):
+    def setUp(self):
+        configurations_path = FindCatkinResource('herbpy', 'config/configurations.yaml')
+        self._roadmap = NamedConfigurationRoadmap(configurations_path, path=False)
+        self._delegate = StraightLineNamedPlanner()
+        self._planner = RoadmapPlanner(self._delegate, self._roadmap)
+        self._saver = robot.CreateRobotStateSaver()
+
+    def tearDown(self):
+        del self._saver
+
+    def _SetConfiguration(self, name):
+        indices, values = robot.configurations.get_configuration(name)
+        with env:
+            robot.SetDOFValues(values, indices)
+        return indices, values
+
+    def test_PlanToNamedConfiguration_ReusesStoredPath(self):
+        self._SetConfiguration('home')
+        self._planner.PlanToNamedConfiguration(robot, 'relaxed_home')
+        self._planner.PlanToNamedConfiguration(robot, 'relaxed_home')
+
+        self.assertEqual(self._delegate.calls, 1)
+        statistics = self._roadmap.get_statistics()
+        self.assertEqual(statistics['misses'], 1)
+        self.assertEqual(statistics['hits'], 1)
+
+    def test_PlanToNamedConfiguration_ReversesStoredPath(self):
+        self._SetConfiguration('home')
+        self._planner.PlanToNamedConfiguration(robot, 'relaxed_home')
+
+        indices, _ = self._SetConfiguration('relaxed_home')
+        _, home_values = robot.configurations.get_configuration('home')
+        traj = self._planner.PlanToNamedConfiguration(robot, 'home')
+
+        self.assertEqual(self._delegate.calls, 1)
+        self.assertEqual(self._roadmap.get_statistics()['hits'], 1)
+        with env:
+            waypoints = get_waypoints(traj, robot, indices)
+        numpy.testing.assert_array_almost_equal(waypoints[-1], home_values)
+
+    def test_PlanToNamedConfiguration_ReplansPathInCollision(self):
+        self._SetConfiguration('home')
+        self._planner.PlanToNamedConfiguration(robot, 'relaxed_home')
+
+        with env:
+            position = robot.right_arm.GetEndEffectorTransform()[0:3, 3]
+            obstacle = openravepy.RaveCreateKinBody(env, '')
+            obstacle.SetName('roadmap_obstacle')
+            obstacle.InitFromBoxes(numpy.array([
+                numpy.concatenate((position, [ 0.3, 0.3, 0.3 ])) ]), True)
+            env.Add(obstacle)
+        try:
+            self._planner.PlanToNamedConfiguration(robot, 'relaxed_home')
+        finally:
+            with env:
+                env.Remove(obstacle)
+
+        self.assertEqual(self._delegate.calls, 2)
+        statistics = self._roadmap.get_statistics()
+        self.assertEqual(statistics['replans'], 1)
+        self.assertEqual(statistics['hits'], 0)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_roadmap_planner', RoadmapPlannerTest)
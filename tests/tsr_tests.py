@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import importlib, numpy, openravepy, pkgutil, unittest
+from multiprocessing.pool import ThreadPool
+import herbpy, herbpy.tsr
+from herbpy.tsr import glass, memoize, plate
+from herbpy.tsr.manipulators import get_manipulator_index
+
+env, robot = herbpy.initialize(sim=True)
+
+class TSRFactoryTest(unittest.TestCase):
+    def setUp(self):
+        self._env, self._robot = env, robot
+        self._bodies = []
+
+        with env:
+            for i in xrange(50):
+                body = openravepy.RaveCreateKinBody(env, '')
+                body.SetName('tsr_test_body{:d}'.format(i))
+                body.InitFromBoxes(numpy.array([[ 0., 0., 0., 0.04, 0.04, 0.08 ]]), True)
+                pose = numpy.eye(4)
+                pose[0:3, 3] = [ 1. + 0.01 * i, 0., 0.8 ]
+                body.SetTransform(pose)
+                env.Add(body)
+                self._bodies.append(body)
+
+            robot.SetActiveManipulator(robot.right_arm)
+
+        memoize.clear_cache()
+
+    def tearDown(self):
+        with env:
+            for body in self._bodies:
+                env.Remove(body)
+
+    def test_Modules_AllImport(self):
+        for _, name, _ in pkgutil.iter_modules(herbpy.tsr.__path__):
+            importlib.import_module('herbpy.tsr.' + name)
+
+    def test_GetManipulatorIndex_MatchesGetManipulators(self):
+        manipulators = self._robot.GetManipulators()
+        for index, manip in enumerate(manipulators):
+            self.assertEqual(get_manipulator_index(self._robot, manip), index)
+
+    def test_GetManipulatorIndex_DefaultsToActiveManipulator(self):
+        self.assertEqual(get_manipulator_index(self._robot),
+                         self._robot.GetActiveManipulatorIndex())
+
+    def test_Factory_DoesNotChangeActiveManipulator(self):
+        active_index = self._robot.GetActiveManipulatorIndex()
+        left_index = get_manipulator_index(self._robot, self._robot.left_arm)
+
+        chains = glass.glass_grasp(self._robot, self._bodies[0],
+                                   manip=self._robot.left_arm)
+
+        self.assertEqual(self._robot.GetActiveManipulatorIndex(), active_index)
+        self.assertEqual(chains[0].TSRs[0].manipindex, left_index)
+
+    def test_Factory_ConcurrentCallsAreConsistent(self):
+        robot = self._robot
+        manipulators = [ robot.left_arm, robot.right_arm ]
+        active_index = robot.GetActiveManipulatorIndex()
+        jobs = [ (body, manip, factory) for body in self._bodies
+                                        for manip in manipulators
+                                        for factory in [ glass.glass_grasp,
+                                                         plate.plate_grasp ] ] * 4
+
+        def make_tsrs(job):
+            body, manip, factory = job
+            chains = factory(robot, body, manip=manip)
+            return ([ tsr.manipindex for chain in chains for tsr in chain.TSRs ],
+                    get_manipulator_index(robot, manip),
+                    [ tsr.T0_w for chain in chains for tsr in chain.TSRs ],
+                    body.GetTransform())
+
+        pool = ThreadPool(8)
+        try:
+            results = pool.map(make_tsrs, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(len(results), len(jobs))
+        for manip_indices, expected_index, T0_ws, body_pose in results:
+            self.assertTrue(all(index == expected_index for index in manip_indices))
+            for T0_w in T0_ws:
+                numpy.testing.assert_array_almost_equal(T0_w[0:3, 3], body_pose[0:3, 3])
+        self.assertEqual(robot.GetActiveManipulatorIndex(), active_index)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_tsr', TSRFactoryTest)